@@ -0,0 +1,412 @@
+"""
+Motores de base de datos para repos.py.
+
+Los repos escriben su SQL una sola vez, con marcadores para lo que cambia
+entre dialectos ({ahora}, {top}/{limite}, {dia_fecha}, {output_id}/
+{returning_id}, {bloqueo_actualizacion}, {lineas}, {ids_json},
+{sumar_venta_diaria}, {id_autonumerico}, {reservado_por_otros},
+{vence_en}), y el motor
+elegido en config.BACKEND los completa. Cada texto se arma una sola vez y
+no depende de los datos (las listas viajan como un parámetro JSON), así el
+plan cacheado en el servidor se reutiliza en cada llamada.
+
+- SqlServerBackend: SQL Server vía pyodbc y el pool de config (producción).
+- SqliteBackend: un archivo SQLite con el mismo esquema, creado si falta.
+  Sirve para desarrollo, pruebas de carga, benchmarks y CI sin servidor.
+
+El esquema (tablas e índices) está en migraciones.py.
+"""
+import datetime
+import json
+import sqlite3
+import threading
+from decimal import Decimal
+from typing import Any, Dict, List, Sequence, Tuple
+
+from config import BACKEND, SQLITE_PATH, ConnectionPool, PooledConnection, get_connection as _conexion_sql_server
+
+
+def _reservado_por_otros(ahora: str) -> str:
+    # Unidades de p.id retenidas por reservas vigentes de otros carritos (carrito <> ?)
+    return f"""COALESCE((SELECT SUM(r.cantidad) FROM reservas_stock r
+                         WHERE r.producto_id = p.id AND r.carrito <> ? AND r.vence > {ahora}), 0)"""
+
+
+class Backend:
+    """Conexiones y diferencias de dialecto de un motor."""
+
+    nombre = ""
+    remoto = True  # False si la base es local (el espejo sin conexión no aporta nada)
+    dialecto: Dict[str, str] = {}
+
+    def __init__(self):
+        self._sentencias: Dict[str, str] = {}  # plantilla -> texto final
+
+    def conectar(self):
+        """Conexión estilo DB-API: close() la libera y 'with' hace commit/rollback"""
+        raise NotImplementedError
+
+    def sql(self, consulta: str) -> str:
+        """Completa los marcadores de dialecto de 'consulta' (memorizado por plantilla)"""
+        texto = self._sentencias.get(consulta)
+        if texto is None:
+            texto = self._sentencias[consulta] = consulta.format(**self.dialecto)
+        return texto
+
+    def con_limite(self, limit: int, *params) -> tuple:
+        """Parámetros de una consulta con {top}/{limite}: el límite va donde lo usa el dialecto"""
+        return params + (limit,)
+
+    @staticmethod
+    def lista_json(valores) -> str:
+        """Parámetro para {ids_json}: la lista entera como un solo valor"""
+        return json.dumps([int(v) for v in valores])
+
+    def iniciar_escritura(self, conn):
+        """Toma de entrada el bloqueo de escritura si el motor lo necesita"""
+
+    def crear_tabla_si_falta(self, cur, tabla: str, columnas: str):
+        raise NotImplementedError
+
+    def existe_tabla(self, cur, tabla: str) -> bool:
+        raise NotImplementedError
+
+    def crear_indice_si_falta(self, cur, nombre: str, tabla: str, columnas, incluir=()):
+        """Índice sobre 'columnas' que además cubre 'incluir' (INCLUDE donde exista)"""
+        raise NotImplementedError
+
+    def cargar_lineas_venta(self, cur, filas: Sequence[Tuple[int, int, Any]]):
+        """Crea la tabla temporal {lineas} (producto_id, cantidad, precio_unitario) con 'filas'"""
+        raise NotImplementedError
+
+    def ejecutar_lote(self, cur, sentencias: List[Tuple[str, tuple]]):
+        """Ejecuta varias sentencias sin devolver filas, en el menor número de viajes posible"""
+        for consulta, params in sentencias:
+            cur.execute(self.sql(consulta), params)
+
+    def stock_faltante(self, cur, carrito: str) -> List[Tuple[int, str, int, int]]:
+        """
+        Productos de {lineas} cuyo disponible (stock menos lo reservado por
+        otros carritos) no alcanza: [(producto_id, nombre, cantidad, disponible)].
+        Bloquea esas filas de productos hasta el fin de la transacción.
+        """
+        cur.execute(self.sql("""
+            SELECT l.producto_id, p.nombre, l.cantidad, COALESCE(p.stock - {reservado_por_otros}, 0)
+            FROM (
+                SELECT producto_id, SUM(cantidad) AS cantidad
+                FROM {lineas} GROUP BY producto_id
+            ) l
+            LEFT JOIN productos p {bloqueo_actualizacion} ON p.id = l.producto_id
+            WHERE p.id IS NULL OR p.stock - {reservado_por_otros} < l.cantidad
+        """), (carrito, carrito))
+        return [tuple(fila) for fila in cur.fetchall()]
+
+    def descontar_stock(self, cur, carrito: str, controlar: bool) -> List[Tuple[int, str, int, int]]:
+        """
+        Descuenta de productos las líneas de {lineas} y anota en
+        movimientos_stock el stock de antes y de después de cada producto,
+        tomado en el mismo cambio. Con 'controlar', un producto se descuenta
+        solo si su disponible alcanza (ver stock_faltante); los que no,
+        se devuelven y quien llama debe deshacer la transacción.
+        """
+        raise NotImplementedError
+
+    def explicar(self, consulta: str, params: tuple = ()) -> List[str]:
+        """Plan de ejecución de 'consulta' (una línea por paso)"""
+        raise NotImplementedError
+
+
+# ----------------- SQL Server -----------------
+class SqlServerBackend(Backend):
+    nombre = "sqlserver"
+    dialecto = {
+        "ahora": "GETDATE()",
+        "top": "TOP (?)",
+        "limite": "",
+        "dia_fecha": "CAST(fecha AS DATE)",
+        "output_id": "OUTPUT INSERTED.id",
+        "returning_id": "",
+        "bloqueo_actualizacion": "WITH (UPDLOCK, HOLDLOCK)",
+        "lineas": "#lineas_venta",
+        "id_autonumerico": "INT IDENTITY(1, 1) PRIMARY KEY",
+        "ids_json": "SELECT CAST(value AS INT) FROM OPENJSON(?)",
+        "reservado_por_otros": _reservado_por_otros("GETDATE()"),
+        "vence_en": "DATEADD(SECOND, ?, GETDATE())",
+        # Suma la venta (id = ?) a su fila de ventas_diarias, creándola si falta
+        "sumar_venta_diaria": """
+            MERGE ventas_diarias WITH (HOLDLOCK) AS d
+            USING (SELECT CAST(fecha AS DATE) AS dia, COALESCE(forma_pago, '') AS forma_pago, total
+                   FROM ventas WHERE id = ?) AS v
+            ON d.dia = v.dia AND d.forma_pago = v.forma_pago
+            WHEN MATCHED THEN UPDATE SET cantidad = d.cantidad + 1, total = d.total + v.total
+            WHEN NOT MATCHED THEN INSERT (dia, forma_pago, cantidad, total)
+                VALUES (v.dia, v.forma_pago, 1, v.total);
+        """,
+    }
+
+    def conectar(self):
+        return _conexion_sql_server()
+
+    def con_limite(self, limit, *params):
+        return (limit,) + params  # TOP (?) va antes que el resto
+
+    def crear_tabla_si_falta(self, cur, tabla, columnas):
+        cur.execute(self.sql(f"IF OBJECT_ID('dbo.{tabla}', 'U') IS NULL CREATE TABLE {tabla} ({columnas})"))
+
+    def existe_tabla(self, cur, tabla):
+        cur.execute("SELECT OBJECT_ID(?, 'U')", (f"dbo.{tabla}",))
+        return cur.fetchone()[0] is not None
+
+    def crear_indice_si_falta(self, cur, nombre, tabla, columnas, incluir=()):
+        incluidas = f" INCLUDE ({', '.join(incluir)})" if incluir else ""
+        cur.execute(f"""
+            IF NOT EXISTS (SELECT 1 FROM sys.indexes
+                           WHERE name = '{nombre}' AND object_id = OBJECT_ID('dbo.{tabla}'))
+            CREATE INDEX {nombre} ON {tabla} ({', '.join(columnas)}){incluidas}
+        """)
+
+    def cargar_lineas_venta(self, cur, filas):
+        cur.execute("""
+            IF OBJECT_ID('tempdb..#lineas_venta') IS NOT NULL DROP TABLE #lineas_venta;
+            CREATE TABLE #lineas_venta (
+                producto_id INT NOT NULL,
+                cantidad INT NOT NULL,
+                precio_unitario DECIMAL(18, 2) NOT NULL
+            )
+        """)
+        # Todas las líneas viajan en un solo envío
+        cur.fast_executemany = True
+        cur.executemany(
+            "INSERT INTO #lineas_venta (producto_id, cantidad, precio_unitario) VALUES (?, ?, ?)",
+            list(filas)
+        )
+
+    def ejecutar_lote(self, cur, sentencias):
+        # Un único batch de T-SQL: un solo viaje al servidor
+        lote = "".join(self.sql(consulta).strip().rstrip(";") + ";\n" for consulta, _ in sentencias)
+        params = tuple(p for _, ps in sentencias for p in ps)
+        cur.execute("SET NOCOUNT ON;\n" + lote, params)
+
+    def descontar_stock(self, cur, carrito, controlar):
+        # Un solo batch. El UPDATE condicional descuenta y controla a la vez;
+        # OUTPUT devuelve los valores de antes (deleted) y de después
+        # (inserted) de cada fila que cambió, sin volver a leer productos.
+        # No puede ir directo a movimientos_stock (OUTPUT INTO no admite
+        # tablas con claves foráneas): pasa por #stock_venta. Las líneas que
+        # no quedaron en #stock_venta son las que no alcanzaron.
+        cur.execute(self.sql("""
+            SET NOCOUNT ON;
+            IF OBJECT_ID('tempdb..#stock_venta') IS NOT NULL DROP TABLE #stock_venta;
+            CREATE TABLE #stock_venta (
+                producto_id INT NOT NULL,
+                cantidad INT NOT NULL,
+                stock_anterior INT NOT NULL,
+                stock_nuevo INT NOT NULL
+            );
+            UPDATE p SET stock = p.stock - l.cantidad, fecha_modificacion = {ahora}
+            OUTPUT inserted.id, l.cantidad, deleted.stock, inserted.stock
+                INTO #stock_venta (producto_id, cantidad, stock_anterior, stock_nuevo)
+            FROM productos p
+            INNER JOIN (
+                SELECT producto_id, SUM(cantidad) AS cantidad
+                FROM {lineas} GROUP BY producto_id
+            ) l ON l.producto_id = p.id
+            WHERE ? = 0 OR p.stock - {reservado_por_otros} >= l.cantidad;
+            INSERT INTO movimientos_stock (producto_id, tipo, cantidad, stock_anterior, stock_nuevo)
+            SELECT producto_id, 'VENTA', cantidad, stock_anterior, stock_nuevo
+            FROM #stock_venta;
+            SELECT l.producto_id, p.nombre, l.cantidad, COALESCE(p.stock - {reservado_por_otros}, 0)
+            FROM (
+                SELECT producto_id, SUM(cantidad) AS cantidad
+                FROM {lineas} GROUP BY producto_id
+            ) l
+            LEFT JOIN productos p ON p.id = l.producto_id
+            WHERE NOT EXISTS (SELECT 1 FROM #stock_venta s WHERE s.producto_id = l.producto_id);
+            DROP TABLE #stock_venta;
+        """), (int(controlar), carrito, carrito))
+        faltantes = [tuple(fila) for fila in cur.fetchall()]
+        while cur.nextset():  # termina el batch (DROP)
+            pass
+        return faltantes
+
+    def explicar(self, consulta, params=()):
+        conn = self.conectar()
+        try:
+            cur = conn.cursor()
+            cur.execute("SET SHOWPLAN_TEXT ON")
+            try:
+                cur.execute(self.sql(consulta), params)
+                plan = []
+                while True:
+                    plan.extend(str(fila[0]).rstrip() for fila in cur.fetchall())
+                    if not cur.nextset():
+                        break
+                return plan
+            finally:
+                cur.execute("SET SHOWPLAN_TEXT OFF")
+        finally:
+            conn.close()
+
+
+# ----------------- SQLite -----------------
+# Tipos de columna -> Python, como los devuelve pyodbc desde SQL Server
+sqlite3.register_adapter(Decimal, str)
+sqlite3.register_adapter(datetime.datetime, lambda d: d.isoformat(" "))
+sqlite3.register_adapter(datetime.date, lambda d: d.isoformat())
+sqlite3.register_converter("DECIMAL", lambda b: Decimal(b.decode()))
+sqlite3.register_converter("DATETIME", lambda b: datetime.datetime.fromisoformat(b.decode()))
+sqlite3.register_converter("DATE", lambda b: datetime.date.fromisoformat(b.decode()[:10]))
+sqlite3.register_converter("BIT", lambda b: b not in (b"0", b""))
+
+
+class _ConexionSqlite:
+    """
+    Conexión sqlite3 con la interfaz que usan los repos sobre pyodbc
+    (acepta 'autocommit', que sqlite3 no tiene en esta versión).
+    """
+
+    def __init__(self, conn: sqlite3.Connection):
+        object.__setattr__(self, "_conn", conn)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        if name == "autocommit":
+            return  # sqlite3 abre la transacción solo antes de la primera escritura
+        setattr(self._conn, name, value)
+
+
+class SqliteBackend(Backend):
+    nombre = "sqlite"
+    remoto = False
+    dialecto = {
+        "ahora": "datetime('now', 'localtime')",
+        "top": "",
+        "limite": "LIMIT ?",
+        "dia_fecha": "date(fecha)",
+        "output_id": "",
+        "returning_id": "RETURNING id",
+        "bloqueo_actualizacion": "",
+        "lineas": "temp.lineas_venta",
+        "id_autonumerico": "INTEGER PRIMARY KEY",
+        "ids_json": "SELECT value FROM json_each(?)",
+        "reservado_por_otros": _reservado_por_otros("datetime('now', 'localtime')"),
+        "vence_en": "datetime('now', 'localtime', ? || ' seconds')",
+        "sumar_venta_diaria": """
+            INSERT INTO ventas_diarias (dia, forma_pago, cantidad, total)
+            SELECT date(fecha), COALESCE(forma_pago, ''), 1, total
+            FROM ventas WHERE id = ?
+            ON CONFLICT (dia, forma_pago) DO UPDATE
+            SET cantidad = cantidad + 1, total = total + excluded.total
+        """,
+    }
+
+    def __init__(self, ruta: str = SQLITE_PATH, migrar_esquema: bool = True):
+        super().__init__()
+        self.ruta = ruta
+        self._pool = ConnectionPool(self._abrir)
+        if migrar_esquema:
+            # Base local: el esquema se crea/actualiza solo (ver migraciones.py)
+            from migraciones import migrar
+            migrar(self)
+
+    def _abrir(self) -> _ConexionSqlite:
+        conn = sqlite3.connect(self.ruta, timeout=10, detect_types=sqlite3.PARSE_DECLTYPES,
+                               check_same_thread=False)
+        conn.execute("PRAGMA foreign_keys = ON")
+        conn.execute("PRAGMA journal_mode = WAL")
+        return _ConexionSqlite(conn)
+
+    def conectar(self):
+        return PooledConnection(self._pool, self._pool.acquire())
+
+    def iniciar_escritura(self, conn):
+        # Equivale al UPDLOCK/HOLDLOCK de SQL Server: un solo escritor desde la lectura
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")
+
+    def crear_tabla_si_falta(self, cur, tabla, columnas):
+        cur.execute(self.sql(f"CREATE TABLE IF NOT EXISTS {tabla} ({columnas})"))
+
+    def existe_tabla(self, cur, tabla):
+        cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (tabla,))
+        return cur.fetchone() is not None
+
+    def crear_indice_si_falta(self, cur, nombre, tabla, columnas, incluir=()):
+        # Sin INCLUDE: las columnas cubiertas van al final de la clave
+        cur.execute(f"CREATE INDEX IF NOT EXISTS {nombre} ON {tabla} ({', '.join(tuple(columnas) + tuple(incluir))})")
+
+    def cargar_lineas_venta(self, cur, filas):
+        cur.execute("DROP TABLE IF EXISTS temp.lineas_venta")
+        cur.execute("""
+            CREATE TEMP TABLE lineas_venta (
+                producto_id INT NOT NULL,
+                cantidad INT NOT NULL,
+                precio_unitario DECIMAL(18, 2) NOT NULL
+            )
+        """)
+        cur.executemany(
+            "INSERT INTO temp.lineas_venta (producto_id, cantidad, precio_unitario) VALUES (?, ?, ?)",
+            list(filas)
+        )
+
+    def descontar_stock(self, cur, carrito, controlar):
+        # RETURNING de SQLite no da los valores de antes. Tampoco hace falta:
+        # desde la primera escritura la transacción tiene el único lock de
+        # escritura de la base, así que el stock leído (y controlado) acá es
+        # el que el UPDATE va a descontar.
+        self.iniciar_escritura(cur.connection)
+        if controlar:
+            faltantes = self.stock_faltante(cur, carrito)
+            if faltantes:
+                return faltantes
+        cur.execute(self.sql("""
+            INSERT INTO movimientos_stock (producto_id, tipo, cantidad, stock_anterior, stock_nuevo)
+            SELECT p.id, 'VENTA', l.cantidad, p.stock, p.stock - l.cantidad
+            FROM productos p
+            INNER JOIN (
+                SELECT producto_id, SUM(cantidad) AS cantidad
+                FROM {lineas} GROUP BY producto_id
+            ) l ON l.producto_id = p.id
+        """))
+        cur.execute(self.sql("""
+            UPDATE productos SET stock = stock - l.cantidad, fecha_modificacion = {ahora}
+            FROM (
+                SELECT producto_id, SUM(cantidad) AS cantidad
+                FROM {lineas} GROUP BY producto_id
+            ) l
+            WHERE l.producto_id = productos.id
+        """))
+        return []
+
+    def explicar(self, consulta, params=()):
+        conn = self.conectar()
+        try:
+            cur = conn.cursor()
+            cur.execute("EXPLAIN QUERY PLAN " + self.sql(consulta), params)
+            return [fila[3] for fila in cur.fetchall()]
+        finally:
+            conn.close()
+
+
+_BACKENDS = {
+    "sqlserver": SqlServerBackend,
+    "sqlite": SqliteBackend,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def get_backend() -> Backend:
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if BACKEND not in _BACKENDS:
+                    raise ValueError(f"BACKEND desconocido: {BACKEND!r} (opciones: {', '.join(_BACKENDS)})")
+                _backend = _BACKENDS[BACKEND]()
+    return _backend
+
+def get_connection():
+    return get_backend().conectar()
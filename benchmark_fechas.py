@@ -0,0 +1,120 @@
+"""
+Compara la consulta de ventas por rango de fechas antes y después de la
+migración de índices (versión 4 de migraciones.py).
+
+Arma una base SQLite temporal con datos sembrados (semilla fija, así los
+números se pueden repetir), mide el filtro viejo por día calculado
+(date(fecha) BETWEEN ...) sin índices, aplica las migraciones y mide el
+filtro [inicio, fin) sobre la columna. Muestra también el plan de cada uno.
+
+Uso:
+    python benchmark_fechas.py [--ventas 200000] [--dias 7] [--repeticiones 20]
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import tempfile
+import time
+
+from backends import SqliteBackend
+from migraciones import migrar
+
+CONSULTA_ANTES = """
+    SELECT id, fecha, total, forma_pago
+    FROM ventas
+    WHERE {dia_fecha} BETWEEN ? AND ?
+    ORDER BY fecha DESC
+"""
+
+CONSULTA_DESPUES = """
+    SELECT id, fecha, total, forma_pago
+    FROM ventas
+    WHERE fecha >= ? AND fecha < ?
+    ORDER BY fecha DESC, id DESC
+"""
+
+FORMAS_PAGO = ["EFECTIVO", "TARJETA", "TRANSFERENCIA"]
+
+
+def _sembrar(backend, ventas: int, inicio: datetime.datetime, semilla: int):
+    rnd = random.Random(semilla)
+    conn = backend.conectar()
+    try:
+        cur = conn.cursor()
+        cur.executemany("INSERT INTO productos (nombre, precio, stock) VALUES (?, ?, ?)",
+                        [(f"Producto {i}", round(rnd.uniform(1, 50), 2), 1000) for i in range(1, 201)])
+        segundos = 365 * 24 * 3600
+        fechas = sorted(inicio + datetime.timedelta(seconds=rnd.randrange(segundos)) for _ in range(ventas))
+        cur.executemany("INSERT INTO ventas (fecha, total, forma_pago) VALUES (?, ?, ?)",
+                        [(f, round(rnd.uniform(1, 200), 2), rnd.choice(FORMAS_PAGO)) for f in fechas])
+        cur.executemany(
+            "INSERT INTO detalle_venta (venta_id, producto_id, cantidad, precio_unitario) VALUES (?, ?, ?, ?)",
+            [(v, rnd.randint(1, 200), rnd.randint(1, 5), round(rnd.uniform(1, 50), 2))
+             for v in range(1, ventas + 1) for _ in range(rnd.randint(1, 3))])
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _medir(backend, consulta: str, params: tuple, repeticiones: int):
+    """(mejor tiempo en ms, filas devueltas)"""
+    sql = backend.sql(consulta)
+    mejor = None
+    filas = 0
+    for _ in range(repeticiones):
+        conn = backend.conectar()
+        try:
+            cur = conn.cursor()
+            t0 = time.perf_counter()
+            cur.execute(sql, params)
+            filas = len(cur.fetchall())
+            transcurrido = (time.perf_counter() - t0) * 1000
+        finally:
+            conn.close()
+        mejor = transcurrido if mejor is None else min(mejor, transcurrido)
+    return mejor, filas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Consulta por rango de fechas: antes y después de los índices")
+    parser.add_argument("--ventas", type=int, default=200_000, help="ventas a sembrar (un año de datos)")
+    parser.add_argument("--dias", type=int, default=7, help="largo del rango consultado")
+    parser.add_argument("--repeticiones", type=int, default=20)
+    parser.add_argument("--semilla", type=int, default=1234)
+    args = parser.parse_args()
+
+    carpeta = tempfile.mkdtemp(prefix="kiosko_bench_")
+    backend = SqliteBackend(os.path.join(carpeta, "bench.db"), migrar_esquema=False)
+    migrar(backend, hasta=3)    # tablas, sin los índices de la versión 4
+
+    inicio_datos = datetime.datetime(2024, 1, 1)
+    print(f"Sembrando {args.ventas} ventas...")
+    _sembrar(backend, args.ventas, inicio_datos, args.semilla)
+
+    desde = (inicio_datos + datetime.timedelta(days=180)).date()
+    hasta = desde + datetime.timedelta(days=args.dias - 1)
+    params_antes = (desde, hasta)
+    params_despues = (datetime.datetime.combine(desde, datetime.time()),
+                      datetime.datetime.combine(hasta + datetime.timedelta(days=1), datetime.time()))
+
+    antes, filas_antes = _medir(backend, CONSULTA_ANTES, params_antes, args.repeticiones)
+    plan_antes = backend.explicar(CONSULTA_ANTES, params_antes)
+
+    migrar(backend)
+    despues, filas_despues = _medir(backend, CONSULTA_DESPUES, params_despues, args.repeticiones)
+    plan_despues = backend.explicar(CONSULTA_DESPUES, params_despues)
+
+    print(f"Rango {desde} a {hasta} ({args.dias} días), mejor de {args.repeticiones}")
+    print(f"  antes:   {antes:8.2f} ms  {filas_antes} filas  plan: {' | '.join(plan_antes)}")
+    print(f"  después: {despues:8.2f} ms  {filas_despues} filas  plan: {' | '.join(plan_despues)}")
+    if filas_antes != filas_despues:
+        print("❌ Las dos consultas devolvieron distinta cantidad de filas")
+        return 1
+    print(f"✅ {antes / despues:.1f}x más rápida")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,7 @@
-import pyodbc
+import os
+import sys
+import threading
+import time
 
 SERVER = r'localhost\SQLEXPRESS'
 DATABASE = 'KioskoDB'
@@ -6,6 +9,38 @@ TRUSTED = True
 USER = 'sa'
 PASSWORD = 'yourStrong(!)Password'
 
+# --- Motor de base de datos (ver backends.py) ---
+# Se pueden cambiar sin tocar el código con KIOSKO_BACKEND / KIOSKO_SQLITE_PATH (CI, benchmarks)
+BACKEND = os.environ.get("KIOSKO_BACKEND", "sqlserver")     # "sqlserver" o "sqlite" (sin servidor)
+SQLITE_PATH = os.environ.get("KIOSKO_SQLITE_PATH", "kiosko.db")
+
+# --- Pool de conexiones ---
+POOL_SIZE = 5               # conexiones abiertas como máximo
+POOL_TIMEOUT = 10           # segundos esperando una conexión libre
+POOL_IDLE_TIMEOUT = 300     # segundos sin uso antes de cerrar una conexión
+POOL_HEALTHCHECK = True     # validar con SELECT 1 al entregar una conexión
+
+# --- Sincronización incremental de cachés ---
+SYNC_SOLAPAMIENTO = 10      # segundos antes de la marca de agua que se vuelven a pedir (commits tardíos)
+
+# --- Modo sin conexión (espejo local en SQLite) ---
+MODO_OFFLINE = True                         # leer del espejo y encolar ventas si SQL Server no responde
+ESPEJO_LOCAL_PATH = "espejo_local.db"
+OFFLINE_REINTENTO = 15                      # segundos sin volver a intentar conectar tras un fallo
+
+# --- Ventas asíncronas (diario local + envío en segundo plano) ---
+VENTAS_ASINCRONAS = False                   # confirmar al cajero apenas la venta queda en el diario
+DIARIO_VENTAS_PATH = "ventas_pendientes.jsonl"
+DIARIO_REINTENTO_MIN = 1                    # segundos de espera tras el primer fallo
+DIARIO_REINTENTO_MAX = 60                   # tope del backoff exponencial
+DIARIO_RECHAZADAS_PATH = "ventas_rechazadas.jsonl"  # ventas que la BD no acepta, para revisar a mano
+
+# --- Reservas de stock (carrito abierto mientras se cobra) ---
+RESERVA_STOCK_TTL = 300                     # segundos que se retiene el stock si la venta no se cierra
+
+# --- Arranque ---
+PRECARGAR_DEPENDENCIAS = True  # importar pandas/matplotlib/reportlab en segundo plano tras el login
+
 _DRIVERS = [
     '{ODBC Driver 18 for SQL Server}',
     '{ODBC Driver 17 for SQL Server}',
@@ -13,19 +48,215 @@ _DRIVERS = [
     '{SQL Server}'
 ]
 
-def _connect(database: str) -> pyodbc.Connection:
+# Driver que funcionó la primera vez (se prueba primero en las siguientes)
+_driver_ok = None
+# Tras un fallo de conexión no se reintenta hasta este instante (time.monotonic)
+_sin_conexion_hasta = 0.0
+
+
+class SinConexionError(RuntimeError):
+    """SQL Server no está disponible (no se pudo conectar)."""
+
+
+class PoolAgotadoError(RuntimeError):
+    """Todas las conexiones del pool siguieron ocupadas durante POOL_TIMEOUT."""
+
+
+def servidor_no_disponible() -> bool:
+    """True mientras dura la espera tras el último fallo de conexión"""
+    return time.monotonic() < _sin_conexion_hasta
+
+
+def es_error_de_conexion(e: Exception) -> bool:
+    """True si 'e' indica que el servidor no responde (y no un error de datos)"""
+    if isinstance(e, SinConexionError):
+        return True
+    # pyodbc solo está cargado si se usó SQL Server; no importarlo para esto
+    pyodbc = sys.modules.get("pyodbc")
+    estado = e.args[0] if pyodbc and isinstance(e, pyodbc.Error) and e.args else ""
+    # 08xxx: errores de conexión; HYT00/HYT01: tiempo de espera agotado
+    return isinstance(estado, str) and (estado.startswith("08") or estado.startswith("HYT"))
+
+def es_error_de_bloqueo(e: Exception) -> bool:
+    """True si 'e' es un deadlock o un bloqueo vencido: repetir la operación puede funcionar"""
+    pyodbc = sys.modules.get("pyodbc")
+    if pyodbc and isinstance(e, pyodbc.Error):
+        # 40001 / 1205: elegida víctima de un deadlock; 1222: se agotó la espera de un bloqueo
+        texto = str(e)
+        return (e.args and e.args[0] == "40001") or "(1205)" in texto or "(1222)" in texto
+    sqlite3 = sys.modules.get("sqlite3")
+    return bool(sqlite3 and isinstance(e, sqlite3.OperationalError)
+                and ("locked" in str(e) or "busy" in str(e)))
+
+def es_error_de_esquema(e: Exception) -> bool:
+    """True si falta una tabla o columna: la BD no tiene las migraciones de este código"""
+    pyodbc = sys.modules.get("pyodbc")
+    if pyodbc and isinstance(e, pyodbc.Error):
+        # 42S02: tabla inexistente; 42S22: columna inexistente
+        return bool(e.args) and e.args[0] in ("42S02", "42S22")
+    sqlite3 = sys.modules.get("sqlite3")
+    return bool(sqlite3 and isinstance(e, sqlite3.OperationalError)
+                and ("no such table" in str(e) or "no such column" in str(e)))
+
+def _conn_str(drv: str, database: str) -> str:
+    if TRUSTED:
+        return f'DRIVER={drv};SERVER={SERVER};DATABASE={database};Trusted_Connection=yes;Encrypt=no;'
+    return f'DRIVER={drv};SERVER={SERVER};DATABASE={database};UID={USER};PWD={PASSWORD};Encrypt=no;'
+
+def _connect(database: str) -> "pyodbc.Connection":
+    global _driver_ok, _sin_conexion_hasta
+    import pyodbc
+    if time.monotonic() < _sin_conexion_hasta:
+        # Falla rápido en lugar de esperar el timeout de cada driver otra vez
+        raise SinConexionError("SQL Server no disponible (se reintentará en unos segundos)")
     last_error = None
-    for drv in _DRIVERS:
+    drivers = [_driver_ok] + [d for d in _DRIVERS if d != _driver_ok] if _driver_ok else _DRIVERS
+    for drv in drivers:
         try:
-            if TRUSTED:
-                conn_str = f'DRIVER={drv};SERVER={SERVER};DATABASE={database};Trusted_Connection=yes;Encrypt=no;'
-            else:
-                conn_str = f'DRIVER={drv};SERVER={SERVER};DATABASE={database};UID={USER};PWD={PASSWORD};Encrypt=no;'
-            return pyodbc.connect(conn_str, timeout=5)
+            conn = pyodbc.connect(_conn_str(drv, database), timeout=5)
+            _driver_ok = drv
+            return conn
         except Exception as e:
             last_error = e
             continue
-    raise RuntimeError(f"No se pudo conectar a SQL Server. Último error: {last_error}")
+    _sin_conexion_hasta = time.monotonic() + OFFLINE_REINTENTO
+    raise SinConexionError(f"No se pudo conectar a SQL Server. Último error: {last_error}")
+
+
+class ConnectionPool:
+    """Pool thread-safe de conexiones ODBC reutilizables."""
+
+    def __init__(self, factory, size=POOL_SIZE, timeout=POOL_TIMEOUT,
+                 idle_timeout=POOL_IDLE_TIMEOUT, healthcheck=POOL_HEALTHCHECK):
+        self._factory = factory
+        self._timeout = timeout
+        self._idle_timeout = idle_timeout
+        self._healthcheck = healthcheck
+        self._lock = threading.Lock()
+        self._cupos = threading.BoundedSemaphore(size)
+        self._libres = []  # [(conexion, ultimo_uso)]
+
+    def acquire(self) -> "pyodbc.Connection":
+        if not self._cupos.acquire(timeout=self._timeout):
+            raise PoolAgotadoError("No hay conexiones libres en el pool (tiempo de espera agotado)")
+        try:
+            while True:
+                with self._lock:
+                    entrada = self._libres.pop() if self._libres else None
+                if entrada is None:
+                    return self._factory()
+
+                conn, ultimo_uso = entrada
+                if time.monotonic() - ultimo_uso > self._idle_timeout:
+                    self._cerrar(conn)
+                    continue
+                if self._healthcheck and not self._esta_viva(conn):
+                    self._cerrar(conn)
+                    continue
+                return conn
+        except Exception:
+            self._cupos.release()
+            raise
+
+    def release(self, conn: "pyodbc.Connection"):
+        try:
+            # Descartar cualquier transacción que haya quedado abierta
+            conn.rollback()
+            conn.autocommit = False
+        except Exception:
+            self._cerrar(conn)
+            self._cupos.release()
+            return
+
+        ahora = time.monotonic()
+        with self._lock:
+            vigentes = []
+            for libre, ultimo_uso in self._libres:
+                if ahora - ultimo_uso > self._idle_timeout:
+                    self._cerrar(libre)
+                else:
+                    vigentes.append((libre, ultimo_uso))
+            vigentes.append((conn, ahora))
+            self._libres = vigentes
+        self._cupos.release()
+
+    def close_all(self):
+        with self._lock:
+            libres, self._libres = self._libres, []
+        for conn, _ in libres:
+            self._cerrar(conn)
+
+    @staticmethod
+    def _esta_viva(conn) -> bool:
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.fetchone()
+            cur.close()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _cerrar(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+class PooledConnection:
+    """
+    Envoltorio sobre una conexión del pool: close() (o salir del 'with')
+    la devuelve al pool en lugar de cerrarla.
+    """
+
+    def __init__(self, pool: ConnectionPool, conn: "pyodbc.Connection"):
+        object.__setattr__(self, "_pool", pool)
+        object.__setattr__(self, "_conn", conn)
+
+    def __getattr__(self, name):
+        conn = object.__getattribute__(self, "_conn")
+        if conn is None:
+            raise RuntimeError("La conexión ya fue devuelta al pool")
+        return getattr(conn, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._conn, name, value)
+
+    def close(self):
+        conn = object.__getattribute__(self, "_conn")
+        if conn is not None:
+            object.__setattr__(self, "_conn", None)
+            self._pool.release(conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        conn = object.__getattribute__(self, "_conn")
+        if conn is None:
+            return  # ya se devolvió con close(): no hay nada que confirmar
+        try:
+            if exc_type is None:
+                conn.commit()
+            else:
+                conn.rollback()
+        finally:
+            self.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(lambda: _connect(DATABASE))
+    return _pool
 
-def get_connection() -> pyodbc.Connection:
-    return _connect(DATABASE)
+def get_connection() -> PooledConnection:
+    pool = get_pool()
+    return PooledConnection(pool, pool.acquire())
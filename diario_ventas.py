@@ -0,0 +1,286 @@
+"""
+Diario local de ventas (write-ahead) y envío en segundo plano a SQL Server.
+
+Con VENTAS_ASINCRONAS, _finalizar_venta solo agrega la venta al diario (una
+línea JSON con checksum, con fsync) y confirma al cajero. Un hilo la envía
+después a la BD en orden, reintentando con backoff mientras el servidor no
+responda, haya bloqueos, el pool esté agotado o la BD no tenga las
+migraciones de este código (el envío queda en pausa hasta que se migre); la clave de idempotencia evita duplicarla si se
+reenvía tras un corte. Una venta que la BD rechaza por sus datos no se
+reintenta: se copia a DIARIO_RECHAZADAS_PATH para revisarla a mano y no
+traba a las siguientes. Al reiniciar, las ventas sin confirmar del diario se
+vuelven a encolar.
+"""
+import datetime
+import json
+import logging
+import os
+import threading
+import uuid
+import zlib
+from typing import Any, Callable, Dict, List, Optional
+
+from config import (DIARIO_VENTAS_PATH, DIARIO_RECHAZADAS_PATH, DIARIO_REINTENTO_MIN, DIARIO_REINTENTO_MAX,
+                    PoolAgotadoError, es_error_de_bloqueo, es_error_de_conexion, es_error_de_esquema)
+from migraciones import EsquemaDesactualizadoError, verificar_esquema
+from repos import VentaRepo
+
+logger = logging.getLogger("DiarioVentas")
+
+
+def _es_reintentable(e: Exception) -> bool:
+    """
+    Errores que pasan solos (servidor caído, bloqueos, pool ocupado, BD aún
+    sin migrar): la venta espera en el diario. El resto es un error de datos.
+    """
+    return (es_error_de_conexion(e) or es_error_de_bloqueo(e) or isinstance(e, PoolAgotadoError)
+            or es_error_de_esquema(e) or isinstance(e, EsquemaDesactualizadoError))
+
+
+def _serializar(valor):
+    if isinstance(valor, (datetime.datetime, datetime.date)):
+        return valor.isoformat()
+    return str(valor)  # Decimal y demás
+
+
+class VentaRechazadaError(Exception):
+    """La BD rechazó una venta del diario por sus datos; quedó en las rechazadas."""
+
+    def __init__(self, clave: str, causa: Exception):
+        self.clave = clave
+        self.causa = causa
+        super().__init__(f"Venta {clave} rechazada: {causa}")
+
+
+class DiarioVentas:
+    """
+    Archivo JSON-lines de solo agregado. Cada línea es '<crc32> <json>' con un
+    registro {"tipo": "venta"|"confirmada"|"rechazada", "clave": ...}. Una
+    línea con checksum inválido (escritura cortada) se descarta al leer.
+    """
+
+    def __init__(self, ruta: str = DIARIO_VENTAS_PATH, ruta_rechazadas: str = DIARIO_RECHAZADAS_PATH):
+        self.ruta = ruta
+        self.ruta_rechazadas = ruta_rechazadas
+        self._lock = threading.Lock()
+        self._final_revisado = False
+
+    def registrar(self, datos: Dict[str, Any]) -> str:
+        """Agrega una venta y devuelve su clave de idempotencia (ya en disco al volver)"""
+        clave = uuid.uuid4().hex
+        self._agregar({"tipo": "venta", "clave": clave, "datos": datos})
+        return clave
+
+    def confirmar(self, clave: str, venta_id: int):
+        self._agregar({"tipo": "confirmada", "clave": clave, "venta_id": venta_id})
+
+    def rechazar(self, registro: Dict[str, Any], motivo: str):
+        """Aparta una venta que la BD no acepta: se copia entera a las rechazadas y deja de estar pendiente"""
+        linea = self._linea(dict(registro, tipo="rechazada", motivo=motivo, fecha_rechazo=datetime.datetime.now()))
+        with self._lock:
+            with open(self.ruta_rechazadas, "a", encoding="utf-8") as f:
+                f.write(linea)
+                f.flush()
+                os.fsync(f.fileno())
+        self._agregar({"tipo": "rechazada", "clave": registro["clave"], "motivo": motivo})
+
+    def pendientes(self) -> List[Dict[str, Any]]:
+        """Ventas registradas y no confirmadas, en el orden en que se registraron"""
+        with self._lock:
+            return self._pendientes_sin_lock()
+
+    def compactar(self):
+        """Reescribe el diario con solo las ventas pendientes (atómico)"""
+        with self._lock:
+            pendientes = self._pendientes_sin_lock()
+            temporal = self.ruta + ".tmp"
+            with open(temporal, "w", encoding="utf-8") as f:
+                for registro in pendientes:
+                    f.write(self._linea(registro))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporal, self.ruta)
+
+    # ----------------- Internos -----------------
+    @staticmethod
+    def _linea(registro: Dict[str, Any]) -> str:
+        texto = json.dumps(registro, ensure_ascii=False, sort_keys=True, default=_serializar)
+        return f"{zlib.crc32(texto.encode('utf-8')):08x} {texto}\n"
+
+    def _agregar(self, registro: Dict[str, Any]):
+        linea = self._linea(registro)
+        with self._lock:
+            if not self._final_revisado:
+                # Si la ejecución anterior se cortó a mitad de una línea, no pegarse a ella
+                if self._termina_cortado():
+                    linea = "\n" + linea
+                self._final_revisado = True
+            with open(self.ruta, "a", encoding="utf-8") as f:
+                f.write(linea)
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _termina_cortado(self) -> bool:
+        try:
+            with open(self.ruta, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                if f.tell() == 0:
+                    return False
+                f.seek(-1, os.SEEK_END)
+                return f.read(1) != b"\n"
+        except FileNotFoundError:
+            return False
+
+    def _leer(self) -> List[Dict[str, Any]]:
+        if not os.path.exists(self.ruta):
+            return []
+        registros = []
+        with open(self.ruta, "r", encoding="utf-8") as f:
+            for numero, linea in enumerate(f, 1):
+                if not linea.strip():
+                    continue
+                crc, _, texto = linea.rstrip("\n").partition(" ")
+                try:
+                    if int(crc, 16) != zlib.crc32(texto.encode("utf-8")):
+                        raise ValueError("checksum inválido")
+                    registros.append(json.loads(texto))
+                except ValueError as e:
+                    logger.warning(f"Diario {self.ruta}: línea {numero} descartada ({e})")
+        return registros
+
+    def _pendientes_sin_lock(self):
+        ventas = {}
+        for registro in self._leer():
+            if registro.get("tipo") == "venta":
+                ventas[registro["clave"]] = registro
+            elif registro.get("tipo") in ("confirmada", "rechazada"):
+                ventas.pop(registro["clave"], None)
+        return list(ventas.values())
+
+
+class EnvioVentas:
+    """Hilo que vacía el diario en SQL Server, en orden y con reintentos."""
+
+    def __init__(self, diario: DiarioVentas):
+        self.diario = diario
+        self._cola: List[Dict[str, Any]] = []
+        self._cond = threading.Condition()
+        self._suscriptores: List[Callable] = []
+        self._hilo: Optional[threading.Thread] = None
+        self._esquema_verificado = False
+
+    def suscribir(self, callback: Callable[[str, Optional[int], Optional[Exception], int], None]):
+        """
+        callback(clave, venta_id, error, pendientes) se llama desde el hilo de
+        envío tras cada intento (venta_id si se guardó, error si falló; un
+        VentaRechazadaError si la BD no la acepta y no se va a reintentar).
+        """
+        self._suscriptores.append(callback)
+
+    def iniciar(self):
+        with self._cond:
+            if self._hilo is not None:
+                return
+            # Recuperación: lo que quedó sin confirmar en la ejecución anterior
+            self._cola.extend(self.diario.pendientes())
+            self._hilo = threading.Thread(target=self._bucle, name="envio-ventas", daemon=True)
+            self._hilo.start()
+        if self._cola:
+            logger.info(f"Diario de ventas: {len(self._cola)} ventas pendientes recuperadas")
+
+    def encolar(self, datos: Dict[str, Any]) -> str:
+        """Registra la venta en el diario (durable) y la deja para enviar"""
+        # Misma forma que tendrá al recuperarla del archivo (fechas/Decimal como texto)
+        datos = json.loads(json.dumps(datos, default=_serializar))
+        clave = self.diario.registrar(datos)
+        with self._cond:
+            self._cola.append({"tipo": "venta", "clave": clave, "datos": datos})
+            self._cond.notify()
+        return clave
+
+    @property
+    def pendientes(self) -> int:
+        with self._cond:
+            return len(self._cola)
+
+    def _bucle(self):
+        espera = DIARIO_REINTENTO_MIN
+        while True:
+            with self._cond:
+                while not self._cola:
+                    self._cond.wait()
+                registro = self._cola[0]
+
+            clave = registro["clave"]
+            try:
+                # Con la BD sin migrar no se envía nada: las ventas esperan en el diario
+                if not self._esquema_verificado:
+                    verificar_esquema()
+                    self._esquema_verificado = True
+                # La venta ya se entregó: se registra aunque el stock no alcance
+                venta_id = VentaRepo.crear_venta(clave_idempotencia=clave, controlar_stock=False,
+                                                 **self._argumentos(registro["datos"]))
+            except Exception as e:
+                if es_error_de_esquema(e):
+                    self._esquema_verificado = False
+                if not _es_reintentable(e):
+                    # Error de datos: reintentarla fallaría igual y trabaría la cola
+                    logger.error(f"Venta {clave} rechazada por la BD, apartada en "
+                                 f"{self.diario.ruta_rechazadas}: {e}")
+                    self.diario.rechazar(registro, f"{type(e).__name__}: {e}")
+                    self._quitar_primera()
+                    self._avisar(clave, None, VentaRechazadaError(clave, e))
+                    espera = DIARIO_REINTENTO_MIN
+                    continue
+                logger.error(f"Venta {clave} no enviada (reintento en {espera}s): {e}")
+                self._avisar(clave, None, e)
+                with self._cond:
+                    self._cond.wait(espera)
+                espera = min(espera * 2, DIARIO_REINTENTO_MAX)
+                continue
+
+            espera = DIARIO_REINTENTO_MIN
+            self.diario.confirmar(clave, venta_id)
+            self._quitar_primera()
+            self._avisar(clave, venta_id, None)
+
+    def _quitar_primera(self):
+        """Saca de la cola la venta ya resuelta; con la cola vacía compacta el diario"""
+        with self._cond:
+            self._cola.pop(0)
+            vacia = not self._cola
+        if vacia:
+            try:
+                self.diario.compactar()
+            except OSError as e:
+                logger.warning(f"No se pudo compactar el diario de ventas: {e}")
+
+    @staticmethod
+    def _argumentos(datos: Dict[str, Any]) -> Dict[str, Any]:
+        argumentos = dict(datos)
+        if isinstance(argumentos.get("fecha"), str):
+            argumentos["fecha"] = datetime.datetime.fromisoformat(argumentos["fecha"])
+        return argumentos
+
+    def _avisar(self, clave, venta_id, error):
+        pendientes = self.pendientes
+        for callback in list(self._suscriptores):
+            try:
+                callback(clave, venta_id, error, pendientes)
+            except Exception as e:
+                logger.error(f"Error en aviso de envío de ventas: {e}")
+
+
+_envio = None
+_envio_lock = threading.Lock()
+
+def get_envio_ventas() -> EnvioVentas:
+    """Envío de ventas compartido (se inicia, y recupera pendientes, la primera vez)"""
+    global _envio
+    if _envio is None:
+        with _envio_lock:
+            if _envio is None:
+                envio = EnvioVentas(DiarioVentas())
+                envio.iniciar()
+                _envio = envio
+    return _envio
@@ -0,0 +1,236 @@
+"""
+Espejo local en SQLite de productos, categorías, puntos de venta y las
+últimas ventas. Los repos lo actualizan cada vez que leen del servidor y
+leen de él cuando SQL Server no responde (ver repos._con_espejo).
+
+La copia se hace en un hilo aparte y solo escribe las filas que cambiaron:
+releer el catálogo sin cambios no toca el archivo.
+"""
+import datetime
+import queue
+import sqlite3
+import threading
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional
+
+from config import ESPEJO_LOCAL_PATH
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS productos (
+    id INTEGER PRIMARY KEY,
+    codigo_barras TEXT,
+    nombre TEXT NOT NULL,
+    precio TEXT NOT NULL,
+    stock INTEGER NOT NULL DEFAULT 0,
+    categoria TEXT NOT NULL DEFAULT '',
+    activo INTEGER NOT NULL DEFAULT 1,
+    categoria_id INTEGER,
+    fecha_modificacion TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_productos_codigo ON productos (codigo_barras);
+CREATE TABLE IF NOT EXISTS categorias (
+    id INTEGER PRIMARY KEY,
+    nombre TEXT NOT NULL,
+    descripcion TEXT
+);
+CREATE TABLE IF NOT EXISTS puntos_venta (
+    id INTEGER PRIMARY KEY,
+    nombre TEXT NOT NULL,
+    direccion TEXT,
+    telefono TEXT
+);
+CREATE TABLE IF NOT EXISTS ventas (
+    id INTEGER PRIMARY KEY,
+    fecha TEXT NOT NULL,
+    total TEXT NOT NULL,
+    forma_pago TEXT
+);
+"""
+
+_COLUMNAS_PRODUCTO = ("id", "codigo_barras", "nombre", "precio", "stock",
+                      "categoria", "activo", "categoria_id", "fecha_modificacion")
+_COLUMNAS_CATEGORIA = ("id", "nombre", "descripcion")
+_COLUMNAS_PUNTO_VENTA = ("id", "nombre", "direccion", "telefono")
+_COLUMNAS_VENTA = ("id", "fecha", "total", "forma_pago")
+
+
+def _a_texto(valor):
+    if isinstance(valor, (datetime.datetime, datetime.date)):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return str(valor)
+    return valor
+
+
+def _a_fecha(valor):
+    return datetime.datetime.fromisoformat(valor) if valor else None
+
+
+class EspejoLocal:
+    """Réplica de lectura en SQLite (una conexión por operación, serializadas)."""
+
+    def __init__(self, ruta: str = ESPEJO_LOCAL_PATH):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self._huellas: Dict[str, Dict[Any, int]] = {}   # tabla -> id -> hash de la fila guardada
+        self._reemplazadas = set()                       # tablas ya copiadas completas en esta ejecución
+        self._tareas: "queue.Queue" = queue.Queue()
+        self._escritor: Optional[threading.Thread] = None
+        with self._conectar() as conn:
+            conn.executescript(_ESQUEMA)
+
+    def _conectar(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.ruta, timeout=10)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _consultar(self, sql: str, params=()) -> List[sqlite3.Row]:
+        with self._lock:
+            conn = self._conectar()
+            try:
+                return conn.execute(sql, params).fetchall()
+            finally:
+                conn.close()
+
+    def _escribir(self, sentencias):
+        """sentencias: [(sql, filas)] ejecutadas en una sola transacción"""
+        with self._lock:
+            conn = self._conectar()
+            try:
+                with conn:
+                    for sql, filas in sentencias:
+                        conn.executemany(sql, filas)
+            finally:
+                conn.close()
+
+    def _sincronizar(self, tabla: str, columnas: tuple, registros: Iterable[Dict[str, Any]], completo: bool):
+        """
+        Deja en 'tabla' los registros recibidos escribiendo solo las filas
+        nuevas o distintas; con 'completo' borra además las que ya no vinieron.
+        """
+        filas = [tuple(map(r.get, columnas)) for r in registros]
+        with self._lock:
+            huellas = self._huellas.setdefault(tabla, {})
+            # La primera copia completa de esta ejecución reemplaza lo que hubiera en el archivo
+            reemplazar = completo and tabla not in self._reemplazadas
+            cambiadas = filas if reemplazar else [f for f in filas if huellas.get(f[0]) != hash(f)]
+            borradas = [] if reemplazar or not completo else list(huellas.keys() - {f[0] for f in filas})
+            if cambiadas or borradas or reemplazar:
+                conn = self._conectar()
+                try:
+                    with conn:
+                        if reemplazar:
+                            conn.execute(f"DELETE FROM {tabla}")
+                        conn.executemany(f"DELETE FROM {tabla} WHERE id = ?", [(i,) for i in borradas])
+                        conn.executemany(f"INSERT OR REPLACE INTO {tabla} ({', '.join(columnas)}) "
+                                         f"VALUES ({', '.join('?' * len(columnas))})",
+                                         [tuple(map(_a_texto, f)) for f in cambiadas])
+                finally:
+                    conn.close()
+            if reemplazar:
+                huellas.clear()
+                self._reemplazadas.add(tabla)
+            for i in borradas:
+                del huellas[i]
+            huellas.update((f[0], hash(f)) for f in cambiadas)
+
+    def en_segundo_plano(self, tarea):
+        """Encola una escritura para el hilo del espejo (en orden, una a la vez)"""
+        with self._lock:
+            if self._escritor is None:
+                self._escritor = threading.Thread(target=self._escribir_pendientes, name="espejo-local",
+                                                  daemon=True)
+                self._escritor.start()
+        self._tareas.put(tarea)
+
+    def esperar_pendientes(self):
+        """Bloquea hasta que se escribieron todas las tareas encoladas"""
+        self._tareas.join()
+
+    def _escribir_pendientes(self):
+        while True:
+            tarea = self._tareas.get()
+            try:
+                tarea()
+            except Exception as e:
+                print(f"No se pudo actualizar el espejo local: {e}")
+            finally:
+                self._tareas.task_done()
+
+    # ----------------- Escritura (desde lecturas al servidor) -----------------
+    def guardar_productos(self, productos: Iterable[Dict[str, Any]], completo: bool = True):
+        """Reemplaza el catálogo (completo) o agrega/actualiza solo los recibidos"""
+        self._sincronizar("productos", _COLUMNAS_PRODUCTO, productos, completo)
+
+    def guardar_categorias(self, categorias: Iterable[Dict[str, Any]]):
+        self._sincronizar("categorias", _COLUMNAS_CATEGORIA, categorias, completo=True)
+
+    def guardar_puntos_venta(self, puntos: Iterable[Dict[str, Any]]):
+        self._sincronizar("puntos_venta", _COLUMNAS_PUNTO_VENTA, puntos, completo=True)
+
+    def guardar_ventas(self, ventas: Iterable[Dict[str, Any]]):
+        self._sincronizar("ventas", _COLUMNAS_VENTA, ventas, completo=False)
+
+    def descontar_stock(self, items: Iterable[Dict[str, Any]]):
+        """Refleja localmente una venta encolada mientras no hay servidor"""
+        with self._lock:
+            huellas = self._huellas.get("productos", {})
+            for it in items:
+                huellas.pop(it["producto_id"], None)   # la próxima copia reescribe esas filas
+        self._escribir([
+            ("UPDATE productos SET stock = stock - ? WHERE id = ?",
+             [(it["cantidad"], it["producto_id"]) for it in items]),
+        ])
+
+    # ----------------- Lectura (modo sin conexión) -----------------
+    @staticmethod
+    def _producto(fila: sqlite3.Row) -> Dict[str, Any]:
+        p = dict(fila)
+        p["precio"] = Decimal(p["precio"])
+        p["activo"] = bool(p["activo"])
+        p["fecha_modificacion"] = _a_fecha(p["fecha_modificacion"])
+        return p
+
+    def listar_productos(self) -> List[Dict[str, Any]]:
+        return [self._producto(f) for f in self._consultar("SELECT * FROM productos ORDER BY nombre")]
+
+    def buscar_producto(self, producto_id: int) -> Optional[Dict[str, Any]]:
+        filas = self._consultar("SELECT * FROM productos WHERE id = ?", (producto_id,))
+        return self._producto(filas[0]) if filas else None
+
+    def buscar_producto_por_texto(self, codigo_o_nombre: str) -> Optional[Dict[str, Any]]:
+        filas = self._consultar("SELECT * FROM productos WHERE codigo_barras = ? OR nombre LIKE ? LIMIT 1",
+                                (codigo_o_nombre, f"%{codigo_o_nombre}%"))
+        return self._producto(filas[0]) if filas else None
+
+    def listar_categorias(self) -> List[Dict[str, Any]]:
+        return [dict(f) for f in self._consultar("SELECT id, nombre, descripcion FROM categorias ORDER BY nombre")]
+
+    def buscar_categoria(self, categoria_id: int) -> Optional[Dict[str, Any]]:
+        filas = self._consultar("SELECT id, nombre, descripcion FROM categorias WHERE id = ?", (categoria_id,))
+        return dict(filas[0]) if filas else None
+
+    def listar_puntos_venta(self) -> List[Dict[str, Any]]:
+        return [dict(f) for f in self._consultar(
+            "SELECT id, nombre, direccion, telefono FROM puntos_venta ORDER BY nombre")]
+
+    def listar_ventas(self, limit: int = 50) -> List[Dict[str, Any]]:
+        ventas = []
+        for fila in self._consultar("SELECT * FROM ventas ORDER BY fecha DESC LIMIT ?", (limit,)):
+            v = dict(fila)
+            v["fecha"] = _a_fecha(v["fecha"])
+            v["total"] = Decimal(v["total"])
+            ventas.append(v)
+        return ventas
+
+
+_espejo = None
+_espejo_lock = threading.Lock()
+
+def get_espejo() -> EspejoLocal:
+    global _espejo
+    if _espejo is None:
+        with _espejo_lock:
+            if _espejo is None:
+                _espejo = EspejoLocal()
+    return _espejo
@@ -0,0 +1,162 @@
+"""
+Escritura de planillas Excel fila por fila, con memoria constante.
+
+Usa xlsxwriter en modo constant_memory (cada fila va a disco apenas se
+escribe) y, si no está instalado, openpyxl en modo write_only. Los anchos
+de columna se calculan mientras se escriben las filas, sin volver a
+recorrer las celdas. Una hoja que supera el máximo de filas de Excel sigue
+en otra hoja con el mismo encabezado ("Ventas (2)", ...).
+"""
+from typing import Any, List, Sequence
+
+FILAS_MAX_HOJA = 1_048_576      # límite de Excel por hoja (incluye el encabezado)
+ANCHO_MAX_COLUMNA = 50
+FILAS_MUESTRA_ANCHOS = 200      # openpyxl: filas que se miran antes de fijar los anchos
+
+
+def _motor():
+    """('xlsxwriter', módulo) u ('openpyxl', módulo), el primero disponible"""
+    try:
+        import xlsxwriter
+        return "xlsxwriter", xlsxwriter
+    except ImportError:
+        pass
+    try:
+        import openpyxl
+        return "openpyxl", openpyxl
+    except ImportError:
+        raise ImportError("Para exportar a Excel instale xlsxwriter (recomendado) u openpyxl")
+
+
+def _ancho(valor) -> int:
+    return min(len(str(valor)) + 2, ANCHO_MAX_COLUMNA) if valor is not None else 0
+
+
+def _nombre_columna(indice: int) -> str:
+    """0 -> 'A', 26 -> 'AA'"""
+    nombre = ""
+    indice += 1
+    while indice:
+        indice, resto = divmod(indice - 1, 26)
+        nombre = chr(65 + resto) + nombre
+    return nombre
+
+
+class HojaStreaming:
+    """Hoja de solo agregado; se obtiene con LibroExcelStreaming.hoja()."""
+
+    def __init__(self, libro: "LibroExcelStreaming", nombre: str, encabezados: Sequence[str]):
+        self._libro = libro
+        self.nombre = nombre
+        self.encabezados = list(encabezados)
+        self.filas = 0              # filas de datos escritas (todas las partes)
+        self._parte = 1
+        self._abrir_parte(nombre)
+
+    def agregar(self, fila: Sequence[Any]):
+        if self._filas_parte >= FILAS_MAX_HOJA:
+            self._cerrar_parte()
+            self._parte += 1
+            self._abrir_parte(f"{self.nombre[:25]} ({self._parte})")
+        self._escribir(list(fila))
+        self.filas += 1
+
+    def agregar_varias(self, filas):
+        for fila in filas:
+            self.agregar(fila)
+
+    # ----------------- Internos -----------------
+    def _abrir_parte(self, nombre: str):
+        self._anchos = [_ancho(e) for e in self.encabezados]
+        self._filas_parte = 0
+        self._pendientes: List[list] = []   # solo openpyxl, hasta fijar los anchos
+        if self._libro.motor == "xlsxwriter":
+            self._hoja = self._libro.libro.add_worksheet(nombre)
+        else:
+            self._hoja = self._libro.libro.create_sheet(nombre)
+            self._anchos_fijados = False
+        self._escribir(self.encabezados, encabezado=True)
+
+    def _escribir(self, fila: list, encabezado: bool = False):
+        for i, valor in enumerate(fila):
+            ancho = _ancho(valor)
+            if i >= len(self._anchos):
+                self._anchos.append(ancho)
+            elif ancho > self._anchos[i]:
+                self._anchos[i] = ancho
+
+        if self._libro.motor == "xlsxwriter":
+            formato = self._libro.formato_encabezado if encabezado else None
+            self._hoja.write_row(self._filas_parte, 0, fila, formato)
+        else:
+            # write_only escribe los anchos antes de la primera fila: se juntan
+            # unas filas de muestra, se fijan los anchos y desde ahí se escribe directo
+            if self._anchos_fijados:
+                self._hoja.append(fila)
+            else:
+                self._pendientes.append(fila)
+                if len(self._pendientes) >= FILAS_MUESTRA_ANCHOS:
+                    self._volcar_pendientes()
+        self._filas_parte += 1
+
+    def _volcar_pendientes(self):
+        for i, ancho in enumerate(self._anchos):
+            self._hoja.column_dimensions[_nombre_columna(i)].width = ancho
+        self._anchos_fijados = True
+        for fila in self._pendientes:
+            self._hoja.append(fila)
+        self._pendientes = []
+
+    def _cerrar_parte(self):
+        if self._libro.motor == "xlsxwriter":
+            # En constant_memory los anchos se pueden fijar al final: van en el encabezado de la hoja
+            for i, ancho in enumerate(self._anchos):
+                self._hoja.set_column(i, i, ancho)
+        elif not self._anchos_fijados:
+            self._volcar_pendientes()
+
+
+class LibroExcelStreaming:
+    """
+    with LibroExcelStreaming(ruta) as libro:
+        hoja = libro.hoja("Ventas", ["ID", "Fecha", ...])
+        for fila in filas:
+            hoja.agregar(fila)
+
+    Las hojas aparecen en el orden en que se crean, aunque se llenen en otro orden.
+    """
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        self.motor, modulo = _motor()
+        self._hojas: List[HojaStreaming] = []
+        if self.motor == "xlsxwriter":
+            self.libro = modulo.Workbook(ruta, {"constant_memory": True, "default_date_format": "dd/mm/yyyy"})
+            self.formato_encabezado = self.libro.add_format({"bold": True})
+        else:
+            self.libro = modulo.Workbook(write_only=True)
+
+    def hoja(self, nombre: str, encabezados: Sequence[str]) -> HojaStreaming:
+        hoja = HojaStreaming(self, nombre, encabezados)
+        self._hojas.append(hoja)
+        return hoja
+
+    def cerrar(self):
+        for hoja in self._hojas:
+            hoja._cerrar_parte()
+        if self.motor == "xlsxwriter":
+            self.libro.close()
+        else:
+            self.libro.save(self.ruta)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.cerrar()
+        elif self.motor == "xlsxwriter":
+            try:
+                self.libro.close()  # libera los temporales; el archivo queda incompleto
+            except Exception:
+                pass
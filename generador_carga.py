@@ -0,0 +1,192 @@
+"""
+Generador de carga: N cajas virtuales vendiendo a la vez contra la BD.
+
+Cada caja es un proceso aparte, con su propio pool de conexiones, como
+una PC de caja real. Arma las ventas con SimuladorVentasPro.armar_venta (con su
+stock local, sin leer la BD por carrito) y las registra con
+VentaRepo.crear_venta.
+
+Hay dos modelos de llegada:
+- abierto: los clientes llegan a 'tasa' ventas/s en total (proceso de
+  Poisson), atienda o no la caja a tiempo. Si la BD se atrasa, la cola
+  crece y se ve en la espera.
+- cerrado: cada caja vende, espera un tiempo de pausa (exponencial, con
+  la media que da la tasa pedida) y vuelve a vender. Con --tasa 0 no hay
+  pausa y se mide el máximo que aguanta el servidor.
+
+Al final informa ventas por segundo, los percentiles p50/p95/p99 de la
+latencia de crear_venta y los errores por tipo (deadlocks, bloqueos,
+stock insuficiente, etc.). Sirve para dimensionar el SQL Server antes de
+abrir un local nuevo. Usa la BD configurada (KIOSKO_BACKEND, ...) y
+registra ventas reales: no correrlo contra la base de producción.
+
+Uso:
+    python generador_carga.py --cajas 8 --tasa 20 --duracion 60 [--modelo cerrado] [--pdf]
+"""
+import argparse
+import datetime
+import math
+import multiprocessing
+import random
+import sys
+import time
+from collections import Counter
+from typing import Any, Dict, List
+
+
+def percentil(ordenados: List[float], p: float) -> float:
+    """Percentil p (0-100) de una lista ya ordenada, por rango más cercano"""
+    if not ordenados:
+        return 0.0
+    return ordenados[max(0, math.ceil(p / 100 * len(ordenados)) - 1)]
+
+
+def _sqlstate(e: Exception):
+    """(SQLSTATE, mensaje del driver) de un error de pyodbc; ("", "") si no lo es"""
+    pyodbc = sys.modules.get("pyodbc")
+    if not (pyodbc and isinstance(e, pyodbc.Error) and e.args):
+        return "", ""
+    # pyodbc: args = (sqlstate, "[...] mensaje (código nativo) (SQLExecDirectW)")
+    return str(e.args[0]), str(e.args[1]) if len(e.args) > 1 else ""
+
+
+def clasificar_error(e: Exception) -> str:
+    from config import PoolAgotadoError, es_error_de_bloqueo, es_error_de_conexion
+    from repos import StockInsuficienteError
+    if isinstance(e, StockInsuficienteError):
+        return "stock insuficiente"
+    estado, mensaje = _sqlstate(e)
+    if estado == "40001" or "(1205)" in mensaje:
+        return "deadlock"
+    if es_error_de_bloqueo(e) or estado.startswith("HYT"):
+        return "bloqueo / tiempo agotado"
+    if isinstance(e, PoolAgotadoError):
+        return "pool agotado"
+    if es_error_de_conexion(e):
+        return "conexión"
+    return type(e).__name__
+
+
+def _caja(numero: int, opciones: Dict[str, Any]) -> Dict[str, Any]:
+    """Una caja virtual (corre en su propio proceso); devuelve sus mediciones"""
+    import logging
+    logging.disable(logging.WARNING)  # los avisos del simulador tapan el reporte
+    from repos import VentaRepo
+    from simulacion_ventas import SimuladorVentasPro
+
+    random.seed(opciones["semilla"] + numero)
+    simulador = SimuladorVentasPro()
+    if not simulador.preparar():
+        return {"caja": numero, "error_inicio": "No hay productos activos con stock"}
+
+    cajas = opciones["cajas"]
+    tasa_caja = opciones["tasa"] / cajas if opciones["tasa"] > 0 else 0.0
+    ventas_caja = math.ceil(opciones["ventas"] / cajas) if opciones["ventas"] else None
+    inicio = time.time()
+    fin_previsto = inicio + opciones["duracion"]
+    proxima_llegada = inicio
+
+    latencias: List[float] = []
+    esperas: List[float] = []
+    errores: Counter = Counter()
+    sin_carrito = 0
+    while time.time() < fin_previsto and (ventas_caja is None or len(latencias) < ventas_caja):
+        if opciones["modelo"] == "abierto" and tasa_caja:
+            proxima_llegada += random.expovariate(tasa_caja)
+            if proxima_llegada >= fin_previsto:
+                break
+            demora = proxima_llegada - time.time()
+            if demora > 0:
+                time.sleep(demora)
+            esperas.append(max(0.0, -demora))   # cliente esperando a que la caja se libere
+
+        venta = simulador.armar_venta()
+        if venta is None:
+            sin_carrito += 1
+            time.sleep(0.1)
+            continue
+
+        t0 = time.perf_counter()
+        try:
+            venta_id = VentaRepo.crear_venta(**venta)
+        except Exception as e:
+            errores[clasificar_error(e)] += 1
+            simulador.registrar_resultado(venta, e)
+        else:
+            latencias.append(time.perf_counter() - t0)
+            simulador.registrar_resultado(venta)
+            if opciones["pdf"]:
+                carrito = venta["items"]
+                total = round(sum(it["precio"] * it["cantidad"] for it in carrito), 2)
+                simulador.generar_ticket_pdf({"venta_id": venta_id, "items": len(carrito), "total": total,
+                                              "forma_pago": venta["forma_pago"],
+                                              "timestamp": datetime.datetime.now()},
+                                             carrito)
+
+        if opciones["modelo"] == "cerrado" and tasa_caja:
+            time.sleep(random.expovariate(tasa_caja))
+
+    return {"caja": numero, "inicio": inicio, "fin": time.time(), "latencias": latencias,
+            "esperas": esperas, "errores": dict(errores), "sin_carrito": sin_carrito}
+
+
+def informe(opciones: Dict[str, Any], resultados: List[Dict[str, Any]]) -> int:
+    fallidas = [r for r in resultados if "error_inicio" in r]
+    for r in fallidas:
+        print(f"❌ Caja {r['caja']}: {r['error_inicio']}")
+    resultados = [r for r in resultados if "error_inicio" not in r]
+    if not resultados:
+        return 1
+
+    latencias = sorted(l for r in resultados for l in r["latencias"])
+    esperas = sorted(e for r in resultados for e in r["esperas"])
+    errores: Counter = Counter()
+    for r in resultados:
+        errores.update(r["errores"])
+    ventana = max(r["fin"] for r in resultados) - min(r["inicio"] for r in resultados)
+    objetivo = f"{opciones['tasa']:.1f} ventas/s" if opciones["tasa"] > 0 else "sin pausa"
+
+    print(f"\nCajas: {len(resultados)}  modelo {opciones['modelo']}  objetivo {objetivo}  ventana {ventana:.1f} s")
+    print(f"Ventas: {len(latencias)} registradas, {sum(errores.values())} con error"
+          f"  -> {len(latencias) / ventana if ventana else 0:.2f} ventas/s")
+    if latencias:
+        ms = lambda s: f"{s * 1000:.1f} ms"
+        print(f"crear_venta: p50 {ms(percentil(latencias, 50))}  p95 {ms(percentil(latencias, 95))}"
+              f"  p99 {ms(percentil(latencias, 99))}  máx {ms(latencias[-1])}")
+        if esperas:
+            print(f"Espera en cola: p50 {ms(percentil(esperas, 50))}  p95 {ms(percentil(esperas, 95))}"
+                  f"  p99 {ms(percentil(esperas, 99))}")
+    for tipo, cantidad in errores.most_common():
+        print(f"  ⚠️  {tipo}: {cantidad}")
+    sin_carrito = sum(r["sin_carrito"] for r in resultados)
+    if sin_carrito:
+        print(f"  ⚠️  carritos vacíos (productos sin stock): {sin_carrito}")
+    return 0 if latencias else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga con varias cajas virtuales")
+    parser.add_argument("--cajas", type=int, default=4, help="cajas vendiendo a la vez (un proceso cada una)")
+    parser.add_argument("--tasa", type=float, default=10.0, help="ventas por segundo en total (0: sin pausa)")
+    parser.add_argument("--modelo", choices=("abierto", "cerrado"), default="abierto")
+    parser.add_argument("--duracion", type=float, default=60.0, help="segundos de prueba")
+    parser.add_argument("--ventas", type=int, default=0, help="cortar al llegar a estas ventas (0: sin tope)")
+    parser.add_argument("--pdf", action="store_true", help="generar el ticket PDF de cada venta")
+    parser.add_argument("--semilla", type=int, default=1234)
+    opciones = vars(parser.parse_args())
+    if opciones["modelo"] == "abierto" and opciones["tasa"] <= 0:
+        parser.error("el modelo abierto necesita --tasa mayor que 0")
+
+    # El esquema se migra una vez acá y no en cada caja a la vez
+    from migraciones import migrar
+    migrar()
+
+    print(f"Iniciando {opciones['cajas']} cajas por {opciones['duracion']:.0f} s...")
+    contexto = multiprocessing.get_context("spawn")   # igual en Windows y Linux
+    with contexto.Pool(opciones["cajas"]) as pool:
+        resultados = pool.starmap(_caja, [(n, opciones) for n in range(1, opciones["cajas"] + 1)])
+    return informe(opciones, resultados)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,316 @@
+import bisect
+import functools
+import threading
+import unicodedata
+from typing import List, Dict, Optional, Any, Iterable
+
+
+def normalizar(texto: Any) -> str:
+    """Normaliza un texto para búsqueda: minúsculas, sin espacios extremos ni acentos."""
+    texto = str(texto or "").strip().lower()
+    if texto.isascii():
+        return texto
+    descompuesto = unicodedata.normalize("NFKD", texto)
+    return "".join(c for c in descompuesto if not unicodedata.combining(c))
+
+
+def _trigramas(texto: str):
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+def _texto_trigramas(textos: tuple) -> str:
+    # Nombre y código en un solo texto; el separador nunca aparece en una consulta
+    return textos[0] + "\x00" + textos[1]
+
+
+def _textos_producto(prod: Dict[str, Any]) -> tuple:
+    return (normalizar(prod.get('nombre')),
+            normalizar(prod.get('codigo_barras')),
+            normalizar(prod.get('categoria')))
+
+
+def _palabras(textos: tuple, producto_id) -> List[tuple]:
+    """Entradas de prefijo además del nombre: cada palabra que no es la primera y el código"""
+    nombre, codigo, _ = textos
+    entradas = [(palabra, producto_id) for palabra in nombre.split()[1:]]
+    if codigo:
+        entradas.append((codigo, producto_id))
+    return entradas
+
+
+def _quitar_ordenado(lista: list, valor):
+    i = bisect.bisect_left(lista, valor)
+    if i < len(lista) and lista[i] == valor:
+        del lista[i]
+
+
+def _sincronizado(metodo):
+    """Ejecuta el método con el lock del índice tomado"""
+    @functools.wraps(metodo)
+    def envoltura(self, *args, **kwargs):
+        with self._lock:
+            return metodo(self, *args, **kwargs)
+    return envoltura
+
+
+class IndiceProductos:
+    """
+    Índice en memoria sobre cache_productos con búsqueda O(1) por
+    código de barras, por id y por nombre normalizado, más un índice de
+    trigramas y prefijos para las búsquedas por texto.
+
+    Se puede consultar desde otros hilos (las sugerencias se buscan fuera
+    del hilo de Tk): consultas y cambios se serializan con un RLock.
+    """
+
+    def __init__(self, productos: Optional[Iterable[Dict[str, Any]]] = None):
+        self._lock = threading.RLock()
+        self.por_id: Dict[Any, Dict[str, Any]] = {}
+        self.por_codigo: Dict[str, Dict[str, Any]] = {}
+        self.por_nombre: Dict[str, Dict[str, Any]] = {}
+        self._textos: Dict[Any, tuple] = {}        # id -> (nombre, codigo, categoria) normalizados
+        self._claves: Dict[Any, tuple] = {}        # id -> (nombre normalizado, id): orden del catálogo
+        self._trigramas: Dict[str, List[tuple]] = {}  # trigrama -> claves ordenadas (nombre y código)
+        self._por_categoria: Dict[str, set] = {}    # categoría normalizada -> ids
+        self._nombres: List[tuple] = []             # claves ordenadas, para prefijos de nombre
+        self._palabras: List[tuple] = []            # (palabra o código, id) ordenados, para prefijos
+        if productos:
+            self.reconstruir(productos)
+
+    @_sincronizado
+    def __len__(self):
+        return len(self.por_id)
+
+    @_sincronizado
+    def reconstruir(self, productos: Iterable[Dict[str, Any]]):
+        """Reconstruye el índice completo a partir de la lista de productos."""
+        self.por_id = {}
+        self.por_codigo = {}
+        self.por_nombre = {}
+        self._textos = {}
+        self._claves = {}
+        self._trigramas = {}
+        self._por_categoria = {}
+        self._nombres = []
+        self._palabras = []
+        # Indexando en el orden de las claves, nombres y trigramas quedan ordenados sin más
+        # (el catálogo ya viene por nombre, así que este sort es casi lineal)
+        pendientes = sorted(((_textos_producto(p), p) for p in productos), key=lambda t: (t[0][0], t[1]['id']))
+        for textos, prod in pendientes:
+            self._indexar(prod, ordenar=False, textos=textos)
+        self._palabras.sort()
+
+    @_sincronizado
+    def adoptar(self, otro: "IndiceProductos"):
+        """
+        Toma el contenido de otro índice ya construido (p. ej. en un hilo de
+        trabajo), manteniendo la identidad de este objeto para quien lo referencia.
+        """
+        with otro._lock:
+            self.__dict__.update((k, v) for k, v in otro.__dict__.items() if k != "_lock")
+
+    @_sincronizado
+    def actualizar(self, productos: Iterable[Dict[str, Any]]):
+        """Agrega o reemplaza solo los productos recibidos (parche incremental)."""
+        for prod in productos:
+            anterior = self.por_id.get(prod['id'])
+            if anterior is not None:
+                self._desindexar(anterior, conservar_textos=True)
+            self._indexar(prod)
+            if anterior is not None:
+                self._reasignar(anterior)
+
+    @_sincronizado
+    def quitar(self, producto_ids: Iterable[Any]):
+        for producto_id in producto_ids:
+            anterior = self.por_id.get(producto_id)
+            if anterior is not None:
+                self._desindexar(anterior)
+                self._reasignar(anterior)
+
+    # ----------------- Consultas exactas -----------------
+    @_sincronizado
+    def buscar_id(self, producto_id) -> Optional[Dict[str, Any]]:
+        return self.por_id.get(producto_id)
+
+    @_sincronizado
+    def buscar_codigo(self, codigo: str) -> Optional[Dict[str, Any]]:
+        return self.por_codigo.get(normalizar(codigo))
+
+    @_sincronizado
+    def buscar_nombre(self, nombre: str) -> Optional[Dict[str, Any]]:
+        return self.por_nombre.get(normalizar(nombre))
+
+    @_sincronizado
+    def buscar_exacto(self, entrada: str) -> Optional[Dict[str, Any]]:
+        """Coincidencia exacta por código de barras y, si no hay, por nombre."""
+        return self.buscar_codigo(entrada) or self.buscar_nombre(entrada)
+
+    # ----------------- Búsqueda por texto -----------------
+    @_sincronizado
+    def buscar(self, query: str, limite: int = 10, solo_activos: bool = True) -> List[Dict[str, Any]]:
+        """
+        Devuelve los 'limite' productos más relevantes cuyo nombre o código
+        contienen 'query', por niveles: código exacto, nombre que empieza,
+        palabra (o código) que empieza, nombre que contiene, código que contiene.
+        Cada nivel corta en cuanto junta 'limite' resultados.
+        """
+        q = normalizar(query)
+        if not q:
+            return []
+
+        elegidos = []
+        vistos = set()
+
+        def agregar(producto_id) -> bool:
+            if producto_id in vistos:
+                return False
+            if solo_activos and not self.por_id[producto_id].get('activo', True):
+                return False
+            vistos.add(producto_id)
+            elegidos.append(producto_id)
+            return len(elegidos) >= limite
+
+        exacto = self.por_codigo.get(q)
+        if exacto is not None and agregar(exacto['id']):
+            return self._productos(elegidos)
+
+        for lista in (self._nombres, self._palabras):
+            i = bisect.bisect_left(lista, (q,))
+            while i < len(lista) and lista[i][0].startswith(q):
+                if agregar(lista[i][1]):
+                    return self._productos(elegidos)
+                i += 1
+
+        en_codigo = []
+        for producto_id in self._candidatos(q):
+            nombre, codigo, _ = self._textos[producto_id]
+            if q in nombre:
+                if agregar(producto_id):
+                    break
+            elif q in codigo and len(en_codigo) < limite:
+                en_codigo.append(producto_id)
+        for producto_id in en_codigo:
+            if len(elegidos) >= limite or agregar(producto_id):
+                break
+        return self._productos(elegidos)
+
+    @_sincronizado
+    def filtrar(self, query: str, incluir_categoria: bool = True) -> List[Dict[str, Any]]:
+        """
+        Todos los productos cuyo nombre, código (o categoría) contienen
+        'query', en el orden del catálogo (por nombre).
+        """
+        q = normalizar(query)
+        if not q:
+            return self._productos(i for _, i in self._nombres)
+        ids = {i for i in self._candidatos(q) if q in _texto_trigramas(self._textos[i])}
+        if incluir_categoria:
+            for categoria, de_categoria in self._por_categoria.items():
+                if q in categoria:
+                    ids |= de_categoria
+        if len(ids) * 8 > len(self._nombres):
+            # Muchos resultados: recorrer el orden ya armado es más barato que ordenarlos
+            return self._productos(i for _, i in self._nombres if i in ids)
+        return self._productos(sorted(ids, key=self._claves.__getitem__))
+
+    # ----------------- Internos -----------------
+    def _productos(self, ids) -> List[Dict[str, Any]]:
+        return [self.por_id[i] for i in ids]
+
+    def _candidatos(self, q: str) -> Iterable[Any]:
+        """Ids que pueden contener q, por nombre: la lista de trigramas más corta (o todos)."""
+        if len(q) < 3:
+            return (i for _, i in self._nombres)
+        mas_corta = None
+        for tri in _trigramas(q):
+            claves = self._trigramas.get(tri)
+            if not claves:
+                return []
+            if mas_corta is None or len(claves) < len(mas_corta):
+                mas_corta = claves
+        return (i for _, i in mas_corta)
+
+    @staticmethod
+    def _preferir(mapa: Dict[str, Dict[str, Any]], clave: str, prod: Dict[str, Any]):
+        # Ante claves repetidas gana el primer producto activo
+        if not clave:
+            return
+        actual = mapa.get(clave)
+        if actual is None or (not actual.get('activo', True) and prod.get('activo', True)):
+            mapa[clave] = prod
+
+    def _indexar(self, prod: Dict[str, Any], ordenar: bool = True, textos: Optional[tuple] = None):
+        """ordenar=False agrega al final de las listas ordenadas (reconstruir indexa ya en orden)"""
+        producto_id = prod['id']
+        textos = textos or _textos_producto(prod)
+
+        self.por_id[producto_id] = prod
+        self._preferir(self.por_codigo, textos[1], prod)
+        self._preferir(self.por_nombre, textos[0], prod)
+
+        anteriores = self._textos.get(producto_id)
+        if anteriores == textos:
+            return  # solo cambió stock/precio: los trigramas siguen valiendo
+        if anteriores is not None:
+            self._quitar_textos(producto_id)
+        clave = (textos[0], producto_id)
+        self._textos[producto_id] = textos
+        self._claves[producto_id] = clave
+        trigramas = self._trigramas
+        if ordenar:
+            bisect.insort(self._nombres, clave)
+            for entrada in _palabras(textos, producto_id):
+                bisect.insort(self._palabras, entrada)
+            for tri in _trigramas(_texto_trigramas(textos)):
+                bisect.insort(trigramas.setdefault(tri, []), clave)
+        else:
+            self._nombres.append(clave)
+            self._palabras.extend(_palabras(textos, producto_id))
+            for tri in _trigramas(_texto_trigramas(textos)):
+                trigramas.setdefault(tri, []).append(clave)
+        self._por_categoria.setdefault(textos[2], set()).add(producto_id)
+
+    def _desindexar(self, prod: Dict[str, Any], conservar_textos: bool = False):
+        producto_id = prod['id']
+        self.por_id.pop(producto_id, None)
+        for mapa, clave in ((self.por_codigo, normalizar(prod.get('codigo_barras'))),
+                            (self.por_nombre, normalizar(prod.get('nombre')))):
+            if mapa.get(clave) is prod:
+                del mapa[clave]
+
+        if conservar_textos:
+            return  # _indexar decide si hay que rehacer los trigramas
+        self._quitar_textos(producto_id)
+        self._textos.pop(producto_id, None)
+        self._claves.pop(producto_id, None)
+
+    def _reasignar(self, prod: Dict[str, Any]):
+        """
+        Si el código o el nombre de 'prod' quedaron sin dueño, se los da a otro
+        producto con la misma clave (el primero activo en orden de catálogo).
+        """
+        for mapa, lista, campo, clave in ((self.por_codigo, self._palabras, 1, normalizar(prod.get('codigo_barras'))),
+                                          (self.por_nombre, self._nombres, 0, normalizar(prod.get('nombre')))):
+            if not clave or clave in mapa:
+                continue
+            i = bisect.bisect_left(lista, (clave,))
+            while i < len(lista) and lista[i][0] == clave:
+                producto_id = lista[i][1]
+                # En _palabras también están las palabras del nombre: solo sirven códigos
+                if self._textos[producto_id][campo] == clave:
+                    self._preferir(mapa, clave, self.por_id[producto_id])
+                i += 1
+
+    def _quitar_textos(self, producto_id):
+        """Saca al producto de las listas ordenadas, los trigramas y su categoría"""
+        textos = self._textos.get(producto_id)
+        if not textos:
+            return
+        clave = self._claves[producto_id]
+        _quitar_ordenado(self._nombres, clave)
+        for entrada in _palabras(textos, producto_id):
+            _quitar_ordenado(self._palabras, entrada)
+        for tri in _trigramas(_texto_trigramas(textos)):
+            _quitar_ordenado(self._trigramas.get(tri, []), clave)
+        self._por_categoria.get(textos[2], set()).discard(producto_id)
@@ -0,0 +1,70 @@
+"""
+Reporte de tiempos de arranque (estilo `python -X importtime`).
+
+Importa el módulo indicado (por defecto la pantalla de login) en un
+intérprete nuevo con -X importtime y muestra los imports más costosos.
+Sale con código 1 si alguna dependencia pesada (pandas, matplotlib,
+reportlab) se cargó al arrancar, para detectar regresiones.
+
+Uso:
+    python medir_arranque.py [modulo] [--top N]
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+MODULOS_PESADOS = ("pandas", "matplotlib", "reportlab", "openpyxl", "xlsxwriter", "numpy", "fpdf")
+
+
+def medir(modulo: str):
+    """Devuelve [(propio_us, acumulado_us, nombre)] y el stderr crudo del intérprete"""
+    aqui = os.path.dirname(os.path.abspath(__file__))
+    proceso = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+        cwd=aqui, capture_output=True, text=True,
+    )
+    filas = []
+    otras_lineas = []
+    for linea in proceso.stderr.splitlines():
+        if not linea.startswith("import time:"):
+            otras_lineas.append(linea)
+            continue
+        partes = linea[len("import time:"):].split("|")
+        try:
+            propio, acumulado = int(partes[0]), int(partes[1])
+        except ValueError:
+            continue  # encabezado "self [us] | cumulative | imported package"
+        filas.append((propio, acumulado, partes[2].rstrip()))
+    return filas, proceso.returncode, "\n".join(otras_lineas)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiempos de import al arrancar el POS")
+    parser.add_argument("modulo", nargs="?", default="app_pos_login_roles")
+    parser.add_argument("--top", type=int, default=20, help="cantidad de imports a listar")
+    args = parser.parse_args()
+
+    filas, codigo, errores = medir(args.modulo)
+    if codigo != 0:
+        print(f"❌ Falló 'import {args.modulo}':\n{errores}")
+        return 2
+
+    raiz = next((f for f in reversed(filas) if f[2].strip() == args.modulo), None)
+    total = raiz[1] if raiz else sum(f[0] for f in filas)
+    print(f"Arranque de '{args.modulo}': {total / 1000:.1f} ms en {len(filas)} módulos\n")
+
+    print(f"{'acumulado':>11} {'propio':>9}  módulo")
+    for propio, acumulado, nombre in sorted(filas, key=lambda f: f[1], reverse=True)[:args.top]:
+        print(f"{acumulado / 1000:>9.1f}ms {propio / 1000:>7.1f}ms {nombre}")
+
+    pesados = sorted({f[2].strip().split(".")[0] for f in filas} & set(MODULOS_PESADOS))
+    if pesados:
+        print(f"\n⚠️ Dependencias pesadas cargadas al arrancar: {', '.join(pesados)}")
+        return 1
+    print("\n✅ Ninguna dependencia pesada se cargó al arrancar")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
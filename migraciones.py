@@ -0,0 +1,256 @@
+"""
+Migraciones versionadas del esquema de KioskoDB.
+
+Cada migración tiene un número de versión y una lista de pasos: sentencias
+SQL con los marcadores de dialecto de backends.py, o funciones (backend,
+cursor) para lo que cambia entre motores (índices, tablas con datos
+iniciales). La tabla esquema_version registra las aplicadas; migrar() corre
+solo las pendientes, cada una en su transacción. Todos los pasos son
+"crear si falta", así que se pueden aplicar sobre una base que ya tenía
+las tablas creadas a mano.
+
+Con SQLite se aplican solas al abrir la base. Con SQL Server se corren a
+mano, con las cajas cerradas (crean índices y llenan ventas_diarias con
+toda la historia); la app solo verifica al arrancar que no falte ninguna
+(verificar_esquema) y avisa si hay que correrlas:
+    python migraciones.py            # aplica las pendientes
+    python migraciones.py --estado   # lista aplicadas y pendientes
+"""
+import argparse
+import sys
+from typing import Callable, List, Optional, Tuple, Union
+
+Paso = Union[str, Callable]
+
+
+def _tabla(nombre: str, columnas: str) -> Callable:
+    return lambda backend, cur: backend.crear_tabla_si_falta(cur, nombre, columnas)
+
+
+def _indice(nombre: str, tabla: str, columnas: Tuple[str, ...], incluir: Tuple[str, ...] = ()) -> Callable:
+    return lambda backend, cur: backend.crear_indice_si_falta(cur, nombre, tabla, columnas, incluir)
+
+
+def _ventas_diarias(backend, cur):
+    """Resumen por día y forma de pago; si se crea ahora, se llena con la historia"""
+    if backend.existe_tabla(cur, "ventas_diarias"):
+        return
+    backend.crear_tabla_si_falta(cur, "ventas_diarias", """
+        dia DATE NOT NULL,
+        forma_pago VARCHAR(30) NOT NULL,
+        cantidad INT NOT NULL,
+        total DECIMAL(18, 2) NOT NULL,
+        PRIMARY KEY (dia, forma_pago)
+    """)
+    cur.execute(backend.sql("""
+        INSERT INTO ventas_diarias (dia, forma_pago, cantidad, total)
+        SELECT {dia_fecha}, COALESCE(forma_pago, ''), COUNT(*), SUM(total)
+        FROM ventas
+        GROUP BY {dia_fecha}, COALESCE(forma_pago, '')
+    """))
+
+
+MIGRACIONES: List[Tuple[int, str, List[Paso]]] = [
+    (1, "Tablas base", [
+        _tabla("categorias", """
+            id {id_autonumerico},
+            nombre NVARCHAR(100) NOT NULL,
+            descripcion NVARCHAR(255)
+        """),
+        _tabla("productos", """
+            id {id_autonumerico},
+            codigo_barras VARCHAR(50),
+            nombre NVARCHAR(150) NOT NULL,
+            precio DECIMAL(18, 2) NOT NULL,
+            stock INT NOT NULL DEFAULT 0,
+            stock_minimo INT NOT NULL DEFAULT 0,
+            proveedor NVARCHAR(150),
+            activo BIT NOT NULL DEFAULT 1,
+            categoria_id INT REFERENCES categorias (id),
+            fecha_modificacion DATETIME DEFAULT ({ahora})
+        """),
+        _tabla("puntos_venta", """
+            id {id_autonumerico},
+            nombre NVARCHAR(100) NOT NULL,
+            direccion NVARCHAR(255),
+            telefono VARCHAR(50)
+        """),
+        _tabla("ventas", """
+            id {id_autonumerico},
+            fecha DATETIME NOT NULL DEFAULT ({ahora}),
+            total DECIMAL(18, 2) NOT NULL,
+            descuento DECIMAL(5, 2) NOT NULL DEFAULT 0,
+            forma_pago VARCHAR(30)
+        """),
+        _tabla("detalle_venta", """
+            id {id_autonumerico},
+            venta_id INT NOT NULL REFERENCES ventas (id),
+            producto_id INT NOT NULL REFERENCES productos (id),
+            cantidad INT NOT NULL,
+            precio_unitario DECIMAL(18, 2) NOT NULL
+        """),
+        _tabla("movimientos_stock", """
+            id {id_autonumerico},
+            producto_id INT NOT NULL REFERENCES productos (id),
+            tipo VARCHAR(20) NOT NULL,
+            cantidad INT NOT NULL,
+            stock_anterior INT,
+            stock_nuevo INT,
+            fecha DATETIME NOT NULL DEFAULT ({ahora})
+        """),
+    ]),
+    (2, "Claves de idempotencia de ventas", [
+        _tabla("ventas_idempotencia", """
+            clave VARCHAR(64) NOT NULL PRIMARY KEY,
+            venta_id INT NOT NULL,
+            fecha DATETIME NOT NULL DEFAULT ({ahora})
+        """),
+    ]),
+    (3, "Resumen ventas_diarias", [
+        _ventas_diarias,
+    ]),
+    (4, "Índices para rangos de fecha, detalle, búsqueda y movimientos", [
+        # Rangos [inicio, fin) sobre fecha sin ir a la tabla (listados, reportes, paginado)
+        _indice("ix_ventas_fecha", "ventas", ("fecha", "id"), incluir=("total", "forma_pago")),
+        # Detalle de un conjunto de ventas (listar_completo, recorrer_con_items, buscar_por_id)
+        _indice("ix_detalle_venta_venta", "detalle_venta", ("venta_id",),
+                incluir=("producto_id", "cantidad", "precio_unitario")),
+        # Escaneo de código de barras (ProductoRepo.buscar)
+        _indice("ix_productos_codigo_barras", "productos", ("codigo_barras",)),
+        # Sincronización incremental (listar_cambios) y borrado de categorías
+        _indice("ix_productos_fecha_modificacion", "productos", ("fecha_modificacion",)),
+        _indice("ix_productos_categoria", "productos", ("categoria_id",)),
+        # Historial de movimientos por producto
+        _indice("ix_movimientos_stock_producto", "movimientos_stock", ("producto_id",)),
+    ]),
+    (5, "Reservas de stock de carritos abiertos", [
+        # Sin clave foránea a productos: una reserva vencida no debe impedir borrar el producto
+        _tabla("reservas_stock", """
+            carrito VARCHAR(64) NOT NULL,
+            producto_id INT NOT NULL,
+            cantidad INT NOT NULL,
+            vence DATETIME NOT NULL,
+            PRIMARY KEY (carrito, producto_id)
+        """),
+        # Lo reservado de un producto al controlar stock
+        _indice("ix_reservas_stock_producto", "reservas_stock", ("producto_id", "vence"), incluir=("cantidad",)),
+    ]),
+]
+
+
+class EsquemaDesactualizadoError(RuntimeError):
+    """A la BD le faltan migraciones de esta versión del código."""
+
+
+def _asegurar_tabla_versiones(backend):
+    conn = backend.conectar()
+    try:
+        backend.crear_tabla_si_falta(conn.cursor(), "esquema_version", """
+            version INT NOT NULL PRIMARY KEY,
+            descripcion NVARCHAR(200) NOT NULL,
+            fecha DATETIME NOT NULL DEFAULT ({ahora})
+        """)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def versiones_aplicadas(backend=None) -> List[int]:
+    if backend is None:
+        from backends import get_backend
+        backend = get_backend()
+    _asegurar_tabla_versiones(backend)
+    conn = backend.conectar()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT version FROM esquema_version ORDER BY version")
+        return [fila[0] for fila in cur.fetchall()]
+    finally:
+        conn.close()
+
+
+def pendientes(backend=None) -> List[int]:
+    """Versiones sin aplicar; solo lee (no crea esquema_version si falta)"""
+    if backend is None:
+        from backends import get_backend
+        backend = get_backend()
+    conn = backend.conectar()
+    try:
+        cur = conn.cursor()
+        aplicadas = set()
+        if backend.existe_tabla(cur, "esquema_version"):
+            cur.execute("SELECT version FROM esquema_version")
+            aplicadas = {fila[0] for fila in cur.fetchall()}
+    finally:
+        conn.close()
+    return [version for version, _, _ in MIGRACIONES if version not in aplicadas]
+
+
+def verificar_esquema(backend=None):
+    """Lanza EsquemaDesactualizadoError si falta alguna migración (para el arranque)"""
+    if backend is None:
+        from backends import get_backend
+        backend = get_backend()
+    faltan = pendientes(backend)
+    if faltan:
+        raise EsquemaDesactualizadoError(
+            f"A la base de datos ({backend.nombre}) le faltan las migraciones "
+            f"{', '.join(map(str, faltan))}. Ejecute 'python migraciones.py' con las cajas cerradas."
+        )
+
+
+def migrar(backend=None, hasta: Optional[int] = None) -> List[int]:
+    """Aplica en orden las migraciones pendientes (hasta la versión 'hasta'); devuelve las aplicadas"""
+    if backend is None:
+        from backends import get_backend
+        backend = get_backend()
+    aplicadas = set(versiones_aplicadas(backend))
+    nuevas = []
+    for version, descripcion, pasos in MIGRACIONES:
+        if version in aplicadas or (hasta is not None and version > hasta):
+            continue
+        conn = backend.conectar()
+        try:
+            cur = conn.cursor()
+            for paso in pasos:
+                if callable(paso):
+                    paso(backend, cur)
+                else:
+                    cur.execute(backend.sql(paso))
+            cur.execute("INSERT INTO esquema_version (version, descripcion) VALUES (?, ?)",
+                        (version, descripcion))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        nuevas.append(version)
+    return nuevas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migraciones del esquema de KioskoDB")
+    parser.add_argument("--estado", action="store_true", help="solo listar aplicadas y pendientes")
+    parser.add_argument("--hasta", type=int, help="aplicar solo hasta esta versión")
+    args = parser.parse_args()
+
+    from backends import get_backend
+    backend = get_backend()
+    if args.estado:
+        aplicadas = set(versiones_aplicadas(backend))
+        for version, descripcion, _ in MIGRACIONES:
+            marca = "✅" if version in aplicadas else "⏳"
+            print(f"{marca} {version:>3}  {descripcion}")
+        return 0
+
+    nuevas = migrar(backend, args.hasta)
+    if nuevas:
+        print(f"✅ Migraciones aplicadas en {backend.nombre}: {', '.join(map(str, nuevas))}")
+    else:
+        print(f"El esquema de {backend.nombre} ya está al día")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,23 +9,35 @@ import logging
 import subprocess
 import sys
 import threading  # Importar threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
+# Motor de PDF: se detecta (e importa) recién al generar el primer ticket,
+# para no pagar el import de reportlab al arrancar
 PDF_ENGINE = None
-try:
-    from reportlab.lib.pagesizes import A4
-    from reportlab.lib.units import mm
-    from reportlab.pdfgen import canvas as rl_canvas
-    PDF_ENGINE = "reportlab"
-except Exception:
-    try:
-        from fpdf import FPDF
-        PDF_ENGINE = "fpdf"
-    except Exception:
-        PDF_ENGINE = None
+_pdf_detectado = False
+
+def _cargar_motor_pdf() -> Optional[str]:
+    global PDF_ENGINE, _pdf_detectado
+    if not _pdf_detectado:
+        try:
+            import reportlab.pdfgen.canvas  # noqa: F401
+            PDF_ENGINE = "reportlab"
+        except Exception:
+            try:
+                import fpdf  # noqa: F401
+                PDF_ENGINE = "fpdf"
+            except Exception:
+                PDF_ENGINE = None
+        _pdf_detectado = True
+    return PDF_ENGINE
 
 # --- CORRECCIÓN ---
 # Asegurarnos de importar CategoriaRepo para el bloque de prueba
-from repos import ProductoRepo, VentaRepo, PuntoVentaRepo, CategoriaRepo
+from repos import ProductoRepo, VentaRepo, PuntoVentaRepo, CategoriaRepo, StockInsuficienteError
+from indice_productos import IndiceProductos
+from config import VENTAS_ASINCRONAS, MODO_OFFLINE, es_error_de_conexion
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("NuevaVentaPro")
@@ -184,13 +196,23 @@ class PagoDialog(tk.Toplevel):
         self.resultado = None
         self.destroy()
 
+# Un único hilo para las búsquedas del autocompletado: las consultas se
+# atienden en orden y las obsoletas se descartan antes de ejecutarse.
+_ejecutor_busquedas = ThreadPoolExecutor(max_workers=1, thread_name_prefix="autocompletado")
+
 class AutoCompleteEntry(ttk.Entry):
-    def __init__(self, parent, suggestions_callback, on_select_callback, **kwargs):
+    DEBOUNCE_MS = 150  # ventana para agrupar pulsaciones seguidas
+
+    def __init__(self, parent, suggestions_callback, on_select_callback, debounce_ms=None, **kwargs):
         super().__init__(parent, **kwargs)
         self.suggestions_callback = suggestions_callback
         self.on_select_callback = on_select_callback
         self.parent = parent
         self.listbox = None
+        self.debounce_ms = self.DEBOUNCE_MS if debounce_ms is None else debounce_ms
+        self._after_busqueda = None
+        # Cada búsqueda lleva un número de generación; solo se muestra la última
+        self._generacion = 0
         self.bind('<KeyRelease>', self._on_keyrelease)
         self.bind('<FocusOut>', self._on_focus_out)
         self.bind('<Down>', self._on_down)
@@ -201,14 +223,48 @@ class AutoCompleteEntry(ttk.Entry):
     def _on_keyrelease(self, event):
         if event.keysym in ['Down', 'Up', 'Return', 'Escape']:
             return
-        self._show_suggestions()
+        self._programar_busqueda()
+
+    def _programar_busqueda(self):
+        """Reinicia la ventana de espera: solo busca cuando se deja de teclear"""
+        if self._after_busqueda is not None:
+            self.after_cancel(self._after_busqueda)
+        self._after_busqueda = self.after(self.debounce_ms, self._show_suggestions)
+
+    def _cancelar_busqueda(self):
+        """Descarta la búsqueda programada y cualquier resultado en vuelo"""
+        if self._after_busqueda is not None:
+            self.after_cancel(self._after_busqueda)
+            self._after_busqueda = None
+        self._generacion += 1
 
     def _show_suggestions(self):
+        self._after_busqueda = None
+        self._generacion += 1
+        generacion = self._generacion
         query = self.get().strip()
         if not query or len(query) < 1:  # Reducido a 1 carácter para mejor UX
             self._hide_listbox()
             return
-        suggestions = self.suggestions_callback(query)
+        _ejecutor_busquedas.submit(self._buscar_en_hilo, generacion, query)
+
+    def _buscar_en_hilo(self, generacion: int, query: str):
+        """Se ejecuta fuera del hilo de Tk; el resultado vuelve con after()"""
+        if generacion != self._generacion:
+            return
+        try:
+            suggestions = self.suggestions_callback(query)
+        except Exception as e:
+            logger.error(f"Error en búsqueda de sugerencias: {e}")
+            suggestions = []
+        try:
+            self.after(0, self._mostrar_sugerencias, generacion, suggestions)
+        except (RuntimeError, tk.TclError):
+            pass  # El widget se destruyó mientras buscábamos
+
+    def _mostrar_sugerencias(self, generacion: int, suggestions: List[Dict]):
+        if generacion != self._generacion:
+            return  # Resultado obsoleto: llegó otra pulsación después
         if not suggestions:
             self._hide_listbox()
             return
@@ -237,6 +293,8 @@ class AutoCompleteEntry(ttk.Entry):
             self.listbox = None
 
     def _on_focus_out(self, event):
+        if self.listbox is None:
+            self._cancelar_busqueda()
         self.after(150, self._hide_listbox)
 
     def _on_down(self, event):
@@ -254,6 +312,7 @@ class AutoCompleteEntry(ttk.Entry):
             return "break"
 
     def _on_return(self, event):
+        self._cancelar_busqueda()
         if self.listbox and self.listbox.winfo_ismapped() and self.listbox.curselection():
             self._on_listbox_select(event)
             return "break"
@@ -266,6 +325,7 @@ class AutoCompleteEntry(ttk.Entry):
             return "break"
 
     def _on_escape(self, event):
+        self._cancelar_busqueda()
         self._hide_listbox()
 
     def _on_listbox_select(self, event):
@@ -289,7 +349,16 @@ class NuevaVentaFrame(ttk.Frame):
     
     def __init__(self, master: Optional[tk.Misc] = None) -> None:
         super().__init__(master)
-        self.items: List[VentaItem] = []
+        # Carrito: producto_id -> VentaItem (orden de carga) y fila del Treeview de cada uno
+        self.items: "OrderedDict[Any, VentaItem]" = OrderedDict()
+        self._iid_por_producto: Dict[Any, str] = {}
+        self._producto_por_iid: Dict[str, Any] = {}
+        # Totales mantenidos al agregar/editar/quitar (no se re-suman)
+        self._total_unidades = 0
+        self._total_importe = Decimal('0.00')
+        # Reserva de stock del carrito abierto (se toma al cobrar, ver _reservar_stock)
+        self._carrito = uuid.uuid4().hex
+        self._reserva_activa = False
         
         # Referencia a la App principal para acceder al caché
         self.app_root = self.winfo_toplevel()
@@ -300,7 +369,11 @@ class NuevaVentaFrame(ttk.Frame):
         self._bind_advanced_shortcuts()
         self.lector_activo = True
         self.buffer_lector = ""
+        # Códigos leídos mientras la app recarga los cachés (se procesan al terminar)
+        self._codigos_en_espera: List[str] = []
         self.bind('<Key>', self._capturar_lector_barras)
+        if hasattr(self.app_root, 'sincronizando'):
+            self.app_root.bind('<<CachesActualizados>>', self._on_caches_actualizados, add='+')
         
         # Cargar los productos desde el caché principal la primera vez
         self._actualizar_cache_productos()
@@ -321,6 +394,18 @@ class NuevaVentaFrame(ttk.Frame):
             logger.error(f"Error actualizando cache de productos desde app_root: {e}")
             self._productos_cache = []
 
+        # El índice lo mantiene la app principal; si no existe, construimos uno local
+        indice = getattr(self.app_root, 'indice_productos', None)
+        if indice is None:
+            indice = IndiceProductos(self._productos_cache)
+        self._indice = indice
+
+    def _get_indice(self) -> IndiceProductos:
+        """Índice de productos sincronizado con el caché"""
+        if not hasattr(self, '_indice'):
+            self._actualizar_cache_productos()
+        return self._indice
+
     def _get_productos_fresh(self):
         """Obtiene productos frescos (Ahora lee de la variable local sincronizada con el caché)"""
         # Si el caché local está vacío (ej. al inicio), intenta cargarlo
@@ -337,7 +422,18 @@ class NuevaVentaFrame(ttk.Frame):
             codigo = self.buffer_lector.strip()
             self.buffer_lector = ""
             if len(codigo) >= 3:
-                self._procesar_codigo_barras(codigo)
+                if getattr(self.app_root, 'sincronizando', False):
+                    self._codigos_en_espera.append(codigo)
+                    self._actualizar_status(f"Actualizando productos... código en espera: {codigo}")
+                else:
+                    self._procesar_codigo_barras(codigo)
+
+    def _on_caches_actualizados(self, event=None):
+        """La app terminó de recargar: tomar el caché nuevo y vaciar los códigos en espera"""
+        self._actualizar_cache_productos()
+        pendientes, self._codigos_en_espera = self._codigos_en_espera, []
+        for codigo in pendientes:
+            self._procesar_codigo_barras(codigo)
 
     def _obtener_punto_venta(self) -> int:
         try:
@@ -547,27 +643,8 @@ class NuevaVentaFrame(ttk.Frame):
             if not query or len(query) < 1:
                 return []
                 
-            productos = self._get_productos_fresh()
-            query_lower = query.lower().strip()
-            resultados = []
-            
-            for prod in productos:
-                if not prod.get('activo', True):
-                    continue
-                    
-                nombre_match = query_lower in prod['nombre'].lower()
-                codigo_match = query_lower in prod.get('codigo_barras', '').lower()
-                
-                if nombre_match or codigo_match:
-                    resultados.append(prod)
-            
-            resultados.sort(key=lambda p: (
-                query_lower == p.get('codigo_barras', '').lower(),
-                query_lower in p['nombre'].lower(),
-                p['nombre'].lower().startswith(query_lower)
-            ), reverse=True)
-            
-            return resultados[:10]
+            # Índice precalculado (trigramas + prefijos): top-10 sin recorrer el catálogo
+            return self._get_indice().buscar(query, limite=10)
             
         except Exception as e:
             logger.error(f"Error en búsqueda: {e}")
@@ -583,30 +660,14 @@ class NuevaVentaFrame(ttk.Frame):
                 
             self._actualizar_status(f"Buscando: {entrada}")
             
-            producto_encontrado = None
-            productos = self._get_productos_fresh()
-            
-            for prod in productos:
-                if not prod.get('activo', True):
-                    continue
-                    
-                codigo_barras = prod.get('codigo_barras', '').strip()
-                if codigo_barras and codigo_barras == entrada:
-                    producto_encontrado = prod
-                    break
-                    
-                if prod['nombre'].strip().lower() == entrada.lower():
-                    producto_encontrado = prod
-                    break
+            producto_encontrado = self._get_indice().buscar_exacto(entrada)
+            if producto_encontrado and not producto_encontrado.get('activo', True):
+                producto_encontrado = None
             
             if not producto_encontrado:
-                for prod in productos:
-                    if not prod.get('activo', True):
-                        continue
-                        
-                    if entrada.lower() in prod['nombre'].lower():
-                        producto_encontrado = prod
-                        break
+                coincidencias = self._get_indice().buscar(entrada, limite=1)
+                if coincidencias:
+                    producto_encontrado = coincidencias[0]
             
             if not producto_encontrado:
                 self._actualizar_status(f"Producto no encontrado: {entrada}")
@@ -647,16 +708,9 @@ class NuevaVentaFrame(ttk.Frame):
         if not self.lector_activo:
             return
         try:
-            producto_encontrado = None
-            productos = self._get_productos_fresh()
-            
-            for prod in productos:
-                if (prod.get('codigo_barras') == codigo and 
-                    prod.get('activo', True)):
-                    producto_encontrado = prod
-                    break
+            producto_encontrado = self._get_indice().buscar_codigo(codigo)
             
-            if producto_encontrado:
+            if producto_encontrado and producto_encontrado.get('activo', True):
                 self._agregar_producto_desde_datos(producto_encontrado, 1)
                 self._actualizar_status(f"Escaneado: {producto_encontrado['nombre']}")
             else:
@@ -697,47 +751,84 @@ class NuevaVentaFrame(ttk.Frame):
 
     def _agregar_item(self, item: VentaItem):
         """Agregar item a la venta, actualizando cantidad si ya existe"""
-        for existing_item in self.items:
-            if existing_item.producto_id == item.producto_id:
-                existing_item.cantidad += item.cantidad
-                self._actualizar_treeview()
-                self._actualizar_totales()
-                self._actualizar_status(f"Cantidad actualizada: {existing_item.nombre}")
-                return
+        existente = self.items.get(item.producto_id)
+        if existente is not None:
+            self._cambiar_cantidad(existente, existente.cantidad + item.cantidad)
+            self._actualizar_status(f"Cantidad actualizada: {existente.nombre}")
+            return
                 
-        self.items.append(item)
-        self._actualizar_treeview()
+        self.items[item.producto_id] = item
+        # Usamos los tags 'even' y 'odd' que ahora heredan del tema
+        zebra = 'even' if len(self.items) % 2 == 1 else 'odd'
+        iid = self.tree.insert('', tk.END, values=self._valores_fila(item), tags=self._tags_fila(item, zebra))
+        self._iid_por_producto[item.producto_id] = iid
+        self._producto_por_iid[iid] = item.producto_id
+        self._total_unidades += item.cantidad
+        self._total_importe += item.subtotal
         self._actualizar_totales()
         self._actualizar_status(f"Agregado: {item.nombre}")
 
-    def _actualizar_treeview(self):
-        """Actualizar la tabla de productos en venta"""
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-            
-        for idx, item in enumerate(self.items):
-            # Usamos los tags 'even' y 'odd' que ahora heredan del tema
-            tags = ['even' if idx % 2 == 0 else 'odd']
-            
-            if not item.tiene_stock:
-                tags.append('sin_stock')
-            elif item.stock < 5:  # Stock bajo
-                tags.append('bajo_stock')
-                
-            values = (
-                item.codigo_barras,
-                item.nombre,
-                item.cantidad,
-                money(item.precio),
-                money(item.subtotal),
-                item.stock
-            )
-            self.tree.insert('', tk.END, values=values, tags=tags)
+    def _cambiar_cantidad(self, item: VentaItem, cantidad: int):
+        """Cambia la cantidad de un item: solo se toca su fila y la diferencia en los totales"""
+        subtotal_anterior = item.subtotal
+        self._total_unidades += cantidad - item.cantidad
+        item.cantidad = cantidad
+        self._total_importe += item.subtotal - subtotal_anterior
+
+        iid = self._iid_por_producto[item.producto_id]
+        zebra = self.tree.item(iid, 'tags')[0]
+        self.tree.item(iid, values=self._valores_fila(item), tags=self._tags_fila(item, zebra))
+        self._actualizar_totales()
+
+    def _quitar_item(self, item: VentaItem):
+        del self.items[item.producto_id]
+        iid = self._iid_por_producto.pop(item.producto_id)
+        del self._producto_por_iid[iid]
+        self.tree.delete(iid)
+        self._total_unidades -= item.cantidad
+        self._total_importe -= item.subtotal
+        self._actualizar_totales()
+
+    def _vaciar_carrito(self):
+        self._liberar_reserva()
+        self._carrito = uuid.uuid4().hex
+        self.items.clear()
+        self._iid_por_producto.clear()
+        self._producto_por_iid.clear()
+        self.tree.delete(*self.tree.get_children())
+        self._total_unidades = 0
+        self._total_importe = Decimal('0.00')
+        self._actualizar_totales()
+
+    def _item_seleccionado(self) -> Optional[VentaItem]:
+        seleccion = self.tree.selection()
+        if not seleccion:
+            return None
+        return self.items.get(self._producto_por_iid.get(seleccion[0]))
+
+    @staticmethod
+    def _valores_fila(item: VentaItem) -> tuple:
+        return (
+            item.codigo_barras,
+            item.nombre,
+            item.cantidad,
+            money(item.precio),
+            money(item.subtotal),
+            item.stock
+        )
+
+    @staticmethod
+    def _tags_fila(item: VentaItem, zebra: str) -> tuple:
+        if not item.tiene_stock:
+            return (zebra, 'sin_stock')
+        if item.stock < 5:  # Stock bajo
+            return (zebra, 'bajo_stock')
+        return (zebra,)
 
     def _actualizar_totales(self):
-        """Actualizar los totales de la venta"""
-        total_items = sum(item.cantidad for item in self.items)
-        subtotal = sum(float(item.subtotal) for item in self.items)
+        """Actualizar los totales de la venta (mantenidos incrementalmente)"""
+        total_items = self._total_unidades
+        subtotal = self._total_importe
         total = subtotal
         
         self.lbl_items.config(text=f"Items: {total_items}")
@@ -797,49 +888,33 @@ class NuevaVentaFrame(ttk.Frame):
 
     def _menu_editar_cantidad(self):
         """Editar cantidad del item seleccionado"""
-        seleccion = self.tree.selection()
-        if not seleccion:
+        item = self._item_seleccionado()
+        if item is None:
             self._actualizar_status("Seleccione un producto para editar")
             return
             
-        idx = self.tree.index(seleccion[0])
-        if 0 <= idx < len(self.items):
-            item = self.items[idx]
-            nueva_cantidad = tk.simpledialog.askinteger(
-                "Editar cantidad", 
-                f"Nueva cantidad para {item.nombre}:", 
-                parent=self, 
-                initialvalue=item.cantidad, 
-                minvalue=1
-            )
-            if nueva_cantidad:
-                item.cantidad = nueva_cantidad
-                self._actualizar_treeview()
-                self._actualizar_totales()
-                self._actualizar_status(f"Cantidad actualizada: {item.nombre}")
+        nueva_cantidad = tk.simpledialog.askinteger(
+            "Editar cantidad", 
+            f"Nueva cantidad para {item.nombre}:", 
+            parent=self, 
+            initialvalue=item.cantidad, 
+            minvalue=1
+        )
+        if nueva_cantidad:
+            self._cambiar_cantidad(item, nueva_cantidad)
+            self._actualizar_status(f"Cantidad actualizada: {item.nombre}")
 
     def _menu_aumentar_1(self):
         """Aumentar cantidad en 1 del item seleccionado"""
-        seleccion = self.tree.selection()
-        if not seleccion:
-            return
-        idx = self.tree.index(seleccion[0])
-        if 0 <= idx < len(self.items):
-            self.items[idx].cantidad += 1
-            self._actualizar_treeview()
-            self._actualizar_totales()
+        item = self._item_seleccionado()
+        if item is not None:
+            self._cambiar_cantidad(item, item.cantidad + 1)
 
     def _menu_disminuir_1(self):
         """Disminuir cantidad en 1 del item seleccionado"""
-        seleccion = self.tree.selection()
-        if not seleccion:
-            return
-        idx = self.tree.index(seleccion[0])
-        if 0 <= idx < len(self.items):
-            if self.items[idx].cantidad > 1:
-                self.items[idx].cantidad -= 1
-                self._actualizar_treeview()
-                self._actualizar_totales()
+        item = self._item_seleccionado()
+        if item is not None and item.cantidad > 1:
+            self._cambiar_cantidad(item, item.cantidad - 1)
 
     def _menu_eliminar_item(self):
         """Eliminar item seleccionado"""
@@ -847,12 +922,8 @@ class NuevaVentaFrame(ttk.Frame):
 
     def _menu_ver_info(self):
         """Mostrar información del producto seleccionado"""
-        seleccion = self.tree.selection()
-        if not seleccion:
-            return
-        idx = self.tree.index(seleccion[0])
-        if 0 <= idx < len(self.items):
-            item = self.items[idx]
+        item = self._item_seleccionado()
+        if item is not None:
             info = f"""
             Información del Producto:
             
@@ -869,18 +940,13 @@ class NuevaVentaFrame(ttk.Frame):
 
     def _eliminar_seleccionado(self):
         """Eliminar el item seleccionado de la venta"""
-        seleccion = self.tree.selection()
-        if not seleccion:
+        item = self._item_seleccionado()
+        if item is None:
             self._actualizar_status("Seleccione un item para eliminar")
             return
             
-        idx = self.tree.index(seleccion[0])
-        if 0 <= idx < len(self.items):
-            item = self.items[idx]
-            self.items.pop(idx)
-            self._actualizar_treeview()
-            self._actualizar_totales()
-            self._actualizar_status(f"Eliminado: {item.nombre}")
+        self._quitar_item(item)
+        self._actualizar_status(f"Eliminado: {item.nombre}")
 
     def _limpiar_venta(self):
         """Limpiar toda la venta"""
@@ -891,9 +957,7 @@ class NuevaVentaFrame(ttk.Frame):
         if self.items and not messagebox.askyesno("Limpiar venta", "¿Está seguro de que desea limpiar toda la venta?"):
             return
 
-        self.items.clear()
-        self._actualizar_treeview()
-        self._actualizar_totales()
+        self._vaciar_carrito()
         self._actualizar_status("Venta limpiada")
         self.entry_codigo.focus()
 
@@ -903,56 +967,53 @@ class NuevaVentaFrame(ttk.Frame):
             messagebox.showwarning("Venta vacía", "No hay productos en la venta")
             return
             
-        # Verificar stock
-        sin_stock = []
-        for item in self.items:
-            if item.stock < item.cantidad:
-                sin_stock.append({
-                    'item': item,
-                    'stock_actual': item.stock,
-                    'cantidad_solicitada': item.cantidad
-                })
-                
-        if sin_stock:
-            productos_sin_stock = "\n".join([
-                f"- {item['item'].nombre}: Stock {item['stock_actual']}, Solicitado {item['cantidad_solicitada']}" 
-                for item in sin_stock
-            ])
-            if not messagebox.askyesno(
-                "Stock insuficiente", 
-                f"Los siguientes productos no tienen stock suficiente:\n\n{productos_sin_stock}\n\n¿Desea continuar igualmente?"
-            ):
-                return
+        items_payload = [
+            {
+                "producto_id": item.producto_id,
+                "cantidad": item.cantidad,
+                "precio": float(item.precio),
+                "nombre": item.nombre
+            }
+            for item in self.items.values()
+        ]
+
+        # Verificar stock contra la BD y retenerlo mientras se cobra
+        if not self._reservar_stock(items_payload):
+            return
                 
         # Calcular total y mostrar diálogo de pago
-        total = sum(float(item.subtotal) for item in self.items)
-        dialogo_pago = PagoDialog(self, Decimal(total))
+        dialogo_pago = PagoDialog(self, self._total_importe)
         self.wait_window(dialogo_pago)
         
         if not dialogo_pago.resultado:
+            self._liberar_reserva()
             return
             
         try:
-            # Preparar datos para la venta
-            items_payload = [
-                {
-                    "producto_id": item.producto_id,
-                    "cantidad": item.cantidad,
-                    "precio": float(item.precio),
-                    "nombre": item.nombre
-                }
-                for item in self.items
-            ]
-            
-            # --- CREAR VENTA (Esto es bloqueante y DEBE SERLO) ---
-            # Aquí se descuenta el stock de la BD
-            venta_id = VentaRepo.crear_venta(
+            venta = dict(
                 punto_venta_id=self.punto_venta_id,
                 items=items_payload,
                 forma_pago=dialogo_pago.resultado["forma_pago"],
                 monto_recibido=dialogo_pago.resultado["monto_recibido"],
-                vuelto=dialogo_pago.resultado["vuelto"]
+                vuelto=dialogo_pago.resultado["vuelto"],
+                carrito=self._carrito if self._reserva_activa else None
             )
+            encolada = VENTAS_ASINCRONAS
+            if not encolada:
+                try:
+                    # --- CREAR VENTA (Esto es bloqueante y DEBE SERLO) ---
+                    # Aquí se descuenta el stock de la BD (consume la reserva)
+                    venta_id = VentaRepo.crear_venta(**venta)
+                except Exception as e:
+                    if not (MODO_OFFLINE and es_error_de_conexion(e)):
+                        raise
+                    # Sin servidor: se encola y se concilia cuando vuelva la conexión
+                    logger.warning(f"Sin conexión al crear la venta, queda en el diario local: {e}")
+                    encolada = True
+            if encolada:
+                venta_id = self._encolar_venta(venta)
+            # La reserva ya la consumió la venta (o la consume el envío del diario)
+            self._reserva_activa = False
             
             # Guardar copia para el ticket
             items_para_ticket = [
@@ -990,10 +1051,14 @@ class NuevaVentaFrame(ttk.Frame):
             self._limpiar_venta()
             
             # --- 4. ACTUALIZAR CACHÉ CENTRAL ---
-            # Le decimos a la app principal que recargue todos los datos
-            # porque el stock y el historial de ventas han cambiado.
-            if hasattr(self.app_root, 'refresh_all_caches_and_tabs'):
-                self.app_root.refresh_all_caches_and_tabs()
+            # Solo traemos lo que cambió (stock de los productos vendidos y
+            # la venta nueva); la recarga completa queda para F5. En modo
+            # asíncrono la app sincroniza cuando el envío confirma la venta.
+            if not encolada:
+                if hasattr(self.app_root, 'refresh_incremental'):
+                    self.app_root.refresh_incremental()
+                elif hasattr(self.app_root, 'refresh_all_caches_and_tabs'):
+                    self.app_root.refresh_all_caches_and_tabs()
             
         except ValueError as e:
             logger.error(f"Error de stock en venta: {e}")
@@ -1002,6 +1067,76 @@ class NuevaVentaFrame(ttk.Frame):
             logger.error(f"Error finalizando venta: {e}")
             messagebox.showerror("Error", f"No se pudo procesar la venta: {e}")
 
+    def _reservar_stock(self, items: List[Dict[str, Any]]) -> bool:
+        """
+        Reserva en la BD el stock del carrito (VentaRepo.reservar_stock).
+        False si algún producto no alcanza: se avisa y se muestra lo
+        disponible en cada fila. Sin servidor se sigue sin reserva.
+        Con VENTAS_ASINCRONAS no se reserva: la venta va al diario sin
+        esperar a la BD (y sin controlar stock), así que no se bloquea el
+        cobro con una consulta al servidor.
+        """
+        if VENTAS_ASINCRONAS:
+            return True
+        try:
+            VentaRepo.reservar_stock(self._carrito, items)
+            self._reserva_activa = True
+            return True
+        except StockInsuficienteError as e:
+            for linea in e.lineas:
+                item = self.items.get(linea["producto_id"])
+                if item is not None:
+                    item.stock = linea["disponible"]
+                    self._cambiar_cantidad(item, item.cantidad)  # repinta la fila
+            messagebox.showwarning("Stock insuficiente", f"{e}\n\nAjuste las cantidades para continuar.")
+            return False
+        except Exception as e:
+            if MODO_OFFLINE and es_error_de_conexion(e):
+                logger.warning(f"Sin conexión al reservar stock, se sigue sin reserva: {e}")
+                return True
+            logger.error(f"Error reservando stock: {e}")
+            messagebox.showerror("Error", f"No se pudo verificar el stock: {e}")
+            return False
+
+    def _liberar_reserva(self):
+        """Descarta en segundo plano la reserva del carrito (si no, vence sola)"""
+        if not self._reserva_activa:
+            return
+        self._reserva_activa = False
+        carrito = self._carrito
+
+        def liberar():
+            try:
+                VentaRepo.liberar_reserva(carrito)
+            except Exception as e:
+                logger.warning(f"No se pudo liberar la reserva {carrito}: {e}")
+
+        threading.Thread(target=liberar, daemon=True).start()
+
+    def _encolar_venta(self, venta: Dict) -> str:
+        """
+        Deja la venta en el diario local (en disco) para que se envíe a la BD
+        en segundo plano y descuenta el stock en el caché y el espejo local.
+        Devuelve el número local que lleva el ticket.
+        """
+        from diario_ventas import get_envio_ventas
+        clave = get_envio_ventas().encolar(dict(venta, fecha=datetime.datetime.now()))
+
+        indice = self._get_indice()
+        for it in venta["items"]:
+            producto = indice.buscar_id(it["producto_id"])
+            if producto is not None:
+                producto["stock"] = producto.get("stock", 0) - it["cantidad"]
+        if MODO_OFFLINE:
+            try:
+                from espejo_local import get_espejo
+                get_espejo().descontar_stock(venta["items"])
+            except Exception as e:
+                logger.error(f"No se pudo descontar stock en el espejo local: {e}")
+        if hasattr(self.app_root, 'refresh_tabs_from_cache'):
+            self.app_root.refresh_tabs_from_cache({"productos"})
+        return f"L-{clave[:8].upper()}"
+
     def _generar_y_mostrar_pdf_en_hilo(self, venta_id: int, items: List[VentaItem], datos_pago: Dict):
         """
         Esta función se ejecuta en un hilo separado para no congelar la UI.
@@ -1037,7 +1172,11 @@ class NuevaVentaFrame(ttk.Frame):
             "TRANSFERENCIA": "TRANSFERENCIA"
         }
 
-        if PDF_ENGINE == "reportlab":
+        motor = _cargar_motor_pdf()
+        if motor == "reportlab":
+            from reportlab.lib.pagesizes import A4
+            from reportlab.lib.units import mm
+            from reportlab.pdfgen import canvas as rl_canvas
             c = rl_canvas.Canvas(abs_path, pagesize=A4)
             width, height = A4
             margin = 20 * mm
@@ -1096,7 +1235,8 @@ class NuevaVentaFrame(ttk.Frame):
             c.drawCentredString(width / 2, y, "*** GRACIAS POR SU COMPRA ***")
             c.save()
 
-        elif PDF_ENGINE == "fpdf":
+        elif motor == "fpdf":
+            from fpdf import FPDF
             pdf = FPDF(unit="mm", format="A4")
             pdf.add_page()
             pdf.set_auto_page_break(auto=True, margin=15)
@@ -1156,8 +1296,9 @@ class BusquedaAvanzadaDialog(tk.Toplevel):
     def __init__(self, parent):
         super().__init__(parent)
         self.parent = parent
-        # Referencia a la app principal para el caché
-        self.app_root = self.winfo_toplevel()
+        # Referencia a la app principal para el caché (el toplevel del padre,
+        # no este diálogo)
+        self.app_root = parent.winfo_toplevel()
         self.producto_seleccionado = None
         self.title("🔍 Búsqueda Avanzada de Productos")
         self.geometry("620x420")
@@ -1217,6 +1358,8 @@ class BusquedaAvanzadaDialog(tk.Toplevel):
             else:
                 # Fallback
                 self.productos = ProductoRepo.listar()
+            indice = getattr(self.app_root, 'indice_productos', None)
+            self.indice = indice if indice is not None else IndiceProductos(self.productos)
             self._mostrar_productos(self.productos)
         except Exception as e:
             messagebox.showerror("Error", f"No se pudieron cargar los productos: {e}")
@@ -1236,18 +1379,12 @@ class BusquedaAvanzadaDialog(tk.Toplevel):
             ))
 
     def _filtrar_productos(self, event=None):
-        query = self.entry_busqueda.get().lower().strip()
+        query = self.entry_busqueda.get().strip()
         if not query:
             self._mostrar_productos(self.productos)
             return
             
-        resultados = []
-        for prod in self.productos:
-            if (query in prod['nombre'].lower() or 
-                query in prod.get('codigo_barras', '').lower()):
-                resultados.append(prod)
-                
-        self._mostrar_productos(resultados)
+        self._mostrar_productos(self.indice.filtrar(query, incluir_categoria=False))
 
     def _seleccionar_producto(self, event=None):
         seleccion = self.tree.selection()
@@ -1341,7 +1478,7 @@ class ListaProductosDialog(BusquedaAvanzadaDialog):
 
 # Ejecución de prueba
 if __name__ == "__main__":
-    if PDF_ENGINE is None:
+    if _cargar_motor_pdf() is None:
         root = tk.Tk()
         root.withdraw()
         message = ("No se detectó ninguna librería para generar PDF.\n\n"
@@ -0,0 +1,36 @@
+"""
+Recalcula el resumen ventas_diarias desde la tabla ventas.
+
+crear_venta lo mantiene al día venta por venta; este comando es para
+cargas masivas, importaciones o correcciones hechas directamente en la BD.
+Conviene correrlo con las cajas cerradas: las ventas que entren mientras
+se recalcula un día pueden quedar fuera de ese día.
+
+Uso:
+    python reconstruir_ventas_diarias.py [--desde AAAA-MM-DD] [--hasta AAAA-MM-DD]
+"""
+import argparse
+import datetime
+import sys
+
+from repos import VentaRepo
+
+
+def _fecha(texto: str) -> datetime.date:
+    return datetime.datetime.strptime(texto, "%Y-%m-%d").date()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recalcula el resumen ventas_diarias")
+    parser.add_argument("--desde", type=_fecha, help="primer día a recalcular (por defecto, el inicio)")
+    parser.add_argument("--hasta", type=_fecha, help="día siguiente al último a recalcular (excluido)")
+    args = parser.parse_args()
+
+    filas = VentaRepo.reconstruir_ventas_diarias(args.desde, args.hasta)
+    rango = f"{args.desde or 'inicio'} a {args.hasta or 'fin'}"
+    print(f"✅ ventas_diarias recalculado ({rango}): {filas} filas (día, forma de pago)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,35 @@
 from typing import List, Dict, Optional, Any
-from config import get_connection
+from config import es_error_de_conexion, MODO_OFFLINE, RESERVA_STOCK_TTL
+from backends import get_backend, get_connection
+import functools
 import time 
 import datetime # Importar datetime para la nueva función
 
+# Límites para rangos de fecha abiertos (válidos en DATETIME de SQL Server)
+_FECHA_MIN = datetime.datetime(1900, 1, 1)
+_FECHA_MAX = datetime.datetime(9999, 12, 31)
+
+class StockInsuficienteError(ValueError):
+    """Una venta o reserva pide más de lo disponible; 'lineas' dice cuáles y cuánto hay."""
+
+    def __init__(self, faltantes):
+        self.lineas = [
+            {"producto_id": producto_id, "nombre": nombre, "cantidad": cantidad, "disponible": disponible}
+            for producto_id, nombre, cantidad, disponible in faltantes
+        ]
+        detalle = "\n".join(
+            f"- {l['nombre'] or l['producto_id']}: disponible {l['disponible']}, solicitado {l['cantidad']}"
+            for l in self.lineas
+        )
+        super().__init__(f"Los siguientes productos no tienen stock suficiente:\n{detalle}")
+
+def _dia(fecha) -> datetime.date:
+    return fecha.date() if isinstance(fecha, datetime.datetime) else fecha
+
+def _es_dia_completo(fecha) -> bool:
+    """True si 'fecha' cae justo a medianoche: el límite sirve para ventas_diarias"""
+    return not isinstance(fecha, datetime.datetime) or fecha.time() == datetime.time()
+
 def _dict_rows(cur) -> List[Dict[str, Any]]:
     cols = [c[0] for c in cur.description]
     return [dict(zip(cols, row)) for row in cur.fetchall()]
@@ -14,8 +41,45 @@ def _dict_one(cur) -> Optional[Dict[str, Any]]:
     cols = [c[0] for c in cur.description]
     return dict(zip(cols, row))
 
+def _sql(consulta: str) -> str:
+    """Completa los marcadores de dialecto ({ahora}, {top}, ...) según el motor activo"""
+    return get_backend().sql(consulta)
+
+def _con_espejo(leer_local=None, guardar=None):
+    """
+    Con MODO_OFFLINE, cada lectura exitosa del servidor se copia al espejo
+    local (guardar, en el hilo del espejo: la lectura no lo espera) y, si el
+    servidor no responde, se lee del espejo (leer_local). Ambas reciben el
+    espejo y los mismos argumentos del método; guardar recibe una copia de
+    las filas, porque el llamador puede modificarlas mientras se escriben.
+    """
+    def decorador(fn):
+        @functools.wraps(fn)
+        def envoltura(*args, **kwargs):
+            if not MODO_OFFLINE or not get_backend().remoto:
+                return fn(*args, **kwargs)
+            from espejo_local import get_espejo
+            try:
+                resultado = fn(*args, **kwargs)
+            except Exception as e:
+                if leer_local is None or not es_error_de_conexion(e):
+                    raise
+                return leer_local(get_espejo(), *args, **kwargs)
+            if guardar is not None:
+                try:
+                    espejo = get_espejo()
+                    filas = [dict(fila) for fila in resultado]
+                    espejo.en_segundo_plano(lambda: guardar(espejo, filas, *args, **kwargs))
+                except Exception as e:
+                    print(f"No se pudo actualizar el espejo local: {e}")
+            return resultado
+        return envoltura
+    return decorador
+
 class CategoriaRepo:
     @staticmethod
+    @_con_espejo(leer_local=lambda espejo: espejo.listar_categorias(),
+                 guardar=lambda espejo, categorias: espejo.guardar_categorias(categorias))
     def listar() -> List[Dict[str, Any]]:
         conn = get_connection()
         try:
@@ -68,6 +132,7 @@ class CategoriaRepo:
             conn.close()
 
     @staticmethod
+    @_con_espejo(leer_local=lambda espejo, categoria_id: espejo.buscar_categoria(categoria_id))
     def buscar_por_id(categoria_id: int) -> Optional[Dict[str, Any]]:
         """Buscar categoría por ID específico"""
         conn = get_connection()
@@ -80,13 +145,16 @@ class CategoriaRepo:
 
 class ProductoRepo:
     @staticmethod
+    @_con_espejo(leer_local=lambda espejo: espejo.listar_productos(),
+                 guardar=lambda espejo, productos: espejo.guardar_productos(productos))
     def listar() -> List[Dict[str, Any]]:
         conn = get_connection()
         try:
             cur = conn.cursor()
             cur.execute("""
                 SELECT p.id, p.codigo_barras, p.nombre, p.precio, p.stock, 
-                       ISNULL(c.nombre,'') AS categoria, p.activo, p.categoria_id
+                       COALESCE(c.nombre, '') AS categoria, p.activo, p.categoria_id,
+                       p.fecha_modificacion
                 FROM productos p
                 LEFT JOIN categorias c ON p.categoria_id = c.id
                 ORDER BY p.nombre
@@ -95,6 +163,32 @@ class ProductoRepo:
         finally:
             conn.close()
 
+    @staticmethod
+    @_con_espejo(leer_local=lambda espejo, *args: [],
+                 guardar=lambda espejo, cambios, *args: espejo.guardar_productos(cambios, completo=False))
+    def listar_cambios(desde_fecha, desde_id: int) -> List[Dict[str, Any]]:
+        """
+        Productos modificados desde 'desde_fecha' (fecha_modificacion) o
+        creados después de 'desde_id'. Mismas columnas que listar().
+        Quien sincroniza pide con un margen antes de su marca de agua, así que
+        puede recibir otra vez productos que ya tenía.
+        """
+        conn = get_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT p.id, p.codigo_barras, p.nombre, p.precio, p.stock, 
+                       COALESCE(c.nombre, '') AS categoria, p.activo, p.categoria_id,
+                       p.fecha_modificacion
+                FROM productos p
+                LEFT JOIN categorias c ON p.categoria_id = c.id
+                WHERE p.fecha_modificacion >= ? OR p.id > ?
+                ORDER BY p.nombre
+            """, (desde_fecha, desde_id))
+            return _dict_rows(cur)
+        finally:
+            conn.close()
+
     @staticmethod
     def listar_para_reporte() -> List[Dict[str, Any]]:
         """
@@ -106,7 +200,7 @@ class ProductoRepo:
             cur.execute("""
                 SELECT 
                     p.id, p.codigo_barras, p.nombre, p.precio, p.stock, 
-                    ISNULL(c.nombre,'') AS categoria, p.activo,
+                    COALESCE(c.nombre, '') AS categoria, p.activo,
                     -- Lógica de estado movida a SQL con CASE --
                     CASE
                         WHEN p.stock = 0 THEN '❌ Agotado'
@@ -123,6 +217,7 @@ class ProductoRepo:
             conn.close()
 
     @staticmethod
+    @_con_espejo(leer_local=lambda espejo, texto: espejo.buscar_producto_por_texto(texto))
     def buscar(codigo_o_nombre: str) -> Optional[Dict[str, Any]]:
         conn = get_connection()
         try:
@@ -137,6 +232,7 @@ class ProductoRepo:
             conn.close()
 
     @staticmethod
+    @_con_espejo(leer_local=lambda espejo, producto_id: espejo.buscar_producto(producto_id))
     def buscar_por_id(producto_id: int) -> Optional[Dict[str, Any]]:
         """Buscar producto por ID específico"""
         conn = get_connection()
@@ -145,7 +241,7 @@ class ProductoRepo:
             cur.execute("""
                 SELECT p.id, p.codigo_barras, p.nombre, p.precio, p.stock, 
                        p.stock_minimo, p.proveedor, p.activo, p.categoria_id,
-                       ISNULL(c.nombre, '') AS categoria
+                       COALESCE(c.nombre, '') AS categoria
                 FROM productos p
                 LEFT JOIN categorias c ON p.categoria_id = c.id
                 WHERE p.id = ?
@@ -157,6 +253,20 @@ class ProductoRepo:
         finally:
             conn.close()
 
+    @staticmethod
+    def stock_por_ids(ids) -> Dict[int, int]:
+        """Stock actual de varios productos activos en una sola consulta: {id: stock}"""
+        conn = get_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute(_sql("""
+                SELECT id, stock FROM productos
+                WHERE id IN ({ids_json}) AND activo = 1
+            """), (get_backend().lista_json(ids),))
+            return {fila[0]: fila[1] for fila in cur.fetchall()}
+        finally:
+            conn.close()
+
     @staticmethod
     def agregar(nombre, precio, stock, categoria_id=None, codigo=None):
         if not codigo: 
@@ -164,10 +274,10 @@ class ProductoRepo:
 
         with get_connection() as conn:
             cur = conn.cursor()
-            cur.execute("""
-                INSERT INTO productos (codigo_barras, nombre, precio, stock, categoria_id)
-                VALUES (?, ?, ?, ?, ?)
-            """, (codigo, nombre, precio, stock, categoria_id))
+            cur.execute(_sql("""
+                INSERT INTO productos (codigo_barras, nombre, precio, stock, categoria_id, fecha_modificacion)
+                VALUES (?, ?, ?, ?, ?, {ahora})
+            """), (codigo, nombre, precio, stock, categoria_id))
             conn.commit()
 
     @staticmethod
@@ -175,7 +285,7 @@ class ProductoRepo:
         conn = get_connection()
         try:
             cur = conn.cursor()
-            cur.execute("UPDATE productos SET precio = ?, fecha_modificacion = GETDATE() WHERE id = ?", (nuevo_precio, producto_id))
+            cur.execute(_sql("UPDATE productos SET precio = ?, fecha_modificacion = {ahora} WHERE id = ?"), (nuevo_precio, producto_id))
             conn.commit()
         finally:
             conn.close()
@@ -184,47 +294,28 @@ class ProductoRepo:
     def actualizar_completo(producto_id: int, nombre: str, precio: float, codigo_barras: str = None,
                           categoria_id: int = None, stock: int = None, stock_minimo: int = None,
                           proveedor: str = None, activo: bool = True):
-        """Actualizar todos los campos de un producto"""
+        """
+        Actualizar todos los campos de un producto. Los argumentos en None
+        conservan el valor actual (una sola sentencia fija con COALESCE).
+        """
         conn = get_connection()
         try:
             cur = conn.cursor()
-            
-            campos = []
-            valores = []
-            
-            if nombre is not None:
-                campos.append("nombre = ?")
-                valores.append(nombre)
-            if precio is not None:
-                campos.append("precio = ?")
-                valores.append(precio)
-            if codigo_barras is not None:
-                campos.append("codigo_barras = ?")
-                valores.append(codigo_barras)
-            if categoria_id is not None:
-                campos.append("categoria_id = ?")
-                valores.append(categoria_id)
-            if stock is not None:
-                campos.append("stock = ?")
-                valores.append(stock)
-            if stock_minimo is not None:
-                campos.append("stock_minimo = ?")
-                valores.append(stock_minimo)
-            if proveedor is not None:
-                campos.append("proveedor = ?")
-                valores.append(proveedor)
-            if activo is not None:
-                campos.append("activo = ?")
-                valores.append(activo)
-            
-            campos.append("fecha_modificacion = GETDATE()")
-            
-            valores.append(producto_id)
-            
-            if campos:
-                query = f"UPDATE productos SET {', '.join(campos)} WHERE id = ?"
-                cur.execute(query, valores)
-                conn.commit()
+            cur.execute(_sql("""
+                UPDATE productos SET
+                    nombre = COALESCE(?, nombre),
+                    precio = COALESCE(?, precio),
+                    codigo_barras = COALESCE(?, codigo_barras),
+                    categoria_id = COALESCE(?, categoria_id),
+                    stock = COALESCE(?, stock),
+                    stock_minimo = COALESCE(?, stock_minimo),
+                    proveedor = COALESCE(?, proveedor),
+                    activo = COALESCE(?, activo),
+                    fecha_modificacion = {ahora}
+                WHERE id = ?
+            """), (nombre, precio, codigo_barras, categoria_id, stock, stock_minimo,
+                  proveedor, activo, producto_id))
+            conn.commit()
                 
         except Exception as e:
             conn.rollback()
@@ -238,11 +329,11 @@ class ProductoRepo:
         conn = get_connection()
         try:
             cur = conn.cursor()
-            cur.execute("""
+            cur.execute(_sql("""
                 UPDATE productos 
-                SET stock = ?, fecha_modificacion = GETDATE() 
+                SET stock = ?, fecha_modificacion = {ahora} 
                 WHERE id = ?
-            """, (nuevo_stock, producto_id))
+            """), (nuevo_stock, producto_id))
             conn.commit()
         except Exception as e:
             conn.rollback()
@@ -253,6 +344,8 @@ class ProductoRepo:
 # ----------------- Puntos de Venta -----------------
 class PuntoVentaRepo:
     @staticmethod
+    @_con_espejo(leer_local=lambda espejo: espejo.listar_puntos_venta(),
+                 guardar=lambda espejo, puntos: espejo.guardar_puntos_venta(puntos))
     def listar() -> List[Dict[str, Any]]:
         conn = get_connection()
         try:
@@ -275,50 +368,81 @@ class PuntoVentaRepo:
 # ----------------- Ventas -----------------
 class VentaRepo:
     @staticmethod
-    def crear_venta(punto_venta_id: int, items: List[Dict[str, Any]], forma_pago="EFECTIVO", descuento=0.0, **kwargs) -> int:
+    def crear_venta(punto_venta_id: int, items: List[Dict[str, Any]], forma_pago="EFECTIVO", descuento=0.0,
+                    clave_idempotencia: Optional[str] = None, fecha: Optional[datetime.datetime] = None,
+                    carrito: Optional[str] = None, controlar_stock: bool = True, **kwargs) -> int:
         """
-        Crea una venta con sus detalles, descuenta stock e inserta movimientos_stock.
+        Crea una venta con sus detalles, descuenta stock, inserta movimientos_stock
+        y la suma al resumen ventas_diarias (en la misma transacción).
+        Con 'clave_idempotencia', reintentar la misma venta devuelve el id ya
+        creado en lugar de duplicarla. 'fecha' permite registrar la hora real
+        de una venta encolada (por defecto, la hora del servidor).
+        Con 'controlar_stock', si algún producto no tiene disponible suficiente
+        (descontando lo reservado por otros carritos) no se crea nada y se lanza
+        StockInsuficienteError. 'carrito' es la reserva (reservar_stock) que
+        esta venta consume.
         """
+        backend = get_backend()
         conn = get_connection()
         try:
             conn.autocommit = False
             cur = conn.cursor()
 
+            if clave_idempotencia:
+                # El bloqueo serializa dos reintentos simultáneos de la misma clave
+                backend.iniciar_escritura(conn)
+                cur.execute(_sql("""
+                    SELECT venta_id FROM ventas_idempotencia {bloqueo_actualizacion}
+                    WHERE clave = ?
+                """), (clave_idempotencia,))
+                ya_creada = cur.fetchone()
+                if ya_creada:
+                    conn.rollback()
+                    return ya_creada[0]
+
             subtotal = sum(it['cantidad'] * it['precio'] for it in items)
             total = round(subtotal * (1 - descuento/100.0), 2)
 
             # --- CORRECCIÓN ERROR 42S22 ---
             # Asumimos que tu tabla SI tiene 'descuento' pero NO tiene 'punto_venta_id'
             # Si 'descuento' tampoco existe, quítalo de aquí.
-            cur.execute("""
+            cur.execute(_sql("""
                 INSERT INTO ventas (fecha, total, descuento, forma_pago)
-                OUTPUT INSERTED.id
-                VALUES (GETDATE(), ?, ?, ?)
-            """, (total, descuento, forma_pago))
+                {output_id}
+                VALUES (COALESCE(?, {ahora}), ?, ?, ?)
+                {returning_id}
+            """), (fecha, total, descuento, forma_pago))
             venta_id = cur.fetchone()[0]
 
-            for it in items:
-                
-                # Volvemos a la versión simple del INSERT para detalle_venta
-                # Asumimos que tu tabla 'detalle_venta' solo tiene estas 4 columnas:
-                cur.execute("""
-                    INSERT INTO detalle_venta (venta_id, producto_id, cantidad, precio_unitario)
-                    VALUES (?, ?, ?, ?)
-                """, (venta_id, it['producto_id'], it['cantidad'], it['precio']))
-
-           
-                cur.execute("UPDATE productos SET stock = stock - ? WHERE id = ?", (it['cantidad'], it['producto_id']))
-
-             
-                cur.execute("""
-                    INSERT INTO movimientos_stock (producto_id, tipo, cantidad, stock_anterior, stock_nuevo)
-                    VALUES (?, 'VENTA', ?, 
-                        (SELECT stock + ? FROM productos WHERE id=?),
-                        (SELECT stock FROM productos WHERE id=?))
-                """, (it['producto_id'], it['cantidad'], it['cantidad'], it['producto_id'], it['producto_id']))
+            if clave_idempotencia:
+                cur.execute("INSERT INTO ventas_idempotencia (clave, venta_id) VALUES (?, ?)",
+                            (clave_idempotencia, venta_id))
+
+            # Todas las líneas se cargan de una vez en una tabla temporal y el
+            # resto se resuelve con sentencias por conjuntos (un solo batch en SQL Server).
+            backend.cargar_lineas_venta(
+                cur, [(it['producto_id'], it['cantidad'], it['precio']) for it in items]
+            )
+            # Descuento condicional (stock >= cantidad) y movimientos con el stock de antes y después
+            faltantes = backend.descontar_stock(cur, carrito or "", controlar_stock)
+            if controlar_stock and faltantes:
+                raise StockInsuficienteError(faltantes)
+            backend.ejecutar_lote(cur, [
+                ("""
+                INSERT INTO detalle_venta (venta_id, producto_id, cantidad, precio_unitario)
+                SELECT ?, producto_id, cantidad, precio_unitario
+                FROM {lineas}
+                """, (venta_id,)),
+                ("{sumar_venta_diaria}", (venta_id,)),
+                ("DELETE FROM reservas_stock WHERE carrito = ?", (carrito or "",)),
+                ("DROP TABLE {lineas}", ()),
+            ])
 
             conn.commit()
             return venta_id
+        except StockInsuficienteError:
+            conn.rollback()
+            raise
         except Exception as e:
             conn.rollback()
             print(f"ERROR DETALLADO EN crear_venta: {e}") 
@@ -327,44 +451,147 @@ class VentaRepo:
             conn.close()
 
     @staticmethod
+    def reservar_stock(carrito: str, items: List[Dict[str, Any]], ttl: int = RESERVA_STOCK_TTL):
+        """
+        Retiene para el carrito abierto 'carrito' las cantidades de 'items'
+        (reemplaza lo que tuviera reservado) durante 'ttl' segundos: mientras
+        se cobra, otro cajero no puede vender ese stock y la venta no necesita
+        bloquear filas. Si algún producto no alcanza no reserva nada y lanza
+        StockInsuficienteError. crear_venta(carrito=...) consume la reserva.
+        """
+        backend = get_backend()
+        conn = get_connection()
+        try:
+            conn.autocommit = False
+            cur = conn.cursor()
+            backend.iniciar_escritura(conn)
+            cur.execute(_sql("DELETE FROM reservas_stock WHERE carrito = ? OR vence <= {ahora}"), (carrito,))
+            backend.cargar_lineas_venta(cur, [(it['producto_id'], it['cantidad'], it.get('precio', 0)) for it in items])
+            faltantes = backend.stock_faltante(cur, carrito)
+            if faltantes:
+                raise StockInsuficienteError(faltantes)
+            backend.ejecutar_lote(cur, [
+                ("""
+                INSERT INTO reservas_stock (carrito, producto_id, cantidad, vence)
+                SELECT ?, producto_id, SUM(cantidad), {vence_en}
+                FROM {lineas} GROUP BY producto_id
+                """, (carrito, ttl)),
+                ("DROP TABLE {lineas}", ()),
+            ])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    @staticmethod
+    def liberar_reserva(carrito: str):
+        """Descarta la reserva de un carrito que no se vendió"""
+        conn = get_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute("DELETE FROM reservas_stock WHERE carrito = ?", (carrito,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    @staticmethod
+    def reconstruir_ventas_diarias(desde: Optional[datetime.date] = None,
+                                   hasta: Optional[datetime.date] = None) -> int:
+        """
+        Recalcula ventas_diarias desde la tabla ventas para los días [desde, hasta)
+        (por defecto, toda la historia). Para cargas masivas o correcciones
+        hechas por fuera de crear_venta. Devuelve las filas generadas.
+        """
+        desde = desde or _FECHA_MIN.date()
+        hasta = hasta or _FECHA_MAX.date()
+        inicio = datetime.datetime.combine(desde, datetime.time())
+        fin = datetime.datetime.combine(hasta, datetime.time())
+        conn = get_connection()
+        try:
+            get_backend().iniciar_escritura(conn)
+            cur = conn.cursor()
+            cur.execute("DELETE FROM ventas_diarias WHERE dia >= ? AND dia < ?", (desde, hasta))
+            cur.execute(_sql("""
+                INSERT INTO ventas_diarias (dia, forma_pago, cantidad, total)
+                SELECT {dia_fecha}, COALESCE(forma_pago, ''), COUNT(*), SUM(total)
+                FROM ventas
+                WHERE fecha >= ? AND fecha < ?
+                GROUP BY {dia_fecha}, COALESCE(forma_pago, '')
+            """), (inicio, fin))
+            filas = cur.rowcount
+            conn.commit()
+            return filas
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    @staticmethod
+    @_con_espejo(leer_local=lambda espejo, limit=50: espejo.listar_ventas(limit),
+                 guardar=lambda espejo, ventas, limit=50: espejo.guardar_ventas(ventas))
     def listar(limit=50) -> List[Dict[str, Any]]:
         conn = get_connection()
         try:
             cur = conn.cursor()
-            cur.execute("SELECT TOP (?) id, fecha, total, forma_pago FROM ventas ORDER BY fecha DESC", (limit,))
+            cur.execute(_sql("SELECT {top} id, fecha, total, forma_pago FROM ventas ORDER BY fecha DESC {limite}"), (limit,))
             return _dict_rows(cur)
         finally:
             conn.close()
 
     @staticmethod
-    def listar_completo(limit=100) -> List[Dict[str, Any]]:
+    @_con_espejo(leer_local=lambda espejo, *args: [],
+                 guardar=lambda espejo, ventas, *args: espejo.guardar_ventas(ventas))
+    def listar_desde(ultimo_id: int, desde_fecha: Optional[datetime.datetime] = None) -> List[Dict[str, Any]]:
         """
-        Devuelve todas las ventas con su detalle de productos (items).
+        Ventas con id mayor a 'ultimo_id' o con fecha desde 'desde_fecha'
+        (para sincronización incremental; puede repetir ventas ya vistas).
         """
         conn = get_connection()
         try:
             cur = conn.cursor()
-
             cur.execute("""
-                SELECT TOP (?) id, fecha, total, forma_pago
+                SELECT id, fecha, total, forma_pago
+                FROM ventas
+                WHERE id > ? OR fecha >= ?
+                ORDER BY fecha DESC, id DESC
+            """, (ultimo_id, desde_fecha or _FECHA_MAX))
+            return _dict_rows(cur)
+        finally:
+            conn.close()
+
+    @staticmethod
+    def listar_completo(limit=100, desde: Optional[datetime.datetime] = None,
+                        hasta: Optional[datetime.datetime] = None) -> List[Dict[str, Any]]:
+        """
+        Devuelve hasta 'limit' ventas con su detalle de productos (items),
+        de la más reciente a la más antigua.
+        'desde'/'hasta' acotan la fecha al rango [desde, hasta).
+        Para recorrer un rango completo ver recorrer_con_items.
+        """
+        desde = desde or _FECHA_MIN
+        hasta = hasta or _FECHA_MAX
+        conn = get_connection()
+        try:
+            cur = conn.cursor()
+
+            cur.execute(_sql("""
+                SELECT {top} id, fecha, total, forma_pago
                 FROM ventas
-                ORDER BY fecha DESC
-            """, (limit,))
+                WHERE fecha >= ? AND fecha < ?
+                ORDER BY fecha DESC, id DESC
+                {limite}
+            """), get_backend().con_limite(limit, desde, hasta))
             ventas = _dict_rows(cur)
 
             if not ventas:
                 return []
 
-            venta_ids = tuple(v["id"] for v in ventas)
-
-            if len(venta_ids) == 1:
-                params = (venta_ids[0],)
-                where_in = "(?)"
-            else:
-                params = venta_ids
-                where_in = "(" + ",".join("?" * len(venta_ids)) + ")"
-
-            cur.execute(f"""
+            # Los ids viajan como un único parámetro JSON: el texto de la
+            # consulta es el mismo para cualquier cantidad de ventas
+            cur.execute(_sql("""
                 SELECT 
                     dv.venta_id,
                     p.nombre AS producto,
@@ -372,27 +599,177 @@ class VentaRepo:
                     dv.precio_unitario
                 FROM detalle_venta dv
                 INNER JOIN productos p ON p.id = dv.producto_id
-                WHERE dv.venta_id IN {where_in}
+                WHERE dv.venta_id IN ({ids_json})
                 ORDER BY dv.venta_id DESC
-            """, params)
-
-            detalles = _dict_rows(cur)
+            """), (get_backend().lista_json(v["id"] for v in ventas),))
 
+            # Agrupación en una sola pasada: id de venta -> su lista de items
+            items_por_venta = {}
             for venta in ventas:
-                venta["items"] = [
-                    {
-                        "producto": d["producto"],
-                        "cantidad": d["cantidad"],
-                        "precio_unitario": float(d["precio_unitario"])
-                    }
-                    for d in detalles if d["venta_id"] == venta["id"]
-                ]
+                venta["items"] = items_por_venta[venta["id"]] = []
+            for venta_id, producto, cantidad, precio_unitario in cur.fetchall():
+                items_por_venta[venta_id].append({
+                    "producto": producto,
+                    "cantidad": cantidad,
+                    "precio_unitario": float(precio_unitario)
+                })
 
             return ventas
 
         finally:
             conn.close()
 
+    # ----------------- Agregados para reportes (rango [desde, hasta)) -----------------
+    @staticmethod
+    def resumen_periodo(desde: datetime.datetime, hasta: datetime.datetime) -> Dict[str, Any]:
+        """Cantidad de ventas, ingresos y unidades vendidas del período"""
+        conn = get_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT COUNT(*) AS total_ventas,
+                       COALESCE(SUM(v.total), 0) AS ingresos_totales,
+                       (SELECT COALESCE(SUM(dv.cantidad), 0)
+                        FROM detalle_venta dv
+                        INNER JOIN ventas vd ON vd.id = dv.venta_id
+                        WHERE vd.fecha >= ? AND vd.fecha < ?) AS total_productos
+                FROM ventas v
+                WHERE v.fecha >= ? AND v.fecha < ?
+            """, (desde, hasta, desde, hasta))
+            return _dict_one(cur)
+        finally:
+            conn.close()
+
+    @staticmethod
+    def totales_por_producto(desde: datetime.datetime, hasta: datetime.datetime) -> List[Dict[str, Any]]:
+        """Unidades, ingresos y precio promedio por producto, de mayor a menor ingreso"""
+        conn = get_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT p.nombre AS producto,
+                       SUM(dv.cantidad) AS cantidad_total,
+                       SUM(dv.cantidad * dv.precio_unitario) AS ingresos_totales,
+                       SUM(dv.cantidad * dv.precio_unitario) * 1.0 / SUM(dv.cantidad) AS precio_promedio
+                FROM detalle_venta dv
+                INNER JOIN ventas v ON v.id = dv.venta_id
+                INNER JOIN productos p ON p.id = dv.producto_id
+                WHERE v.fecha >= ? AND v.fecha < ?
+                GROUP BY p.id, p.nombre
+                ORDER BY ingresos_totales DESC
+            """, (desde, hasta))
+            return _dict_rows(cur)
+        finally:
+            conn.close()
+
+    @staticmethod
+    def totales_por_forma_pago(desde: datetime.datetime, hasta: datetime.datetime) -> List[Dict[str, Any]]:
+        """
+        Cantidad de ventas e ingresos por forma de pago, de la más usada a la
+        menos usada. Con límites de días completos se lee el resumen
+        ventas_diarias; si alguno tiene hora, se agrupa la tabla ventas.
+        """
+        conn = get_connection()
+        try:
+            cur = conn.cursor()
+            if _es_dia_completo(desde) and _es_dia_completo(hasta):
+                cur.execute("""
+                    SELECT forma_pago, SUM(cantidad) AS cantidad, SUM(total) AS total
+                    FROM ventas_diarias
+                    WHERE dia >= ? AND dia < ?
+                    GROUP BY forma_pago
+                    ORDER BY cantidad DESC
+                """, (_dia(desde), _dia(hasta)))
+            else:
+                cur.execute("""
+                    SELECT COALESCE(forma_pago, '') AS forma_pago, COUNT(*) AS cantidad, SUM(total) AS total
+                    FROM ventas
+                    WHERE fecha >= ? AND fecha < ?
+                    GROUP BY COALESCE(forma_pago, '')
+                    ORDER BY cantidad DESC
+                """, (desde, hasta))
+            return _dict_rows(cur)
+        finally:
+            conn.close()
+
+    @staticmethod
+    def totales_por_dia(desde: datetime.datetime, hasta: datetime.datetime) -> List[Dict[str, Any]]:
+        """
+        Cantidad de ventas e ingresos por día ('dia' como 'YYYY-MM-DD'). Con
+        límites de días completos se lee el resumen ventas_diarias; si alguno
+        tiene hora, se agrupa la tabla ventas.
+        """
+        conn = get_connection()
+        try:
+            cur = conn.cursor()
+            if _es_dia_completo(desde) and _es_dia_completo(hasta):
+                cur.execute("""
+                    SELECT dia, SUM(cantidad) AS cantidad, SUM(total) AS total
+                    FROM ventas_diarias
+                    WHERE dia >= ? AND dia < ?
+                    GROUP BY dia
+                    ORDER BY dia
+                """, (_dia(desde), _dia(hasta)))
+            else:
+                cur.execute(_sql("""
+                    SELECT {dia_fecha} AS dia, COUNT(*) AS cantidad, SUM(total) AS total
+                    FROM ventas
+                    WHERE fecha >= ? AND fecha < ?
+                    GROUP BY {dia_fecha}
+                    ORDER BY dia
+                """), (desde, hasta))
+            filas = _dict_rows(cur)
+            for fila in filas:
+                fila["dia"] = str(fila["dia"])[:10]  # date (SQL Server) o texto (SQLite)
+            return filas
+        finally:
+            conn.close()
+
+    @staticmethod
+    def recorrer_con_items(desde: Optional[datetime.datetime] = None,
+                           hasta: Optional[datetime.datetime] = None,
+                           tam_lote: int = 1000):
+        """
+        Genera las ventas de [desde, hasta) una a una, con sus items, desde un
+        único cursor de solo avance (se leen de a 'tam_lote' filas). En memoria
+        hay solo un lote y la venta en curso, sin importar el tamaño del rango.
+        La conexión queda tomada hasta que se termina (o se cierra) el recorrido.
+        """
+        conn = get_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT v.id, v.fecha, v.total, v.forma_pago,
+                       p.nombre AS producto, dv.cantidad, dv.precio_unitario
+                FROM ventas v
+                LEFT JOIN detalle_venta dv ON dv.venta_id = v.id
+                LEFT JOIN productos p ON p.id = dv.producto_id
+                WHERE v.fecha >= ? AND v.fecha < ?
+                ORDER BY v.fecha DESC, v.id DESC
+            """, (desde or _FECHA_MIN, hasta or _FECHA_MAX))
+
+            venta = None
+            while True:
+                filas = cur.fetchmany(tam_lote)
+                if not filas:
+                    break
+                for venta_id, fecha, total, forma_pago, producto, cantidad, precio_unitario in filas:
+                    if venta is None or venta["id"] != venta_id:
+                        if venta is not None:
+                            yield venta
+                        venta = {"id": venta_id, "fecha": fecha, "total": total,
+                                 "forma_pago": forma_pago, "items": []}
+                    if cantidad is not None:
+                        venta["items"].append({
+                            "producto": producto,
+                            "cantidad": cantidad,
+                            "precio_unitario": float(precio_unitario)
+                        })
+            if venta is not None:
+                yield venta
+        finally:
+            conn.close()
+
     @staticmethod
     def buscar_por_id(venta_id: int) -> Optional[Dict[str, Any]]:
         """Buscar venta por ID con todos sus detalles"""
@@ -456,18 +833,21 @@ class VentaRepo:
     @staticmethod
     def obtener_ventas_por_fecha(fecha_inicio: str, fecha_fin: str) -> List[Dict[str, Any]]:
         """
-        Obtener ventas entre dos fechas
+        Obtener ventas entre dos fechas, ambos días incluidos
         Formato fecha: 'YYYY-MM-DD'
         """
+        # Rango [inicio, fin) sobre la columna tal cual, para que use ix_ventas_fecha
+        inicio = datetime.datetime.strptime(str(fecha_inicio)[:10], "%Y-%m-%d")
+        fin = datetime.datetime.strptime(str(fecha_fin)[:10], "%Y-%m-%d") + datetime.timedelta(days=1)
         conn = get_connection()
         try:
             cur = conn.cursor()
             cur.execute("""
                 SELECT id, fecha, total, forma_pago
                 FROM ventas
-                WHERE CAST(fecha AS DATE) BETWEEN ? AND ?
-                ORDER BY fecha DESC
-            """, (fecha_inicio, fecha_fin))
+                WHERE fecha >= ? AND fecha < ?
+                ORDER BY fecha DESC, id DESC
+            """, (inicio, fin))
             
             return _dict_rows(cur)
             
@@ -477,16 +857,16 @@ class VentaRepo:
     @staticmethod
     def obtener_total_ventas_por_dia(fecha: str) -> float:
         """
-        Obtener el total de ventas para un día específico
+        Obtener el total de ventas para un día específico (del resumen ventas_diarias)
         Formato fecha: 'YYYY-MM-DD'
         """
         conn = get_connection()
         try:
             cur = conn.cursor()
             cur.execute("""
-                SELECT ISNULL(SUM(total), 0) as total_dia
-                FROM ventas
-                WHERE CAST(fecha AS DATE) = ?
+                SELECT COALESCE(SUM(total), 0) as total_dia
+                FROM ventas_diarias
+                WHERE dia = ?
             """, (fecha,))
             
             result = cur.fetchone()
@@ -498,27 +878,32 @@ class VentaRepo:
     @staticmethod
     def obtener_resumen_ventas_diarias(dias: int = 7) -> List[Dict[str, Any]]:
         """
-        Obtiene la suma total de ventas por día para los últimos 'dias' días.
+        Obtiene la suma total y la cantidad de ventas por día para los últimos
+        'dias' días (hoy incluido), leyendo el resumen ventas_diarias.
         """
-        conn = get_connection()
+        conn = None
         try:
+            conn = get_connection()
             cur = conn.cursor()
+            desde = datetime.date.today() - datetime.timedelta(days=dias - 1)
             cur.execute("""
                 SELECT 
-                    CAST(fecha AS DATE) as dia_venta,
+                    dia as dia_venta,
+                    SUM(cantidad) as cantidad_dia,
                     SUM(total) as total_dia
-                FROM ventas
-                WHERE fecha >= DATEADD(day, -?, GETDATE())
-                GROUP BY CAST(fecha AS DATE)
+                FROM ventas_diarias
+                WHERE dia >= ?
+                GROUP BY dia
                 ORDER BY dia_venta ASC
-            """, (dias,))
+            """, (desde,))
             
             datos_raw = _dict_rows(cur)
             
             datos_formateados = []
             for fila in datos_raw:
                 datos_formateados.append({
-                    "fecha": fila["dia_venta"].strftime("%Y-%m-%d"),
+                    "fecha": str(fila["dia_venta"])[:10],
+                    "cantidad": fila["cantidad_dia"],
                     "total": float(fila["total_dia"])
                 })
             
@@ -528,4 +913,5 @@ class VentaRepo:
             print(f"Error obteniendo resumen de ventas: {e}")
             return []
         finally:
-            conn.close()
\ No newline at end of file
+            if conn is not None:
+                conn.close()
\ No newline at end of file
@@ -7,17 +7,101 @@ from datetime import datetime, timedelta
 from decimal import Decimal
 import logging
 import os
-from typing import List, Dict, Any
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.pdfgen import canvas
-from reportlab.lib.utils import ImageReader
+from typing import List, Dict, Any, Optional
 import tempfile
-from repos import ProductoRepo, VentaRepo, PuntoVentaRepo
+from repos import ProductoRepo, VentaRepo, PuntoVentaRepo, StockInsuficienteError
 
 logger = logging.getLogger("SimulacionVentasPro")
 
+class MuestreadorPonderado:
+    """
+    Elige posiciones con probabilidad proporcional a su peso usando un árbol
+    de Fenwick: elegir y cambiar un peso cuestan O(log n), sin recorrer el
+    catálogo. Las posiciones con peso 0 no salen nunca.
+    """
+
+    def __init__(self, pesos: List[float]):
+        self._n = len(pesos)
+        self._pesos = [max(0.0, p) for p in pesos]
+        # Armado en O(n): cada nodo suma su rango y se lo pasa a su padre
+        self._arbol = [0.0] + self._pesos
+        for i in range(1, self._n + 1):
+            padre = i + (i & -i)
+            if padre <= self._n:
+                self._arbol[padre] += self._arbol[i]
+        self._paso_inicial = 1 << (self._n.bit_length() - 1) if self._n else 0
+
+    def __len__(self):
+        return self._n
+
+    def peso(self, posicion: int) -> float:
+        return self._pesos[posicion]
+
+    def total(self) -> float:
+        suma, i = 0.0, self._n
+        while i > 0:
+            suma += self._arbol[i]
+            i -= i & -i
+        return suma
+
+    def actualizar(self, posicion: int, peso: float):
+        peso = max(0.0, peso)
+        delta = peso - self._pesos[posicion]
+        if not delta:
+            return
+        self._pesos[posicion] = peso
+        i = posicion + 1
+        while i <= self._n:
+            self._arbol[i] += delta
+            i += i & -i
+
+    def elegir(self, rnd=random) -> Optional[int]:
+        """Una posición al azar según los pesos (None si todos son 0)"""
+        total = self.total()
+        if total <= 0:
+            return None
+        objetivo = rnd.random() * total
+        posicion, paso = 0, self._paso_inicial
+        while paso:
+            siguiente = posicion + paso
+            if siguiente <= self._n and self._arbol[siguiente] <= objetivo:
+                objetivo -= self._arbol[siguiente]
+                posicion = siguiente
+            paso >>= 1
+        if posicion >= self._n or self._pesos[posicion] <= 0:
+            # Solo por redondeo de las sumas: la última posición con peso
+            posicion = max((i for i, peso in enumerate(self._pesos) if peso > 0), default=None)
+        return posicion
+
+    def elegir_varios(self, k: int, rnd=random) -> List[int]:
+        """Hasta k posiciones distintas (sin reposición), en O(k log n)"""
+        elegidas = []
+        for _ in range(k):
+            posicion = self.elegir(rnd)
+            if posicion is None:
+                break
+            elegidas.append((posicion, self._pesos[posicion]))
+            self.actualizar(posicion, 0.0)
+        for posicion, peso in elegidas:
+            self.actualizar(posicion, peso)
+        return [posicion for posicion, _ in elegidas]
+
+
 class SimuladorVentasPro:
     """Simulador PROFESIONAL de ventas usando base de datos real"""
+
+    PESO_CATEGORIAS = {
+        'Bebidas': 0.22,
+        'Lácteos': 0.16,
+        'Enlatados': 0.07,
+        'Limpieza': 0.06,
+        'Carnes': 0.05,
+        'Frutas': 0.02,
+        'Verduras': 0.02
+    }
+
+    # Segundos entre refrescos incrementales del catálogo (listar_cambios)
+    REFRESCO_CATALOGO = 60
     
     def __init__(self):
         self.ejecutando = False
@@ -27,26 +111,29 @@ class SimuladorVentasPro:
         self.productos_disponibles = []
         self.probabilidades_productos = {}
         self.ventas_realizadas = []
+        # Modelo local del catálogo: el stock se descuenta con cada venta
+        # registrada y se corrige con lo que informa la BD
+        self._productos_por_id = {}
+        self._ultimo_refresco = 0.0
+        self._marca_fecha = None
+        self._marca_id = 0
+        self._punto_venta_id = None
+        # Muestreo ponderado de productos (se arma en _calcular_probabilidades)
+        self._muestreador = None
+        self._candidatos = []
+        self._posicion_candidato = {}
         
     def cargar_productos_reales(self):
         """Cargar productos reales de la base de datos - SOLO ACTIVOS Y CON STOCK"""
         try:
-            todos_productos = ProductoRepo.listar()
-            
-            # Filtrar solo productos activos y con stock > 0
-            self.productos_disponibles = [
-                p for p in todos_productos 
-                if p.get('activo', True) and p.get('stock', 0) > 0
-            ]
+            self._productos_por_id = {}
+            self._marca_fecha, self._marca_id = None, 0
+            self._incorporar_productos(ProductoRepo.listar())
+            self._ultimo_refresco = time.monotonic()
             
             if not self.productos_disponibles:
                 logger.warning("No hay productos activos con stock en la base de datos")
                 return False
-                
-            # Convertir precios Decimal a float si es necesario
-            for producto in self.productos_disponibles:
-                if isinstance(producto['precio'], Decimal):
-                    producto['precio'] = float(producto['precio'])
             
             logger.info(f"Cargados {len(self.productos_disponibles)} productos activos con stock")
             return True
@@ -54,55 +141,143 @@ class SimuladorVentasPro:
         except Exception as e:
             logger.error(f"Error cargando productos reales: {e}")
             return False
+
+    def preparar(self):
+        """Carga el catálogo y arma el muestreo; False si no hay productos activos con stock"""
+        if not self.cargar_productos_reales():
+            return False
+        self._calcular_probabilidades()
+        return True
+
+    def armar_venta(self):
+        """
+        Arma una venta simulada con el stock local, sin consultar la BD: un
+        dict con punto_venta_id, items y forma_pago, listo para
+        VentaRepo.crear_venta(**venta). None si no quedan productos con stock.
+        """
+        carrito = self._generar_carrito_inteligente()
+        if not carrito:
+            return None
+        return {
+            'punto_venta_id': self._obtener_punto_venta(),
+            'items': carrito,
+            'forma_pago': self._generar_forma_pago_realista(),
+        }
+
+    def registrar_resultado(self, venta, error=None):
+        """
+        Informa cómo terminó crear_venta para una venta de armar_venta (error
+        si falló): corrige el stock local y cada REFRESCO_CATALOGO segundos
+        trae los cambios del catálogo.
+        """
+        self._registrar_resultado(venta['items'], error)
+        self._refrescar_catalogo()
+
+    def _incorporar_productos(self, productos):
+        """Agrega o reemplaza productos en el modelo local y avanza las marcas de agua"""
+        for producto in productos:
+            # Convertir precios Decimal a float si es necesario
+            if isinstance(producto['precio'], Decimal):
+                producto['precio'] = float(producto['precio'])
+            self._productos_por_id[producto['id']] = producto
+            fecha = producto.get('fecha_modificacion')
+            if fecha is not None and (self._marca_fecha is None or fecha > self._marca_fecha):
+                self._marca_fecha = fecha
+            self._marca_id = max(self._marca_id, producto['id'])
+        # Solo activos y con stock > 0
+        self.productos_disponibles = [
+            p for p in self._productos_por_id.values()
+            if p.get('activo', True) and p.get('stock', 0) > 0
+        ]
+
+    def _refrescar_catalogo(self, forzar=False):
+        """Trae solo los productos que cambiaron, cada REFRESCO_CATALOGO segundos"""
+        if not forzar and time.monotonic() - self._ultimo_refresco < self.REFRESCO_CATALOGO:
+            return
+        self._ultimo_refresco = time.monotonic()
+        if self._marca_fecha is None:
+            self.cargar_productos_reales()
+        else:
+            try:
+                self._incorporar_productos(ProductoRepo.listar_cambios(self._marca_fecha, self._marca_id))
+            except Exception as e:
+                logger.error(f"Error refrescando el catálogo: {e}")
+                return
+        self._calcular_probabilidades()
+
+    def _obtener_punto_venta(self):
+        if self._punto_venta_id is None:
+            puntos = PuntoVentaRepo.listar()
+            self._punto_venta_id = puntos[0]['id'] if puntos else 1
+        return self._punto_venta_id
     
     def _calcular_probabilidades(self):
         """Calcular probabilidades de venta basadas en categorías y stock"""
-        categorias_peso = {
-            'Bebidas': 0.22,
-            'Lácteos': 0.16,
-            'Enlatados': 0.07,
-            'Limpieza': 0.06,
-            'Carnes': 0.05,
-            'Frutas': 0.02,
-            'Verduras': 0.02
-        }
-        
         self.probabilidades_productos = {}
         for producto in self.productos_disponibles:
-            categoria = producto.get('categoria', 'Otros')
-            peso = categorias_peso.get(categoria, 0.04)
-            
-            precio = producto['precio']
-            precio_factor = max(0.1, 1.5 - (precio / 100))
-            
-            stock = producto.get('stock', 0)
-            stock_factor = min(2.0, stock / 10)  # Normalizar stock
-            
-            probabilidad = peso * precio_factor * stock_factor
-            self.probabilidades_productos[producto['id']] = probabilidad
-    
-    def _obtener_producto_actualizado(self, producto_id):
-        """Obtener información actualizada del producto desde la BD"""
-        try:
-            producto_actual = ProductoRepo.buscar_por_id(producto_id)
-            if producto_actual and producto_actual.get('activo', True):
-                if isinstance(producto_actual['precio'], Decimal):
-                    producto_actual['precio'] = float(producto_actual['precio'])
-                return producto_actual
-        except Exception as e:
-            logger.error(f"Error obteniendo producto actualizado: {e}")
-        return None
+            self.probabilidades_productos[producto['id']] = self._probabilidad(producto)
+
+        self._candidatos = list(self.productos_disponibles)
+        self._posicion_candidato = {p['id']: i for i, p in enumerate(self._candidatos)}
+        self._muestreador = MuestreadorPonderado(
+            [self.probabilidades_productos[p['id']] for p in self._candidatos]
+        )
+
+    def _probabilidad(self, producto):
+        categoria = producto.get('categoria', 'Otros')
+        peso = self.PESO_CATEGORIAS.get(categoria, 0.04)
+        
+        precio = producto['precio']
+        precio_factor = max(0.1, 1.5 - (precio / 100))
+        
+        stock = producto.get('stock', 0)
+        stock_factor = max(0.0, min(2.0, stock / 10))  # Normalizar stock
+        
+        return peso * precio_factor * stock_factor
+
+    def _actualizar_probabilidad(self, producto):
+        """Recalcula el peso de un producto cuyo stock cambió (O(log n))"""
+        posicion = self._posicion_candidato.get(producto['id'])
+        if posicion is None:
+            return  # sin stock al armar el muestreo: vuelve en el próximo refresco
+        probabilidad = self._probabilidad(producto)
+        self.probabilidades_productos[producto['id']] = probabilidad
+        self._muestreador.actualizar(posicion, probabilidad)
     
-    def _verificar_stock_suficiente(self, producto_id, cantidad):
-        """Verificar que el producto tenga stock suficiente"""
+    def _fijar_stock_local(self, producto_id, stock):
+        producto = self._productos_por_id.get(producto_id)
+        if producto is not None:
+            producto['stock'] = stock
+            self._actualizar_probabilidad(producto)
+
+    def _verificar_stock_carrito(self, carrito):
+        """Confirma el stock de todo el carrito con una sola consulta; devuelve los items que alcanzan"""
         try:
-            producto = self._obtener_producto_actualizado(producto_id)
-            if producto and producto.get('stock', 0) >= cantidad:
-                return True, producto
-            return False, producto
+            stock_actual = ProductoRepo.stock_por_ids([item['producto_id'] for item in carrito])
         except Exception as e:
             logger.error(f"Error verificando stock: {e}")
-            return False, None
+            return []
+        carrito_valido = []
+        for item in carrito:
+            stock = stock_actual.get(item['producto_id'], 0)  # inactivo o borrado: 0
+            self._fijar_stock_local(item['producto_id'], stock)
+            if stock >= item['cantidad']:
+                carrito_valido.append(item)
+            else:
+                logger.warning(f"Stock insuficiente para {item['nombre']}")
+        return carrito_valido
+
+    def _registrar_resultado(self, carrito, error=None):
+        """Actualiza el stock local con el resultado de crear_venta"""
+        if error is None:
+            for item in carrito:
+                producto = self._productos_por_id.get(item['producto_id'])
+                if producto is not None:
+                    producto['stock'] = producto.get('stock', 0) - item['cantidad']
+                    self._actualizar_probabilidad(producto)
+        elif isinstance(error, StockInsuficienteError):
+            for linea in error.lineas:
+                self._fijar_stock_local(linea['producto_id'], linea['disponible'])
     
     def _generar_carrito_inteligente(self):
         """Generar carrito de compra inteligente con productos de la BD"""
@@ -111,47 +286,27 @@ class SimuladorVentasPro:
                                  k=1)[0]
         
         carrito = []
-        productos_intentados = set()
+        if self._muestreador is None:
+            self._calcular_probabilidades()
         
-        for _ in range(num_items):
-            productos_posibles = [
-                p for p in self.productos_disponibles 
-                if p['id'] not in productos_intentados 
-                and p.get('stock', 0) > 0
-            ]
-            
-            if not productos_posibles:
-                break
-            
-            pesos = [self.probabilidades_productos.get(p['id'], 0.01) for p in productos_posibles]
-            
-            producto_seleccionado = random.choices(productos_posibles, weights=pesos, k=1)[0]
-            productos_intentados.add(producto_seleccionado['id'])
+        # Se elige con el stock local: la BD se consulta una vez por carrito
+        # (_verificar_stock_carrito) y no por cada producto. Los productos
+        # sin stock pesan 0, así que el muestreo ya los descarta.
+        for posicion in self._muestreador.elegir_varios(num_items):
+            producto = self._candidatos[posicion]
             
-            stock_ok, producto_actual = self._verificar_stock_suficiente(
-                producto_seleccionado['id'], 1
-            )
-            
-            if not stock_ok or not producto_actual:
-                continue
-            
-            max_cantidad = min(3, producto_actual.get('stock', 1))
+            max_cantidad = min(3, producto.get('stock', 1))
             cantidad = random.choices([1, 2, 3], weights=[0.8, 0.15, 0.05], k=1)[0]
             cantidad = min(cantidad, max_cantidad)
             
-            stock_final_ok, producto_final = self._verificar_stock_suficiente(
-                producto_seleccionado['id'], cantidad
-            )
-            
-            if stock_final_ok and producto_final:
-                carrito.append({
-                    'producto_id': producto_final['id'],
-                    'nombre': producto_final['nombre'],
-                    'precio': producto_final['precio'],
-                    'cantidad': cantidad,
-                    'categoria': producto_final.get('categoria', 'Otros'),
-                    'codigo_barras': producto_final.get('codigo_barras', '')
-                })
+            carrito.append({
+                'producto_id': producto['id'],
+                'nombre': producto['nombre'],
+                'precio': producto['precio'],
+                'cantidad': cantidad,
+                'categoria': producto.get('categoria', 'Otros'),
+                'codigo_barras': producto.get('codigo_barras', '')
+            })
         
         return carrito
     
@@ -200,6 +355,9 @@ class SimuladorVentasPro:
        
             timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
             filename = f"{tickets_dir}/ticket_venta_{venta_info['venta_id']}_{timestamp}.pdf"
+            # reportlab se importa con el primer ticket, no al arrancar
+            from reportlab.lib.pagesizes import A4
+            from reportlab.pdfgen import canvas
             c = canvas.Canvas(filename, pagesize=A4)
             width, height = A4
             
@@ -288,15 +446,7 @@ class SimuladorVentasPro:
                 logger.warning("No se pudo generar carrito de compra válido")
                 return None
             
-            carrito_valido = []
-            for item in carrito:
-                stock_ok, producto_actual = self._verificar_stock_suficiente(
-                    item['producto_id'], item['cantidad']
-                )
-                if stock_ok and producto_actual:
-                    carrito_valido.append(item)
-                else:
-                    logger.warning(f"Stock insuficiente para {item['nombre']}")
+            carrito_valido = self._verificar_stock_carrito(carrito)
             
             if not carrito_valido:
                 logger.warning("Carrito vacío después de validar stock")
@@ -305,8 +455,7 @@ class SimuladorVentasPro:
             forma_pago = self._generar_forma_pago_realista()
             total = sum(item['precio'] * item['cantidad'] for item in carrito_valido)
             
-            puntos = PuntoVentaRepo.listar()
-            punto_venta_id = puntos[0]['id'] if puntos else 1
+            punto_venta_id = self._obtener_punto_venta()
             
             items_venta = []
             for item in carrito_valido:
@@ -323,6 +472,7 @@ class SimuladorVentasPro:
                     items=items_venta,
                     forma_pago=forma_pago
                 )
+                self._registrar_resultado(carrito_valido)
                 
                 venta_info = {
                     'venta_id': venta_id,
@@ -337,13 +487,13 @@ class SimuladorVentasPro:
                 pdf_path = self.generar_ticket_pdf(venta_info, carrito_valido)
                 venta_info['pdf_path'] = pdf_path
                 
-                self.cargar_productos_reales()
-                self._calcular_probabilidades()
+                self._refrescar_catalogo()
                 
                 return venta_info
                 
             except Exception as e:
                 logger.error(f"Error creando venta en BD: {e}")
+                self._registrar_resultado(carrito_valido, e)
                 return self._simular_venta_demo(carrito_valido, forma_pago)
             
         except Exception as e:
@@ -375,12 +525,10 @@ class SimuladorVentasPro:
         if self.ejecutando:
             return False
         
-        if not self.cargar_productos_reales():
+        if not self.preparar():
             messagebox.showerror("Error", "No hay productos activos con stock en la base de datos")
             return False
         
-        self._calcular_probabilidades()
-        
         self.ejecutando = True
         self.ventas_objetivo = total_ventas
         self.ventas_generadas = 0
@@ -0,0 +1,37 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Antes de importar config: las pruebas nunca tocan el SQL Server
+os.environ["KIOSKO_BACKEND"] = "sqlite"
+
+import backends  # noqa: E402
+
+
+@pytest.fixture
+def bd(tmp_path, monkeypatch):
+    """Base SQLite nueva y migrada en tmp_path, usada por todos los repos"""
+    ruta = str(tmp_path / "kiosko.db")
+    monkeypatch.setenv("KIOSKO_BACKEND", "sqlite")
+    monkeypatch.setenv("KIOSKO_SQLITE_PATH", ruta)
+    monkeypatch.setattr(backends, "BACKEND", "sqlite")
+    backend = backends.SqliteBackend(ruta)
+    monkeypatch.setattr(backends, "_backend", backend)
+    return backend
+
+
+@pytest.fixture
+def consultar(bd):
+    """Ejecuta una consulta de verificación y devuelve todas las filas"""
+    def _consultar(sql, params=()):
+        conn = bd.conectar()
+        try:
+            cur = conn.cursor()
+            cur.execute(sql, params)
+            return [tuple(fila) for fila in cur.fetchall()]
+        finally:
+            conn.close()
+    return _consultar
@@ -0,0 +1,119 @@
+import json
+import os
+import queue
+import threading
+
+import pytest
+
+import diario_ventas
+from config import PoolAgotadoError, SinConexionError
+from diario_ventas import DiarioVentas, EnvioVentas, VentaRechazadaError
+from migraciones import EsquemaDesactualizadoError
+from repos import ProductoRepo, VentaRepo
+
+
+@pytest.fixture
+def envio(bd, tmp_path, monkeypatch):
+    """Envío con su diario en tmp_path; devuelve (envio, cola de avisos)"""
+    monkeypatch.setattr(diario_ventas, "DIARIO_REINTENTO_MIN", 0.01)
+    diario = DiarioVentas(str(tmp_path / "pendientes.jsonl"), str(tmp_path / "rechazadas.jsonl"))
+    envio = EnvioVentas(diario)
+    avisos = queue.Queue()
+    envio.suscribir(lambda clave, venta_id, error, pendientes: avisos.put((clave, venta_id, error)))
+    envio.iniciar()
+    return envio, avisos
+
+
+def _venta(producto_id):
+    return {"punto_venta_id": 1, "forma_pago": "EFECTIVO",
+            "items": [{"producto_id": producto_id, "cantidad": 1, "precio": 2.5}]}
+
+
+def test_venta_rechazada_se_aparta_y_no_traba_la_cola(envio, consultar):
+    envio, avisos = envio
+    ProductoRepo.agregar("P", 2.5, 10, None, "P-1")
+    producto_id = consultar("SELECT id FROM productos")[0][0]
+
+    mala = envio.encolar(_venta(999))   # producto inexistente: error de datos
+    buena = envio.encolar(_venta(producto_id))
+
+    clave, venta_id, error = avisos.get(timeout=5)
+    assert clave == mala and venta_id is None
+    assert isinstance(error, VentaRechazadaError)
+    clave, venta_id, error = avisos.get(timeout=5)
+    assert clave == buena and error is None
+    assert consultar("SELECT id FROM ventas") == [(venta_id,)]
+
+    assert envio.diario.pendientes() == []
+    with open(envio.diario.ruta_rechazadas, encoding="utf-8") as f:
+        rechazadas = [json.loads(linea.split(" ", 1)[1]) for linea in f]
+    assert [(r["clave"], r["datos"]["items"][0]["producto_id"]) for r in rechazadas] == [(mala, 999)]
+
+
+def test_sin_conexion_se_reintenta_la_misma_venta(envio, consultar, monkeypatch):
+    envio, avisos = envio
+    ProductoRepo.agregar("P", 2.5, 10, None, "P-1")
+    producto_id = consultar("SELECT id FROM productos")[0][0]
+    crear_venta = VentaRepo.crear_venta
+    fallos = [SinConexionError("SQL Server no disponible")]
+
+    def crear_venta_con_corte(**kwargs):
+        if fallos:
+            raise fallos.pop()
+        return crear_venta(**kwargs)
+    monkeypatch.setattr(VentaRepo, "crear_venta", staticmethod(crear_venta_con_corte))
+
+    clave = envio.encolar(_venta(producto_id))
+
+    _, venta_id, error = avisos.get(timeout=5)
+    assert isinstance(error, SinConexionError) and venta_id is None
+    assert avisos.get(timeout=5) == (clave, consultar("SELECT id FROM ventas")[0][0], None)
+    assert envio.diario.pendientes() == []
+
+
+def test_pool_agotado_deja_la_venta_pendiente(envio, consultar, monkeypatch):
+    envio, avisos = envio
+    ProductoRepo.agregar("P", 2.5, 10, None, "P-1")
+    producto_id = consultar("SELECT id FROM productos")[0][0]
+
+    crear_venta = VentaRepo.crear_venta
+    pool_libre = threading.Event()
+
+    def crear_venta_sin_pool(**kwargs):
+        if not pool_libre.is_set():
+            raise PoolAgotadoError("No hay conexiones libres en el pool (tiempo de espera agotado)")
+        return crear_venta(**kwargs)
+    monkeypatch.setattr(VentaRepo, "crear_venta", staticmethod(crear_venta_sin_pool))
+
+    clave = envio.encolar(_venta(producto_id))
+
+    _, venta_id, error = avisos.get(timeout=5)
+    assert isinstance(error, RuntimeError) and not isinstance(error, VentaRechazadaError)
+    assert avisos.get(timeout=5)[0] == clave   # se reintenta, no se aparta
+    assert [r["clave"] for r in envio.diario.pendientes()] == [clave]
+    assert not os.path.exists(envio.diario.ruta_rechazadas)
+
+    pool_libre.set()
+    while avisos.get(timeout=5)[2] is not None:
+        pass
+    assert envio.diario.pendientes() == []
+
+
+def test_esquema_desactualizado_pausa_el_envio(envio, consultar, monkeypatch):
+    envio, avisos = envio
+    ProductoRepo.agregar("P", 2.5, 10, None, "P-1")
+    producto_id = consultar("SELECT id FROM productos")[0][0]
+    fallos = [EsquemaDesactualizadoError("Faltan migraciones")]
+
+    def verificar_esquema():
+        if fallos:
+            raise fallos.pop()
+    monkeypatch.setattr(diario_ventas, "verificar_esquema", verificar_esquema)
+
+    clave = envio.encolar(_venta(producto_id))
+
+    _, venta_id, error = avisos.get(timeout=5)
+    assert isinstance(error, EsquemaDesactualizadoError) and venta_id is None
+    assert consultar("SELECT COUNT(*) FROM ventas") == [(0,)]
+    assert avisos.get(timeout=5) == (clave, consultar("SELECT id FROM ventas")[0][0], None)
+    assert envio.diario.pendientes() == []
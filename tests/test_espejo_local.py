@@ -0,0 +1,65 @@
+import datetime
+import sqlite3
+from decimal import Decimal
+
+from espejo_local import EspejoLocal
+
+
+def _producto(producto_id, stock=10):
+    return {"id": producto_id, "codigo_barras": f"C{producto_id}", "nombre": f"Producto {producto_id}",
+            "precio": Decimal("1.50"), "stock": stock, "categoria": "Almacén", "activo": True,
+            "categoria_id": 1, "fecha_modificacion": datetime.datetime(2024, 1, 1)}
+
+
+def _tocar_stock(ruta, producto_id, stock):
+    """Cambia el archivo por fuera, para ver si el espejo vuelve a escribir la fila"""
+    conn = sqlite3.connect(ruta)
+    with conn:
+        conn.execute("UPDATE productos SET stock = ? WHERE id = ?", (stock, producto_id))
+    conn.close()
+
+
+def test_solo_escribe_las_filas_que_cambiaron(tmp_path):
+    ruta = str(tmp_path / "espejo.db")
+    espejo = EspejoLocal(ruta)
+    productos = [_producto(i) for i in range(1, 6)]
+    espejo.guardar_productos(productos)
+
+    _tocar_stock(ruta, 1, 99)
+    productos[1] = _producto(2, stock=3)
+    del productos[2]
+    espejo.guardar_productos(productos)
+
+    stock = {p["id"]: p["stock"] for p in espejo.listar_productos()}
+    assert stock == {1: 99, 2: 3, 4: 10, 5: 10}   # la fila 1 no cambió en el servidor: no se reescribe
+
+
+def test_la_primera_copia_completa_reemplaza_el_archivo(tmp_path):
+    ruta = str(tmp_path / "espejo.db")
+    EspejoLocal(ruta).guardar_productos([_producto(i) for i in range(1, 4)])
+
+    espejo = EspejoLocal(ruta)   # otra ejecución
+    espejo.guardar_productos([_producto(3, stock=1)], completo=False)
+    espejo.guardar_productos([_producto(1), _producto(3, stock=1)])
+
+    assert [(p["id"], p["stock"]) for p in espejo.listar_productos()] == [(1, 10), (3, 1)]
+
+
+def test_descontar_stock_no_queda_tapado_por_la_proxima_copia(tmp_path):
+    espejo = EspejoLocal(str(tmp_path / "espejo.db"))
+    productos = [_producto(1), _producto(2)]
+    espejo.guardar_productos(productos)
+
+    espejo.descontar_stock([{"producto_id": 1, "cantidad": 4}])
+    assert espejo.buscar_producto(1)["stock"] == 6
+    espejo.guardar_productos(productos)   # el servidor sigue diciendo 10
+    assert espejo.buscar_producto(1)["stock"] == 10
+
+
+def test_las_escrituras_en_segundo_plano_respetan_el_orden(tmp_path):
+    espejo = EspejoLocal(str(tmp_path / "espejo.db"))
+    espejo.en_segundo_plano(lambda: espejo.guardar_productos([_producto(1), _producto(2)]))
+    espejo.en_segundo_plano(lambda: espejo.guardar_productos([_producto(2, stock=7)], completo=False))
+    espejo.esperar_pendientes()
+
+    assert [(p["id"], p["stock"]) for p in espejo.listar_productos()] == [(1, 10), (2, 7)]
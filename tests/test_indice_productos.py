@@ -0,0 +1,79 @@
+import threading
+
+from indice_productos import IndiceProductos
+
+
+def _producto(producto_id, nombre, codigo=None, categoria="Almacén"):
+    return {"id": producto_id, "nombre": nombre, "codigo_barras": codigo or f"C{producto_id:05d}",
+            "categoria": categoria, "activo": True}
+
+
+def test_buscar_desde_otro_hilo_mientras_se_actualiza():
+    indice = IndiceProductos(_producto(i, f"Producto {i}") for i in range(2000))
+    errores = []
+    terminar = threading.Event()
+
+    def buscar():
+        try:
+            while not terminar.is_set():
+                for query in ("prod", "ducto 1", "c000", ""):
+                    indice.buscar(query, limite=10)
+                    indice.filtrar(query)
+        except Exception as e:   # p. ej. "dictionary changed size during iteration"
+            errores.append(e)
+
+    hilo = threading.Thread(target=buscar)
+    hilo.start()
+    try:
+        for vuelta in range(300):
+            nuevos = [_producto(2000 + vuelta * 5 + j, f"Nuevo {vuelta} {j}") for j in range(5)]
+            indice.actualizar(nuevos)
+            indice.actualizar([_producto(vuelta, f"Renombrado {vuelta}")])
+            indice.quitar(p["id"] for p in nuevos[:3])
+            if vuelta % 100 == 0:
+                indice.adoptar(IndiceProductos(indice.filtrar("")))
+    finally:
+        terminar.set()
+        hilo.join()
+
+    assert errores == []
+    assert len(indice) == 2000 + 300 * 2
+
+
+def test_productos_nuevos_y_renombrados_quedan_en_orden_de_nombre():
+    indice = IndiceProductos([_producto(1, "Arroz"), _producto(2, "Fideos"), _producto(3, "Yerba")])
+    indice.quitar([1])
+    indice.actualizar([_producto(4, "Aceite"), _producto(5, "Leche")])
+    indice.actualizar([_producto(3, "Azúcar")])
+
+    assert [p["nombre"] for p in indice.filtrar("")] == ["Aceite", "Azúcar", "Fideos", "Leche"]
+    assert [p["id"] for p in indice.filtrar("e", incluir_categoria=False)] == [4, 2, 5]
+    assert [p["id"] for p in indice.buscar("che")] == [5]
+
+
+def test_quitar_y_renombrar_no_dejan_restos_en_las_busquedas():
+    indice = IndiceProductos(_producto(i, f"Galletas {i}") for i in range(1, 101))
+    indice.quitar(range(1, 51))
+    indice.actualizar([_producto(60, "Caramelos")])
+
+    assert [p["id"] for p in indice.buscar("galletas 5", limite=20)] == list(range(51, 60))
+    assert [p["id"] for p in indice.filtrar("galle")] == sorted(set(range(51, 101)) - {60}, key=str)
+    assert [p["id"] for p in indice.buscar("caram")] == [60]
+    assert indice.buscar_codigo("C00010") is None
+
+
+def test_codigo_compartido_pasa_al_otro_producto():
+    indice = IndiceProductos([_producto(1, "Gaseosa", "779000"), _producto(2, "Gaseosa grande", "779000"),
+                              _producto(3, "Agua", "779001")])
+    assert indice.buscar_codigo("779000")["id"] == 1
+
+    indice.quitar([1])
+    assert indice.buscar_codigo("779000")["id"] == 2
+
+    indice.actualizar([_producto(1, "Gaseosa", "779000")])
+    indice.actualizar([_producto(2, "Gaseosa grande", "779002")])
+    assert indice.buscar_codigo("779000")["id"] == 1
+
+    indice.actualizar([_producto(4, "Agua", "779003")])
+    indice.actualizar([_producto(3, "Agua con gas", "779001")])
+    assert indice.buscar_nombre("agua")["id"] == 4
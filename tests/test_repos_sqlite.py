@@ -0,0 +1,163 @@
+import datetime
+
+import pytest
+
+from repos import CategoriaRepo, ProductoRepo, StockInsuficienteError, VentaRepo
+
+
+@pytest.fixture
+def productos(bd, consultar):
+    """Dos productos: P (stock 10, $2.50) y Q (stock 5, $4.00); devuelve {nombre: id}"""
+    CategoriaRepo.agregar("Golosinas")
+    categoria_id = consultar("SELECT id FROM categorias")[0][0]
+    ProductoRepo.agregar("P", 2.5, 10, categoria_id, "P-1")
+    ProductoRepo.agregar("Q", 4.0, 5, categoria_id, "Q-1")
+    return {nombre: id_ for id_, nombre in consultar("SELECT id, nombre FROM productos")}
+
+
+def _item(producto_id, cantidad, precio):
+    return {"producto_id": producto_id, "cantidad": cantidad, "precio": precio}
+
+
+def _stock(consultar, producto_id):
+    return consultar("SELECT stock FROM productos WHERE id = ?", (producto_id,))[0][0]
+
+
+def test_crear_venta_registra_detalle_stock_y_resumen(productos, consultar):
+    p, q = productos["P"], productos["Q"]
+    venta_id = VentaRepo.crear_venta(1, [_item(p, 2, 2.5), _item(q, 1, 4.0), _item(p, 1, 2.5)])
+
+    assert consultar("SELECT total, forma_pago FROM ventas WHERE id = ?", (venta_id,)) == [(11.5, "EFECTIVO")]
+    detalle = consultar("SELECT producto_id, cantidad, precio_unitario FROM detalle_venta "
+                        "WHERE venta_id = ? ORDER BY id", (venta_id,))
+    assert sorted(detalle) == sorted([(p, 2, 2.5), (q, 1, 4.0), (p, 1, 2.5)])
+
+    assert _stock(consultar, p) == 7
+    assert _stock(consultar, q) == 4
+    movimientos = consultar("SELECT producto_id, tipo, cantidad, stock_anterior, stock_nuevo "
+                            "FROM movimientos_stock ORDER BY producto_id")
+    assert movimientos == [(p, "VENTA", 3, 10, 7), (q, "VENTA", 1, 5, 4)]
+
+    assert consultar("SELECT forma_pago, cantidad, total FROM ventas_diarias") == [("EFECTIVO", 1, 11.5)]
+    assert VentaRepo.obtener_total_ventas_por_dia(datetime.date.today().isoformat()) == 11.5
+
+
+def test_crear_venta_aplica_descuento(productos, consultar):
+    venta_id = VentaRepo.crear_venta(1, [_item(productos["Q"], 2, 5.0)], descuento=10)
+    assert consultar("SELECT total, descuento FROM ventas WHERE id = ?", (venta_id,)) == [(9.0, 10)]
+
+
+def test_clave_idempotencia_repetida_devuelve_la_misma_venta(productos, consultar):
+    p = productos["P"]
+    primera = VentaRepo.crear_venta(1, [_item(p, 2, 2.5)], clave_idempotencia="caja1-0001")
+    segunda = VentaRepo.crear_venta(1, [_item(p, 2, 2.5)], clave_idempotencia="caja1-0001")
+
+    assert segunda == primera
+    assert consultar("SELECT COUNT(*) FROM ventas") == [(1,)]
+    assert _stock(consultar, p) == 8
+    assert consultar("SELECT cantidad, total FROM ventas_diarias") == [(1, 5.0)]
+
+
+def test_stock_insuficiente_no_registra_nada(productos, consultar):
+    p, q = productos["P"], productos["Q"]
+    with pytest.raises(StockInsuficienteError) as error:
+        VentaRepo.crear_venta(1, [_item(p, 1, 2.5), _item(q, 6, 4.0)])
+
+    assert error.value.lineas == [{"producto_id": q, "nombre": "Q", "cantidad": 6, "disponible": 5}]
+    assert consultar("SELECT COUNT(*) FROM ventas") == [(0,)]
+    assert consultar("SELECT COUNT(*) FROM detalle_venta") == [(0,)]
+    assert consultar("SELECT COUNT(*) FROM movimientos_stock") == [(0,)]
+    assert _stock(consultar, p) == 10
+    assert _stock(consultar, q) == 5
+
+
+def test_sin_controlar_stock_la_venta_pasa_y_queda_negativo(productos, consultar):
+    q = productos["Q"]
+    VentaRepo.crear_venta(1, [_item(q, 6, 4.0)], controlar_stock=False)
+
+    assert _stock(consultar, q) == -1
+    assert consultar("SELECT cantidad, stock_anterior, stock_nuevo FROM movimientos_stock") == [(6, 5, -1)]
+
+
+def test_reserva_retiene_stock_hasta_vender_o_liberar(productos, consultar):
+    q = productos["Q"]
+    VentaRepo.reservar_stock("c1", [_item(q, 4, 4.0)])
+
+    # Otro carrito solo ve lo que no está reservado
+    with pytest.raises(StockInsuficienteError) as error:
+        VentaRepo.reservar_stock("c2", [_item(q, 2, 4.0)])
+    assert error.value.lineas[0]["disponible"] == 1
+    with pytest.raises(StockInsuficienteError):
+        VentaRepo.crear_venta(1, [_item(q, 2, 4.0)])
+
+    # La venta del carrito consume su propia reserva
+    VentaRepo.crear_venta(1, [_item(q, 4, 4.0)], carrito="c1")
+    assert _stock(consultar, q) == 1
+    assert consultar("SELECT COUNT(*) FROM reservas_stock") == [(0,)]
+
+    VentaRepo.reservar_stock("c2", [_item(q, 1, 4.0)])
+    VentaRepo.liberar_reserva("c2")
+    VentaRepo.crear_venta(1, [_item(q, 1, 4.0)])
+    assert _stock(consultar, q) == 0
+
+
+def test_listar_completo_devuelve_las_mas_recientes_con_items(productos):
+    p, q = productos["P"], productos["Q"]
+    base = datetime.datetime(2024, 3, 1, 10, 0)
+    ids = [VentaRepo.crear_venta(1, [_item(p, 1, 2.5), _item(q, 1, 4.0)],
+                                 fecha=base + datetime.timedelta(hours=h))
+           for h in range(4)]
+
+    pagina = VentaRepo.listar_completo(2)
+    assert [v["id"] for v in pagina] == [ids[3], ids[2]]
+    assert sorted(it["producto"] for it in pagina[0]["items"]) == ["P", "Q"]
+
+    acotadas = VentaRepo.listar_completo(10, base + datetime.timedelta(hours=1), base + datetime.timedelta(hours=3))
+    assert [v["id"] for v in acotadas] == [ids[2], ids[1]]
+    assert VentaRepo.listar_completo(10, datetime.datetime(2024, 4, 1)) == []
+
+
+def test_ventas_por_fecha_incluye_ambos_dias_y_excluye_el_siguiente(productos):
+    p = productos["P"]
+    fechas = [datetime.datetime(2024, 5, 1, 0, 0, 0),
+              datetime.datetime(2024, 5, 2, 23, 59, 59),
+              datetime.datetime(2024, 5, 3, 0, 0, 0)]
+    ids = [VentaRepo.crear_venta(1, [_item(p, 1, 2.5)], fecha=f) for f in fechas]
+
+    ventas = VentaRepo.obtener_ventas_por_fecha("2024-05-01", "2024-05-02")
+    assert [v["id"] for v in ventas] == [ids[1], ids[0]]
+    assert [v["id"] for v in VentaRepo.obtener_ventas_por_fecha("2024-05-03", "2024-05-03")] == [ids[2]]
+
+
+def test_listar_desde_con_margen_devuelve_ventas_con_id_menor(productos):
+    p = productos["P"]
+    base = datetime.datetime(2024, 6, 1, 12, 0, 0)
+    tardia = VentaRepo.crear_venta(1, [_item(p, 1, 2.5)], fecha=base)   # confirmó después de la siguiente
+    vista = VentaRepo.crear_venta(1, [_item(p, 1, 2.5)], fecha=base + datetime.timedelta(seconds=1))
+
+    assert VentaRepo.listar_desde(vista) == []
+    repetidas = VentaRepo.listar_desde(vista, base + datetime.timedelta(seconds=1) - datetime.timedelta(seconds=10))
+    assert [v["id"] for v in repetidas] == [vista, tardia]
+
+
+def test_listar_cambios_desde_la_marca_incluye_la_marca(productos):
+    q = productos["Q"]
+    marca = max(p["fecha_modificacion"] for p in ProductoRepo.listar())
+    assert q in {c["id"] for c in ProductoRepo.listar_cambios(marca, q)}
+    assert ProductoRepo.listar_cambios(marca + datetime.timedelta(seconds=1), q) == []
+
+
+def test_totales_con_horas_no_redondean_a_dias(productos):
+    p = productos["P"]
+    base = datetime.datetime(2024, 7, 1, 9, 0)
+    VentaRepo.crear_venta(1, [_item(p, 1, 2.5)], fecha=base, forma_pago="EFECTIVO")
+    VentaRepo.crear_venta(1, [_item(p, 2, 2.5)], fecha=base + datetime.timedelta(hours=6), forma_pago="TARJETA")
+
+    desde, hasta = base + datetime.timedelta(hours=1), datetime.datetime(2024, 7, 2)
+    formas = VentaRepo.totales_por_forma_pago(desde, hasta)
+    assert [(f["forma_pago"], f["cantidad"], f["total"]) for f in formas] == [("TARJETA", 1, 5.0)]
+    assert [(d["dia"], d["cantidad"]) for d in VentaRepo.totales_por_dia(desde, hasta)] == [("2024-07-01", 1)]
+    # Días completos: del resumen ventas_diarias
+    assert [(d["dia"], d["cantidad"]) for d in VentaRepo.totales_por_dia(datetime.date(2024, 7, 1), hasta)] \
+        == [("2024-07-01", 2)]
+    assert VentaRepo.resumen_periodo(desde, hasta)["total_ventas"] == 1
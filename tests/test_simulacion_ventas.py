@@ -0,0 +1,40 @@
+import pytest
+
+from repos import ProductoRepo, PuntoVentaRepo, StockInsuficienteError, VentaRepo
+from simulacion_ventas import SimuladorVentasPro
+
+
+@pytest.fixture
+def simulador(bd):
+    for i in range(1, 6):
+        ProductoRepo.agregar(f"Producto {i}", 2.0, 20, None, f"P-{i}")
+    PuntoVentaRepo.agregar("Centro", "Calle 1", "111")
+    PuntoVentaRepo.agregar("Abasto", "Calle 2", "222")
+    simulador = SimuladorVentasPro()
+    assert simulador.preparar()
+    return simulador
+
+
+def test_armar_venta_usa_el_punto_de_venta_de_la_bd(simulador):
+    venta = simulador.armar_venta()
+
+    abasto = next(p["id"] for p in PuntoVentaRepo.listar() if p["nombre"] == "Abasto")
+    assert venta["punto_venta_id"] == abasto
+    assert venta["forma_pago"] in ("EFECTIVO", "TARJETA", "TRANSFERENCIA")
+    assert 1 <= len(venta["items"]) <= 5
+    VentaRepo.crear_venta(**venta)
+
+
+def test_registrar_resultado_actualiza_el_stock_local(simulador):
+    venta = simulador.armar_venta()
+    VentaRepo.crear_venta(**venta)
+    simulador.registrar_resultado(venta)
+
+    stock_bd = ProductoRepo.stock_por_ids([it["producto_id"] for it in venta["items"]])
+    for it in venta["items"]:
+        assert simulador._productos_por_id[it["producto_id"]]["stock"] == stock_bd[it["producto_id"]]
+
+    item = venta["items"][0]
+    error = StockInsuficienteError([(item["producto_id"], item["nombre"], 50, 0)])
+    simulador.registrar_resultado(venta, error)
+    assert simulador._productos_por_id[item["producto_id"]]["stock"] == 0
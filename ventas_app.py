@@ -2,16 +2,45 @@ import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog, filedialog
 from nueva_venta import NuevaVentaFrame
 from repos import ProductoRepo, VentaRepo, CategoriaRepo, PuntoVentaRepo
+from indice_productos import IndiceProductos, normalizar
 import datetime
 from simulacion_ventas import SimulacionVentasFrame
-import pandas as pd
+import importlib
 import os
+import threading
 import traceback # Importar para depuración de gráficos
+from config import (PRECARGAR_DEPENDENCIAS, VENTAS_ASINCRONAS, MODO_OFFLINE, DIARIO_RECHAZADAS_PATH,
+                    SYNC_SOLAPAMIENTO, servidor_no_disponible)
 
-# --- INICIO: AGREGADO DE IMPORTS ---
-import matplotlib.pyplot as plt
-from matplotlib.figure import Figure
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+# --- Dependencias pesadas (pandas, matplotlib, reportlab) ---
+# No se importan al arrancar: el login y el POS aparecen sin esperarlas.
+# Se cargan con el primer reporte/gráfico/PDF o con la precarga tras el login.
+MODULOS_PRECARGA = (
+    "pandas",
+    "matplotlib.figure",
+    "matplotlib.backends.backend_tkagg",
+    "reportlab.pdfgen.canvas",
+)
+
+def _pandas():
+    import pandas as pd
+    return pd
+
+def _matplotlib_tk():
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+    return Figure, FigureCanvasTkAgg
+
+def precargar_dependencias():
+    """Importa en un hilo las dependencias pesadas para que su primer uso no espere"""
+    def hilo():
+        for nombre in MODULOS_PRECARGA:
+            try:
+                importlib.import_module(nombre)
+            except Exception as e:
+                # Opcional: si falta, el error se informa al usarla
+                print(f"Precarga: no se pudo importar {nombre}: {e}")
+    threading.Thread(target=hilo, name="precarga-dependencias", daemon=True).start()
 
 # --- CAMBIO IMPORTANTE: Importamos desde el nuevo archivo theme.py ---
 try:
@@ -37,57 +66,67 @@ LOGO_PATH = "logo_pos_kiosko.png"
 class ReportesManager:
     """Gestor profesional de reportes del sistema"""
     
+    @staticmethod
+    def _pedir_periodo(parent_frame):
+        """
+        Pide un mes (MM/AAAA, por defecto el actual) o un año (AAAA) y
+        devuelve (desde, hasta, texto) con el rango [desde, hasta)
+        """
+        hoy = datetime.date.today()
+        texto = simpledialog.askstring(
+            "Período del reporte", "Mes (MM/AAAA) o año (AAAA) a reportar:",
+            initialvalue=hoy.strftime("%m/%Y"), parent=parent_frame
+        )
+        if not texto:
+            return None
+        texto = texto.strip()
+        try:
+            if "/" in texto:
+                inicio = datetime.datetime.strptime(texto, "%m/%Y")
+                fin = inicio.replace(year=inicio.year + 1, month=1) if inicio.month == 12 else inicio.replace(month=inicio.month + 1)
+            else:
+                inicio = datetime.datetime.strptime(texto, "%Y")
+                fin = inicio.replace(year=inicio.year + 1)
+        except ValueError:
+            messagebox.showerror("Período inválido", f"'{texto}' no es un mes (MM/AAAA) ni un año (AAAA) válido.")
+            return None
+        return inicio, fin, texto
+
     @staticmethod
     def generar_reporte_ventas_completo(parent_frame):
         """Generar reporte completo de ventas en Excel"""
         try:
+            periodo = ReportesManager._pedir_periodo(parent_frame)
+            if not periodo:
+                return
+            desde, hasta, texto_periodo = periodo
             # Los reportes SIEMPRE deben consultar datos frescos de la BD
-            ventas = VentaRepo.listar_completo()
-            if not ventas:
-                messagebox.showwarning("Sin datos", "No hay ventas registradas para generar reporte.")
+            if not VentaRepo.listar_completo(1, desde, hasta):
+                messagebox.showwarning("Sin datos", f"No hay ventas registradas en {texto_periodo}.")
                 return
 
-            # Crear DataFrames organizados
-            df_ventas = ReportesManager._crear_dataframe_ventas(ventas)
-            df_productos_vendidos = ReportesManager._crear_dataframe_productos_vendidos(ventas)
-            df_resumen = ReportesManager._crear_dataframe_resumen(ventas)
-
             # Seleccionar ubicación para guardar
             fecha_actual = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
             ruta = filedialog.asksaveasfilename(
                 defaultextension=".xlsx",
                 filetypes=[
                     ("Excel Workbook", "*.xlsx"),
-                    ("Excel 97-2003", "*.xls"),
-                    ("PDF", "*.pdf"),
                     ("Todos los archivos", "*.*")
                 ],
                 title="Guardar reporte de ventas como...",
-                initialfile=f"Reporte_Ventas_Completo_{fecha_actual}"
+                initialfile=f"Reporte_Ventas_{texto_periodo.replace('/', '_')}_{fecha_actual}"
             )
 
             if not ruta:
                 return
 
-            # Guardar en Excel con formato profesional
-            with pd.ExcelWriter(ruta, engine='openpyxl') as writer:
-                # Hoja de resumen ejecutivo
-                df_resumen.to_excel(writer, sheet_name="📊 Resumen Ejecutivo", index=False)
-                
-                # Hoja de ventas detalladas
-                df_ventas.to_excel(writer, sheet_name="🧾 Ventas Detalladas", index=False)
-                
-                # Hoja de productos más vendidos
-                df_productos_vendidos.to_excel(writer, sheet_name="📦 Productos Vendidos", index=False)
-                
-                # Aplicar formatos profesionales
-                ReportesManager._aplicar_formato_excel(writer, ruta)
+            resumen = ReportesManager._exportar_ventas_excel(ruta, desde, hasta, texto_periodo)
 
             messagebox.showinfo(
                 "✅ Reporte Generado", 
                 f"Reporte creado exitosamente:\n\n"
-                f"📊 {len(ventas)} ventas procesadas\n"
-                f"📦 {len(df_productos_vendidos)} productos analizados\n"
+                f"📊 {resumen['total_ventas']} ventas procesadas\n"
+                f"📦 {len(resumen['productos'])} productos analizados\n"
                 f"📁 Ubicación: {os.path.basename(ruta)}"
             )
 
@@ -96,132 +135,92 @@ class ReportesManager:
                 "❌ Error", 
                 f"No se pudo generar el reporte:\n\n{str(e)}\n\n"
                 f"Verifique que:\n"
-                f"• Tenga instalado Microsoft Excel o openpyxl\n"
+                f"• Tenga instalado xlsxwriter u openpyxl\n"
                 f"• Los datos estén correctos en la base de datos"
             )
 
     @staticmethod
-    def _crear_dataframe_ventas(ventas):
-        """Crear DataFrame detallado de ventas"""
-        datos_ventas = []
-        
-        for venta in ventas:
-            # Información básica de la venta
-            datos_ventas.append({
-                "ID Venta": venta["id"],
-                "Fecha": venta["fecha"].strftime("%d/%m/%Y"),
-                "Hora": venta["fecha"].strftime("%H:%M:%S"),
-                "Total ($)": float(venta["total"]),
-                "Forma de Pago": venta["forma_pago"],
-                "Cantidad de Productos": sum(item["cantidad"] for item in venta.get("items", [])),
-                "Productos": ", ".join([f"{item['producto']} (x{item['cantidad']})" 
-                                      for item in venta.get("items", [])])
-            })
-        
-        return pd.DataFrame(datos_ventas)
+    def _exportar_ventas_excel(ruta, desde, hasta, texto_periodo):
+        """
+        Escribe el reporte de ventas de [desde, hasta) en 'ruta'. Los totales
+        (resumen, productos, formas de pago, días) se calculan en la BD y solo
+        viajan las filas agregadas; el detalle se lee de un cursor y se
+        escribe venta por venta, sin acumularlo en memoria.
+        """
+        from exportar_excel import LibroExcelStreaming
 
-    @staticmethod
-    def _crear_dataframe_productos_vendidos(ventas):
-        """Crear DataFrame de productos más vendidos"""
-        productos_vendidos = {}
-        
-        for venta in ventas:
-            for item in venta.get("items", []):
-                nombre_producto = item["producto"]
-                cantidad = item["cantidad"]
-                precio_unitario = item["precio_unitario"]
-                total_producto = cantidad * precio_unitario
-                
-                if nombre_producto in productos_vendidos:
-                    productos_vendidos[nombre_producto]["cantidad_total"] += cantidad
-                    productos_vendidos[nombre_producto]["ingresos_totales"] += total_producto
-                else:
-                    productos_vendidos[nombre_producto] = {
-                        "cantidad_total": cantidad,
-                        "ingresos_totales": total_producto,
-                        "precio_promedio": precio_unitario
-                    }
-        
-        # Convertir a DataFrame y ordenar
-        df = pd.DataFrame([
-            {
-                "Producto": producto,
-                "Cantidad Total Vendida": datos["cantidad_total"],
-                "Ingresos Generados ($)": round(datos["ingresos_totales"], 2),
-                "Precio Promedio ($)": round(datos["precio_promedio"], 2)
-            }
-            for producto, datos in productos_vendidos.items()
-        ])
-        
-        return df.sort_values("Ingresos Generados ($)", ascending=False)
+        resumen = VentaRepo.resumen_periodo(desde, hasta)
+        resumen["productos"] = VentaRepo.totales_por_producto(desde, hasta)
+        resumen["formas_pago"] = VentaRepo.totales_por_forma_pago(desde, hasta)
+        resumen["dias"] = VentaRepo.totales_por_dia(desde, hasta)
+
+        with LibroExcelStreaming(ruta) as libro:
+            libro.hoja("📊 Resumen Ejecutivo", ["Métrica", "Valor"]).agregar_varias(
+                ReportesManager._filas_resumen(resumen, texto_periodo))
+
+            hoja_ventas = libro.hoja("🧾 Ventas Detalladas", [
+                "ID Venta", "Fecha", "Hora", "Total ($)", "Forma de Pago",
+                "Cantidad de Productos", "Productos"
+            ])
+            for venta in VentaRepo.recorrer_con_items(desde, hasta):
+                hoja_ventas.agregar(ReportesManager._fila_venta(venta))
+
+            libro.hoja("📦 Productos Vendidos", [
+                "Producto", "Cantidad Total Vendida", "Ingresos Generados ($)", "Precio Promedio ($)"
+            ]).agregar_varias(
+                (p["producto"], p["cantidad_total"], round(float(p["ingresos_totales"]), 2),
+                 round(float(p["precio_promedio"]), 2))
+                for p in resumen["productos"]
+            )
+
+            libro.hoja("📅 Ventas por Día", ["Día", "Ventas", "Total ($)"]).agregar_varias(
+                (datetime.datetime.strptime(d["dia"], "%Y-%m-%d").strftime("%d/%m/%Y"),
+                 d["cantidad"], round(float(d["total"]), 2))
+                for d in resumen["dias"]
+            )
+        return resumen
 
     @staticmethod
-    def _crear_dataframe_resumen(ventas):
-        """Crear DataFrame de resumen ejecutivo"""
-        if not ventas:
-            return pd.DataFrame({"Métrica": ["No hay datos"], "Valor": [""]})
-        
-        # Cálculos de resumen
-        total_ventas = len(ventas)
-        ingresos_totales = sum(venta["total"] for venta in ventas)
-        venta_promedio = ingresos_totales / total_ventas if total_ventas > 0 else 0
-        
-        # Productos vendidos
-        total_productos = sum(
-            sum(item["cantidad"] for item in venta.get("items", [])) 
-            for venta in ventas
+    def _fila_venta(venta):
+        """Fila de la hoja de ventas detalladas para una venta con sus items"""
+        items = venta.get("items", [])
+        return (
+            venta["id"],
+            venta["fecha"].strftime("%d/%m/%Y"),
+            venta["fecha"].strftime("%H:%M:%S"),
+            float(venta["total"]),
+            venta["forma_pago"],
+            sum(item["cantidad"] for item in items),
+            ", ".join([f"{item['producto']} (x{item['cantidad']})" for item in items])
         )
-        
-        # Formas de pago
-        formas_pago = {}
-        for venta in ventas:
-            fp = venta["forma_pago"]
-            formas_pago[fp] = formas_pago.get(fp, 0) + 1
-        
-        # Crear resumen
-        resumen = {
-            "Período del Reporte": datetime.datetime.now().strftime("%d/%m/%Y %H:%M"),
-            "Total de Ventas": total_ventas,
-            "Ingresos Totales ($)": round(ingresos_totales, 2),
-            "Venta Promedio ($)": round(venta_promedio, 2),
-            "Total de Productos Vendidos": total_productos,
-            "Forma de Pago Más Usada": max(formas_pago.items(), key=lambda x: x[1])[0] if formas_pago else "N/A"
-        }
-        
-        return pd.DataFrame(list(resumen.items()), columns=["Métrica", "Valor"])
 
     @staticmethod
-    def _aplicar_formato_excel(writer, ruta):
-        """Aplicar formato profesional al archivo Excel"""
-        try:
-            workbook = writer.book
-            
-            # Aplicar formatos a cada hoja
-            for sheet_name in writer.sheets:
-                worksheet = writer.sheets[sheet_name]
-                
-                # Ajustar ancho de columnas automáticamente
-                for column in worksheet.columns:
-                    max_length = 0
-                    column_letter = column[0].column_letter
-                    
-                    for cell in column:
-                        try:
-                            if len(str(cell.value)) > max_length:
-                                max_length = len(str(cell.value))
-                        except:
-                            pass
-                    
-                    adjusted_width = min(max_length + 2, 50)
-                    worksheet.column_dimensions[column_letter].width = adjusted_width
-                
-        except Exception as e:
-            print(f"⚠️ No se pudieron aplicar formatos Excel: {e}")
+    def _filas_resumen(resumen, texto_periodo):
+        """Filas (métrica, valor) del resumen ejecutivo, a partir de los agregados de la BD"""
+        total_ventas = resumen["total_ventas"]
+        if not total_ventas:
+            return [("No hay datos", "")]
+        ingresos_totales = float(resumen["ingresos_totales"])
+        formas_pago = resumen["formas_pago"]
+
+        filas = [
+            ("Período del Reporte", texto_periodo),
+            ("Generado", datetime.datetime.now().strftime("%d/%m/%Y %H:%M")),
+            ("Total de Ventas", total_ventas),
+            ("Ingresos Totales ($)", round(ingresos_totales, 2)),
+            ("Venta Promedio ($)", round(ingresos_totales / total_ventas, 2)),
+            ("Total de Productos Vendidos", resumen["total_productos"]),
+            ("Forma de Pago Más Usada", formas_pago[0]["forma_pago"] if formas_pago else "N/A"),
+        ]
+        for fp in formas_pago:
+            filas.append((f"Ventas en {fp['forma_pago']}", f"{fp['cantidad']} (${float(fp['total']):,.2f})"))
+        return filas
 
     @staticmethod
     def generar_reporte_stock():
         """Generar reporte de inventario y stock"""
         try:
+            pd = _pandas()
             # Los reportes SIEMPRE deben consultar datos frescos de la BD
             try:
                 productos = ProductoRepo.listar_para_reporte()
@@ -329,6 +328,18 @@ class VentasApp(tk.Tk):
         self.cache_categorias = []
         self.cache_ventas = []
         self.cache_puntos_venta = []
+        # Totales y cantidad de ventas por día de la última semana (resumen ventas_diarias)
+        self.cache_resumen_diario = []
+        # Índice O(1) sobre cache_productos (código de barras, id, nombre)
+        self.indice_productos = IndiceProductos()
+        # Marcas de agua para la sincronización incremental
+        self._sync_fecha_productos = None
+        self._sync_fecha_ventas = None
+        self._sync_max_producto_id = 0
+        self._sync_max_venta_id = 0
+        # Recarga en segundo plano: solo una a la vez, la siguiente queda pendiente
+        self.sincronizando = False
+        self._sync_pendiente = None
         # --- FIN CACHÉ CENTRAL ---
 
         self._setup_modern_styles()
@@ -346,13 +357,36 @@ class VentasApp(tk.Tk):
         # F5 ahora llama a la función de recarga total
         self.bind("<F5>", lambda e: self.refresh_all_caches_and_tabs())
         
-        # --- CORRECCIÓN: ORDEN DE INICIO ---
-        # 1. Cargar el caché primero
-        self.refresh_all_caches_and_tabs(silencioso=True)
-        # 2. Crear las pestañas DESPUÉS de que el caché tenga datos
+        # Las pestañas se crean con el caché vacío y se redibujan cuando
+        # termina la primera carga (que corre en segundo plano)
         self._create_tabs()
-        # --- FIN CORRECCIÓN ---
-        
+        self.refresh_all_caches_and_tabs(silencioso=True)
+        self._verificar_esquema_en_hilo()
+
+        # Ventas asíncronas o encoladas sin conexión: arrancar el envío ya
+        # (reenvía lo que quedó en el diario de la ejecución anterior)
+        if VENTAS_ASINCRONAS or MODO_OFFLINE:
+            from diario_ventas import get_envio_ventas
+            get_envio_ventas().suscribir(self._on_venta_enviada)
+
+        # Precarga opcional de pandas/matplotlib/reportlab, una vez dibujada la ventana
+        if PRECARGAR_DEPENDENCIAS:
+            self.after(3000, precargar_dependencias)
+        
+    def _verificar_esquema_en_hilo(self):
+        """Avisa al arrancar si a la BD le faltan migraciones (la app no las aplica)"""
+        def verificar():
+            from migraciones import verificar_esquema, EsquemaDesactualizadoError
+            try:
+                verificar_esquema()
+            except EsquemaDesactualizadoError as e:
+                mensaje = str(e)   # 'e' deja de existir al salir del except
+                self.after(0, lambda: messagebox.showerror("Base de datos desactualizada", mensaje))
+            except Exception as e:
+                print(f"No se pudo verificar el esquema de la BD: {e}")
+
+        threading.Thread(target=verificar, daemon=True).start()
+
     def _setup_modern_styles(self):
         """Configurar estilos modernos con colores explícitos"""
         style = ttk.Style(self)
@@ -476,22 +510,26 @@ class VentasApp(tk.Tk):
             self.stats_label.config(text="Error cargando stats")
         
     def _create_tabs(self):
-        """Crear las pestañas del sistema"""
-        self.tab_dashboard = DashboardFrame(self.nb)
-        self.tab_nueva_venta = NuevaVentaFrame(self.nb)
-        self.tab_productos = ProductosFrame(self.nb)
-        self.tab_categorias = CategoriasFrame(self.nb) 
-        self.tab_historial = HistorialVentasFrame(self.nb)
-        self.tab_puntos = PuntosVentaFrame(self.nb)
-        self.tab_simulacion = SimulacionVentasFrame(self.nb)
-        
-        self.nb.add(self.tab_dashboard, text="📊 Dashboard")
-        self.nb.add(self.tab_nueva_venta, text="💰 Nueva Venta")
-        self.nb.add(self.tab_productos, text="📦 Productos")
-        self.nb.add(self.tab_categorias, text="📂 Categorías")
-        self.nb.add(self.tab_historial, text="🧾 Historial Ventas")
-        self.nb.add(self.tab_puntos, text="🏪 Puntos de Venta")
-        self.nb.add(self.tab_simulacion, text="🎮 Simular Ventas")
+        """
+        Crear las pestañas del sistema. Cada una es un contenedor vacío: el
+        frame real (self.tab_*) se construye la primera vez que se selecciona,
+        así las pestañas que el rol nunca ve no cuestan tiempo ni memoria.
+        """
+        pestanas = (
+            ("tab_dashboard", DashboardFrame, "📊 Dashboard"),
+            ("tab_nueva_venta", NuevaVentaFrame, "💰 Nueva Venta"),
+            ("tab_productos", ProductosFrame, "📦 Productos"),
+            ("tab_categorias", CategoriasFrame, "📂 Categorías"),
+            ("tab_historial", HistorialVentasFrame, "🧾 Historial Ventas"),
+            ("tab_puntos", PuntosVentaFrame, "🏪 Puntos de Venta"),
+            ("tab_simulacion", SimulacionVentasFrame, "🎮 Simular Ventas"),
+        )
+        self._pestanas = {}
+        for atributo, clase, titulo in pestanas:
+            pestana = PestanaDiferida(self.nb, clase,
+                                      lambda frame, atributo=atributo: setattr(self, atributo, frame))
+            self._pestanas[atributo] = pestana
+            self.nb.add(pestana, text=titulo)
         
         self.nb.bind("<<NotebookTabChanged>>", self._on_tab_change)
     
@@ -509,6 +547,9 @@ class VentasApp(tk.Tk):
                                foreground="#7f8c8d")
         status_label.pack(side="left", padx=10, pady=5)
         
+        # Indicador de recarga en curso (se muestra solo mientras dura)
+        self.progress_sync = ttk.Progressbar(status_frame, mode="indeterminate", length=120)
+        
         self.time_label = ttk.Label(status_frame,
                                   font=("Segoe UI", 9),
                                   foreground="#7f8c8d")
@@ -524,8 +565,12 @@ class VentasApp(tk.Tk):
     def _get_ventas_hoy_from_cache(self):
         """Obtener número de ventas de hoy (desde el caché)"""
         try:
-            ventas = self.cache_ventas
             hoy = datetime.datetime.now().date()
+            if self.cache_resumen_diario:
+                hoy_texto = hoy.strftime("%Y-%m-%d")
+                return sum(d["cantidad"] for d in self.cache_resumen_diario if d["fecha"] == hoy_texto)
+            # Sin resumen (p. ej. sin conexión): contar en las últimas ventas cacheadas
+            ventas = self.cache_ventas
             ventas_hoy = sum(1 for v in ventas if v['fecha'].date() == hoy)
             return ventas_hoy
         except:
@@ -540,60 +585,547 @@ class VentasApp(tk.Tk):
             
         self.status_text.set(f"Vista activa: {tab_name}")
         
-        # Llamar a .load() de la pestaña (ahora usa caché y es rápido)
-        selected_tab_widget = self.nametowidget(self.nb.select())
-        if hasattr(selected_tab_widget, 'load'):
+        # Construir la pestaña si es la primera vez y recargarla solo si quedó desactualizada
+        pestana = self._pestana_visible()
+        if pestana is not None:
             try:
-                selected_tab_widget.load()
+                pestana.mostrar()
             except Exception as e:
                 print(f"Error cargando la pestaña {tab_name}: {e}")
+
+    def _pestana_visible(self):
+        try:
+            seleccionada = self.nb.select()
+            pestana = self.nametowidget(seleccionada) if seleccionada else None
+        except (tk.TclError, KeyError):
+            return None
+        return pestana if isinstance(pestana, PestanaDiferida) else None
+
+    def _recargar_pestana(self, pestana):
+        """Recarga la pestaña ya si está a la vista; si no, la marca para cuando se muestre"""
+        pestana.invalidar()
+        if pestana is self._pestana_visible():
+            pestana.mostrar()
     
     def refresh_all_caches_and_tabs(self, silencioso=False):
         """
         FUNCIÓN CLAVE (F5): 
-        1. Llama a la BD para recargar todos los cachés.
-        2. Llama a refresh_all_tabs_from_cache() para actualizar las vistas.
+        1. Recarga todos los cachés desde la BD en un hilo de trabajo.
+        2. En el hilo de Tk los reemplaza de una vez y redibuja las vistas.
+        """
+        self._sincronizar_en_hilo("completa", self._cargar_todo,
+                                  lambda datos: self._aplicar_carga_completa(datos, silencioso),
+                                  "Actualizando cachés de la base de datos...",
+                                  silencioso=silencioso)
+
+    @staticmethod
+    def _cargar_todo():
+        """Hilo de trabajo: consultas a la BD y armado del índice (sin tocar Tk)"""
+        productos = ProductoRepo.listar()
+        return {
+            "productos": productos,
+            "indice": IndiceProductos(productos),
+            "categorias": CategoriaRepo.listar(),
+            "ventas": VentaRepo.listar(limit=1000),
+            "puntos_venta": PuntoVentaRepo.listar(),
+            "resumen_diario": VentaRepo.obtener_resumen_ventas_diarias(7),
+        }
+
+    def _aplicar_carga_completa(self, datos, silencioso):
+        self.cache_productos = datos["productos"]
+        # Mismo objeto índice: las pestañas que lo referencian ven el nuevo contenido
+        self.indice_productos.adoptar(datos["indice"])
+        self.cache_categorias = datos["categorias"]
+        self.cache_ventas = datos["ventas"]
+        self.cache_puntos_venta = datos["puntos_venta"]
+        self.cache_resumen_diario = datos["resumen_diario"]
+        self._actualizar_marcas_sync(self.cache_productos, self.cache_ventas)
+
+        self.status_text.set("Cachés actualizados. Refrescando vistas...")
+
+        # Actualizar stats del header con los nuevos datos
+        self._update_header_stats()
+
+        # Ahora, refrescar todas las vistas (leyendo del caché)
+        self.refresh_all_tabs_from_cache()
+
+        self.status_text.set("Sistema actualizado.")
+        if not silencioso:
+            messagebox.showinfo("Actualizado", "Toda la información ha sido actualizada desde la base de datos.")
+
+    def _sincronizar_en_hilo(self, tipo, trabajo, al_terminar, mensaje, silencioso=True, **opciones):
         """
-        self.status_text.set("Actualizando cachés de la base de datos...")
+        Ejecuta 'trabajo' (consultas a la BD) en un hilo y entrega su resultado
+        a 'al_terminar' en el hilo de Tk vía after(). Si ya hay una recarga en
+        curso, la nueva queda pendiente (una completa absorbe a las incrementales).
+        """
+        if self.sincronizando:
+            pendiente = self._sync_pendiente
+            if tipo == "completa" or pendiente is None:
+                self._sync_pendiente = {"tipo": tipo, "silencioso": silencioso, **opciones}
+            elif pendiente["tipo"] == "incremental":
+                for clave, valor in opciones.items():
+                    pendiente[clave] = pendiente.get(clave) or valor
+            return
+
+        self.sincronizando = True
+        self.status_text.set(mensaje)
+        self.progress_sync.pack(side="right", padx=10, pady=5)
+        self.progress_sync.start(15)
+
+        def hilo():
+            try:
+                resultado, error = trabajo(), None
+            except Exception as e:
+                resultado, error = None, e
+            try:
+                self.after(0, lambda: self._fin_sincronizacion(al_terminar, resultado, error, silencioso))
+            except RuntimeError:
+                pass  # La ventana se cerró mientras se consultaba la BD
+
+        threading.Thread(target=hilo, name=f"sync-{tipo}", daemon=True).start()
+
+    def _fin_sincronizacion(self, al_terminar, resultado, error, silencioso):
+        self.progress_sync.stop()
+        self.progress_sync.pack_forget()
         try:
-            self.cache_productos = ProductoRepo.listar()
-            self.cache_categorias = CategoriaRepo.listar()
-            self.cache_ventas = VentaRepo.listar(limit=1000) 
-            self.cache_puntos_venta = PuntoVentaRepo.listar()
-            
-            self.status_text.set("Cachés actualizados. Refrescando vistas...")
-            
-            # Actualizar stats del header con los nuevos datos
+            if error is not None:
+                self.status_text.set("Error al recargar la información.")
+                if silencioso:
+                    print(f"Error al recargar la información: {error}")
+                else:
+                    messagebox.showerror("Error de Carga", f"No se pudo recargar la información: {error}")
+            else:
+                al_terminar(resultado)
+                if servidor_no_disponible():
+                    self.status_text.set("⚠️ Sin conexión con el servidor: usando los datos locales")
+        finally:
+            self.sincronizando = False
+            # Avisar a las pestañas (p. ej. NuevaVenta procesa los escaneos en espera)
+            self.event_generate("<<CachesActualizados>>", when="tail")
+
+        pendiente, self._sync_pendiente = self._sync_pendiente, None
+        if pendiente is not None:
+            tipo = pendiente.pop("tipo")
+            silencioso = pendiente.pop("silencioso")
+            if tipo == "completa":
+                self.refresh_all_caches_and_tabs(silencioso=silencioso)
+            else:
+                self.refresh_incremental(**pendiente)
+
+    # Pestañas que dependen de cada caché (para redibujar solo las afectadas)
+    TABS_POR_CACHE = {
+        "productos": ("tab_dashboard", "tab_productos", "tab_categorias"),
+        "ventas": ("tab_dashboard", "tab_historial"),
+        "categorias": ("tab_categorias", "tab_productos"),
+        "puntos_venta": ("tab_puntos",),
+    }
+
+    def refresh_incremental(self, categorias=False, puntos_venta=False):
+        """
+        Sincronización delta (tras una venta o una edición): trae solo los
+        productos modificados (fecha_modificacion) y las ventas nuevas (id),
+        parchea los cachés en el lugar y redibuja solo las pestañas afectadas.
+        Categorías y puntos de venta no tienen fecha de modificación, así que
+        se recargan completos solo si se indica. Las consultas corren en un hilo.
+        """
+        if self._sync_fecha_productos is None and not self.cache_productos and not self.sincronizando:
+            # Nunca hubo carga completa: no hay desde dónde sincronizar
+            self.refresh_all_caches_and_tabs(silencioso=True)
+            return
+
+        def trabajo():
+            # Las marcas se leen al ejecutar (una recarga pendiente usa las más nuevas).
+            # Se pide desde un poco antes de cada marca: una transacción que confirmó
+            # tarde tiene una fecha (o un id) anterior a lo último visto.
+            ventas_nuevas = VentaRepo.listar_desde(self._sync_max_venta_id,
+                                                   self._con_solapamiento(self._sync_fecha_ventas))
+            return (ProductoRepo.listar_cambios(self._con_solapamiento(self._sync_fecha_productos),
+                                                self._sync_max_producto_id),
+                    ventas_nuevas,
+                    CategoriaRepo.listar() if categorias else None,
+                    PuntoVentaRepo.listar() if puntos_venta else None,
+                    # Lectura directa del resumen: no depende de cuántas ventas haya
+                    VentaRepo.obtener_resumen_ventas_diarias(7) if ventas_nuevas else None)
+
+        self._sincronizar_en_hilo("incremental", trabajo, self._aplicar_cambios_incrementales,
+                                  "Sincronizando cambios...",
+                                  categorias=categorias, puntos_venta=puntos_venta)
+
+    @staticmethod
+    def _con_solapamiento(marca):
+        return marca - datetime.timedelta(seconds=SYNC_SOLAPAMIENTO) if marca is not None else None
+
+    def _aplicar_cambios_incrementales(self, resultado):
+        cambios_productos, ventas_nuevas, nuevas_categorias, nuevos_puntos, resumen_diario = resultado
+        afectadas = set()
+        productos_cambiados = self._aplicar_cambios_productos(cambios_productos) if cambios_productos else []
+        if productos_cambiados:
+            afectadas.add("productos")
+        # La ventana se solapa con la anterior: descartar las ventas que ya están
+        vistas = {v['id'] for v in self.cache_ventas}
+        ventas_nuevas = [v for v in ventas_nuevas if v['id'] not in vistas]
+        if ventas_nuevas:
+            # cache_ventas está ordenado por fecha DESC y limitado a 1000; una
+            # venta confirmada tarde puede caer en el medio
+            self.cache_ventas[:0] = ventas_nuevas
+            self.cache_ventas.sort(key=lambda v: (v['fecha'], v['id']), reverse=True)
+            del self.cache_ventas[1000:]
+            if resumen_diario:
+                self.cache_resumen_diario = resumen_diario
+            afectadas.add("ventas")
+        if nuevas_categorias is not None:
+            self.cache_categorias = nuevas_categorias
+            self._aplicar_nombres_categorias()
+            afectadas.add("categorias")
+        if nuevos_puntos is not None:
+            self.cache_puntos_venta = nuevos_puntos
+            afectadas.add("puntos_venta")
+
+        self._actualizar_marcas_sync(cambios_productos, ventas_nuevas)
+        if afectadas & {"productos", "ventas"}:
             self._update_header_stats()
-            
-            # Ahora, refrescar todas las vistas (leyendo del caché)
-            self.refresh_all_tabs_from_cache()
-            
-            self.status_text.set("Sistema actualizado.")
-            if not silencioso:
-                messagebox.showinfo("Actualizado", "Toda la información ha sido actualizada desde la base de datos.")
+        self.refresh_tabs_from_cache(afectadas)
+        self.status_text.set(f"Sincronizado: {len(productos_cambiados)} productos, "
+                             f"{len(ventas_nuevas)} ventas nuevas.")
 
-        except Exception as e:
-            self.status_text.set("Error al recargar la información.")
-            messagebox.showerror("Error de Carga", f"No se pudo recargar la información: {e}")
+    def _on_venta_enviada(self, clave, venta_id, error, pendientes):
+        """Aviso del hilo de envío de ventas (se pasa al hilo de Tk)"""
+        from diario_ventas import VentaRechazadaError
+        def aplicar():
+            if error is None:
+                self.status_text.set(f"Venta L-{clave[:8].upper()} guardada como #{venta_id} "
+                                     f"({pendientes} pendientes)")
+                self.refresh_incremental()
+            elif isinstance(error, VentaRechazadaError):
+                self.status_text.set(f"❌ Venta L-{clave[:8].upper()} rechazada ({pendientes} pendientes)")
+                messagebox.showerror(
+                    "Venta rechazada",
+                    f"La base de datos rechazó la venta L-{clave[:8].upper()}:\n{error.causa}\n\n"
+                    f"Quedó guardada en {DIARIO_RECHAZADAS_PATH} para revisarla.")
+            else:
+                self.status_text.set(f"⚠️ Sin conexión: {pendientes} ventas en el diario local, reintentando...")
+        try:
+            self.after(0, aplicar)
+        except RuntimeError:
+            pass  # La ventana ya se cerró
+
+    def _actualizar_marcas_sync(self, productos, ventas):
+        """Avanza las marcas de agua con las filas recién recibidas"""
+        for p in productos:
+            fecha = p.get('fecha_modificacion')
+            if fecha is not None and (self._sync_fecha_productos is None or fecha > self._sync_fecha_productos):
+                self._sync_fecha_productos = fecha
+            if p['id'] > self._sync_max_producto_id:
+                self._sync_max_producto_id = p['id']
+        for v in ventas:
+            if v['id'] > self._sync_max_venta_id:
+                self._sync_max_venta_id = v['id']
+            fecha = v.get('fecha')
+            if fecha is not None and (self._sync_fecha_ventas is None or fecha > self._sync_fecha_ventas):
+                self._sync_fecha_ventas = fecha
+
+    def _aplicar_cambios_productos(self, cambios):
+        """
+        Reemplaza/agrega productos en cache_productos (misma lista) y en el
+        índice. Devuelve los que de verdad cambiaron: los repetidos por el
+        solapamiento de la sincronización se ignoran.
+        """
+        posiciones = {p['id']: i for i, p in enumerate(self.cache_productos)}
+        aplicados = []
+        reordenar = False
+        for prod in cambios:
+            pos = posiciones.get(prod['id'])
+            if pos is None:
+                posiciones[prod['id']] = len(self.cache_productos)
+                self.cache_productos.append(prod)
+                reordenar = True
+            elif self.cache_productos[pos] == prod:
+                continue
+            else:
+                reordenar = reordenar or self.cache_productos[pos]['nombre'] != prod['nombre']
+                self.cache_productos[pos] = prod
+            aplicados.append(prod)
+        if reordenar:
+            # Mismo orden que el índice (nombre normalizado, id): sin mayúsculas ni acentos
+            self.cache_productos.sort(key=lambda p: (normalizar(p['nombre']), p['id']))
+        self.indice_productos.actualizar(aplicados)
+        return aplicados
+
+    def _aplicar_nombres_categorias(self):
+        """Propaga renombres de categorías a los productos del caché"""
+        nombres = {c['id']: c['nombre'] for c in self.cache_categorias}
+        cambiados = []
+        for prod in self.cache_productos:
+            nombre = nombres.get(prod.get('categoria_id'), '')
+            if prod.get('categoria', '') != nombre:
+                prod['categoria'] = nombre
+                cambiados.append(prod)
+        self.indice_productos.actualizar(cambiados)
+
+    def refresh_tabs_from_cache(self, caches):
+        """Redibuja solo las pestañas que dependen de los cachés indicados"""
+        atributos = []
+        for cache in caches:
+            for atributo in self.TABS_POR_CACHE.get(cache, ()):
+                if atributo not in atributos:
+                    atributos.append(atributo)
+        for atributo in atributos:
+            pestana = self._pestanas.get(atributo)
+            if pestana is not None:
+                try:
+                    self._recargar_pestana(pestana)
+                except Exception as e:
+                    print(f"Error actualizando pestaña {atributo} desde caché: {e}")
 
     def refresh_all_tabs_from_cache(self):
         """Actualiza todas las pestañas leyendo del caché (NO llama a la BD)."""
         self.status_text.set("Actualizando vistas...")
         
-        try:
-            for tab_widget in self.nb.tabs():
-                widget = self.nametowidget(tab_widget)
-                if hasattr(widget, 'load'):
-                    try:
-                        widget.load() # El 'load' de la pestaña usará el caché
-                    except Exception as e:
-                        print(f"Error actualizando pestaña desde caché: {e}")
-        except tk.TclError:
-            pass # Ocurre si las pestañas aún no están listas
+        # Solo se recarga la pestaña visible; el resto queda marcada para su próxima selección
+        for pestana in getattr(self, '_pestanas', {}).values():
+            try:
+                self._recargar_pestana(pestana) # El 'load' de la pestaña usará el caché
+            except Exception as e:
+                print(f"Error actualizando pestaña desde caché: {e}")
         
         self.status_text.set("Vistas actualizadas.")
 
+class PestanaDiferida(ttk.Frame):
+    """
+    Contenedor de una pestaña del Notebook: construye su contenido la primera
+    vez que se muestra y solo lo recarga (load) si quedó desactualizado.
+    """
+
+    def __init__(self, parent, fabrica, al_construir=None):
+        super().__init__(parent)
+        self._fabrica = fabrica
+        self._al_construir = al_construir
+        self.contenido = None
+        self.sucia = True
+
+    def mostrar(self):
+        if self.contenido is None:
+            self.contenido = self._fabrica(self)
+            if not self.contenido.winfo_manager():
+                self.contenido.pack(fill="both", expand=True)
+            if self._al_construir:
+                self._al_construir(self.contenido)
+        if self.sucia:
+            if hasattr(self.contenido, 'load'):
+                self.contenido.load()
+            self.sucia = False
+
+    def invalidar(self):
+        self.sucia = True
+
+
+class TablaVirtual:
+    """
+    Tabla virtualizada sobre un Treeview de create_modern_treeview.
+
+    El Treeview solo contiene las filas que entran en pantalla (un conjunto fijo
+    de ítems que se reutilizan); al desplazarse, ordenar o filtrar se reescriben
+    sus valores desde la lista en memoria, sin borrar ni insertar filas. La
+    selección se recuerda por clave, así sobrevive al desplazamiento.
+    """
+
+    ALTO_ENCABEZADO = 26  # se corrige con la posición real de la primera fila
+
+    def __init__(self, tree, formatear, clave=lambda fila: fila['id'], claves_orden=None):
+        self.tree = tree
+        self._formatear = formatear          # (fila, indice) -> (valores, tags)
+        self._clave = clave
+        self._claves_orden = claves_orden or {}
+        self._filas = []                     # filas cargadas (sin filtrar)
+        self._vista = []                     # filas filtradas y ordenadas
+        self._predicado = None
+        self._orden = None                   # (columna, descendente)
+        self._inicio = 0
+        self._slots = []                     # iids reutilizables del Treeview
+        self._visibles = set()
+        self._clave_sel = None
+        self._titulos = {c: tree.heading(c, "text") for c in tree["columns"]}
+
+        tree.configure(selectmode="browse")
+        # La barra vertical pasa a desplazar la lista virtual, no el Treeview
+        self._scroll = tree.master.grid_slaves(row=0, column=1)[0]
+        self._scroll.configure(command=self._on_scrollbar)
+        tree.configure(yscrollcommand=lambda *a: None)
+        for columna in tree["columns"]:
+            tree.heading(columna, command=lambda c=columna: self.ordenar(c))
+
+        tree.bind("<Configure>", self._on_configure, add="+")
+        tree.bind("<<TreeviewSelect>>", self._on_select, add="+")
+        tree.bind("<MouseWheel>", self._on_rueda)
+        tree.bind("<Button-4>", lambda e: self.desplazar(-3))
+        tree.bind("<Button-5>", lambda e: self.desplazar(3))
+        tree.bind("<Up>", lambda e: self._mover_seleccion(-1))
+        tree.bind("<Down>", lambda e: self._mover_seleccion(1))
+        tree.bind("<Prior>", lambda e: self._mover_seleccion(-max(1, len(self._slots) - 1)))
+        tree.bind("<Next>", lambda e: self._mover_seleccion(max(1, len(self._slots) - 1)))
+        tree.bind("<Home>", lambda e: self._mover_seleccion(-len(self._vista)))
+        tree.bind("<End>", lambda e: self._mover_seleccion(len(self._vista)))
+
+    # ----------------- API -----------------
+    def cargar(self, filas, conservar_posicion=True):
+        """Reemplaza los datos (aplica el filtro y el orden vigentes)"""
+        self._filas = list(filas)
+        if not conservar_posicion:
+            self._inicio = 0
+        self._recalcular_vista()
+
+    def filtrar(self, predicado=None):
+        """Filtra las filas cargadas sin volver a consultarlas"""
+        self._predicado = predicado
+        self._inicio = 0
+        self._recalcular_vista()
+
+    def ordenar(self, columna, descendente=None):
+        """Ordena por columna; sin 'descendente' alterna el sentido"""
+        if descendente is None:
+            descendente = self._orden is not None and self._orden[0] == columna and not self._orden[1]
+        self._orden = (columna, descendente)
+        for c, titulo in self._titulos.items():
+            flecha = (" ▼" if descendente else " ▲") if c == columna else ""
+            self.tree.heading(c, text=titulo + flecha)
+        self._recalcular_vista()
+
+    def desplazar(self, filas):
+        self._inicio += filas
+        self._dibujar()
+        return "break"
+
+    def fila_seleccionada(self):
+        i = self._indice_seleccion()
+        return self._vista[i] if i is not None else None
+
+    def __len__(self):
+        return len(self._vista)
+
+    # ----------------- Internos -----------------
+    def _recalcular_vista(self):
+        vista = self._filas
+        if self._predicado is not None:
+            vista = [f for f in vista if self._predicado(f)]
+        if self._orden is not None:
+            columna, descendente = self._orden
+            valor = self._claves_orden.get(columna, lambda f, c=columna: f.get(c))
+            vista = sorted(vista, key=lambda f: self._clave_comparable(valor(f)), reverse=descendente)
+        elif vista is self._filas:
+            vista = list(vista)
+        self._vista = vista
+        self._dibujar()
+
+    @staticmethod
+    def _clave_comparable(valor):
+        if valor is None:
+            return (1, 0)
+        if isinstance(valor, str):
+            return (0, valor.lower())
+        return (0, valor)
+
+    def _dibujar(self):
+        total = len(self._vista)
+        self._inicio = max(0, min(self._inicio, total - len(self._slots)))
+        seleccionar = ()
+        for n, iid in enumerate(self._slots):
+            i = self._inicio + n
+            if i < total:
+                fila = self._vista[i]
+                valores, tags = self._formatear(fila, i)
+                self.tree.item(iid, values=valores, tags=tags)
+                if iid not in self._visibles:
+                    self.tree.move(iid, "", n)
+                    self._visibles.add(iid)
+                if self._clave_sel is not None and self._clave(fila) == self._clave_sel:
+                    seleccionar = (iid,)
+            elif iid in self._visibles:
+                self.tree.detach(iid)
+                self._visibles.discard(iid)
+
+        if self.tree.selection() != seleccionar:
+            self.tree.selection_set(seleccionar)
+        if total:
+            self._scroll.set(self._inicio / total, min(1.0, (self._inicio + len(self._slots)) / total))
+        else:
+            self._scroll.set(0.0, 1.0)
+
+    def _ajustar_slots(self, cantidad):
+        while len(self._slots) < cantidad:
+            iid = self.tree.insert("", tk.END, iid=f"fila_virtual_{len(self._slots)}")
+            self._slots.append(iid)
+            self._visibles.add(iid)
+        while len(self._slots) > cantidad:
+            iid = self._slots.pop()
+            self._visibles.discard(iid)
+            self.tree.delete(iid)
+
+    def _on_configure(self, event):
+        alto_fila = int(ttk.Style(self.tree).lookup("Treeview", "rowheight") or 20)
+        encabezado = self.ALTO_ENCABEZADO
+        if self._visibles:
+            caja = self.tree.bbox(self._slots[0])
+            if caja:
+                encabezado = caja[1]
+        cantidad = max(1, (event.height - encabezado) // alto_fila)
+        if cantidad != len(self._slots):
+            self._ajustar_slots(cantidad)
+            self._dibujar()
+
+    def _on_scrollbar(self, accion, cantidad, unidad=None):
+        total = len(self._vista)
+        if accion == "moveto":
+            self._inicio = int(float(cantidad) * total)
+        elif unidad == "pages":
+            self._inicio += int(cantidad) * max(1, len(self._slots) - 1)
+        else:
+            self._inicio += int(cantidad)
+        self._dibujar()
+
+    def _on_rueda(self, event):
+        pasos = -int(event.delta / 120) if abs(event.delta) >= 120 else (-1 if event.delta > 0 else 1)
+        return self.desplazar(pasos * 3)
+
+    def _on_select(self, event=None):
+        seleccion = self.tree.selection()
+        if seleccion:
+            i = self._inicio + self._slots.index(seleccion[0])
+            if i < len(self._vista):
+                self._clave_sel = self._clave(self._vista[i])
+        elif self._clave_sel is not None and self._indice_en_pantalla(self._clave_sel) is not None:
+            # El usuario quitó la selección (no es una fila que salió de pantalla)
+            self._clave_sel = None
+
+    def _indice_en_pantalla(self, clave):
+        for i in range(self._inicio, min(self._inicio + len(self._slots), len(self._vista))):
+            if self._clave(self._vista[i]) == clave:
+                return i
+        return None
+
+    def _indice_seleccion(self):
+        if self._clave_sel is None:
+            return None
+        i = self._indice_en_pantalla(self._clave_sel)
+        if i is not None:
+            return i
+        return next((i for i, f in enumerate(self._vista) if self._clave(f) == self._clave_sel), None)
+
+    def _mover_seleccion(self, delta):
+        total = len(self._vista)
+        if not total:
+            return "break"
+        i = self._indice_seleccion()
+        i = self._inicio if i is None else max(0, min(total - 1, i + delta))
+        self._clave_sel = self._clave(self._vista[i])
+        if i < self._inicio:
+            self._inicio = i
+        elif i >= self._inicio + len(self._slots):
+            self._inicio = i - len(self._slots) + 1
+        self._dibujar()
+        return "break"
+
+
 class ModernBaseFrame(ttk.Frame):
     """Frame base modernizado con herramientas avanzadas"""
     
@@ -716,6 +1248,11 @@ class ModernBaseFrame(ttk.Frame):
         
         return tree
 
+    def create_virtual_treeview(self, columns_config, formatear, claves_orden=None, height=15):
+        """Treeview moderno virtualizado (ver TablaVirtual) para listas grandes del caché"""
+        tree = self.create_modern_treeview(columns_config, height=height)
+        return TablaVirtual(tree, formatear, claves_orden=claves_orden)
+
 # ---------------------------------------------------------------------
 # --- DASHBOARD FRAME (Modificado para usar Caché) ---
 # ---------------------------------------------------------------------
@@ -817,10 +1354,16 @@ class DashboardFrame(ModernBaseFrame):
                 fecha = hoy - datetime.timedelta(days=i)
                 datos[fecha.strftime("%Y-%m-%d")] = {"fecha": fecha.strftime("%Y-%m-%d"), "total": 0.0}
             
-            for v in ventas_cacheadas:
-                fecha_venta_str = v['fecha'].date().strftime("%Y-%m-%d")
-                if fecha_venta_str in datos:
-                    datos[fecha_venta_str]["total"] += float(v['total'])
+            if self.app_root.cache_resumen_diario:
+                # Totales por día ya calculados en la BD (ventas_diarias)
+                for d in self.app_root.cache_resumen_diario:
+                    if d["fecha"] in datos:
+                        datos[d["fecha"]]["total"] = d["total"]
+            else:
+                for v in ventas_cacheadas:
+                    fecha_venta_str = v['fecha'].date().strftime("%Y-%m-%d")
+                    if fecha_venta_str in datos:
+                        datos[fecha_venta_str]["total"] += float(v['total'])
             
             datos_lista = list(datos.values())
             
@@ -828,15 +1371,16 @@ class DashboardFrame(ModernBaseFrame):
                 ttk.Label(parent_frame, text="No hay datos de ventas para el gráfico.").pack()
                 return
 
-            df = pd.DataFrame(datos_lista)
-            df['fecha_corta'] = df['fecha'].apply(lambda x: x[5:]) 
+            Figure, FigureCanvasTkAgg = _matplotlib_tk()
+            fechas_cortas = [d['fecha'][5:] for d in datos_lista]
+            totales = [d['total'] for d in datos_lista]
 
             fig = Figure(figsize=(10, 4.5), dpi=100, facecolor=bg_color)
             
             ax = fig.add_subplot(111)
             ax.set_facecolor(bg_color) 
             
-            ax.bar(df['fecha_corta'], df['total'], color=accent_color)
+            ax.bar(fechas_cortas, totales, color=accent_color)
             
             ax.set_title("Ventas de los Últimos 7 Días", color=text_color, fontsize=14, weight='bold')
             ax.set_ylabel("Total ($)", color=text_color, fontsize=10)
@@ -896,7 +1440,12 @@ class ProductosFrame(ModernBaseFrame):
             ("estado", "Estado", 100, "center")
         ]
         
-        self.tree = self.create_modern_treeview(columns)
+        self.tabla = self.create_virtual_treeview(columns, self._formatear_producto, claves_orden={
+            "codigo": lambda p: p.get("codigo_barras") or "",
+            "estado": lambda p: p.get("activo", True),
+        })
+        self.tree = self.tabla.tree
+        self._ultima_busqueda = None
         
         self.tree.bind("<Double-1>", lambda e: self.edit())
         self.tree.bind("<Delete>", lambda e: self.toggle_estado())
@@ -911,11 +1460,11 @@ class ProductosFrame(ModernBaseFrame):
         self.filter_var = tk.StringVar(value="TODOS")
         
         ttk.Radiobutton(filter_frame, text="Todos", variable=self.filter_var, 
-                       value="TODOS", command=self.load).pack(side="left", padx=(0, 10))
+                       value="TODOS", command=self.aplicar_filtro_estado).pack(side="left", padx=(0, 10))
         ttk.Radiobutton(filter_frame, text="Activos", variable=self.filter_var, 
-                       value="ACTIVOS", command=self.load).pack(side="left", padx=(0, 10))
+                       value="ACTIVOS", command=self.aplicar_filtro_estado).pack(side="left", padx=(0, 10))
         ttk.Radiobutton(filter_frame, text="Inactivos", variable=self.filter_var, 
-                       value="INACTIVOS", command=self.load).pack(side="left")
+                       value="INACTIVOS", command=self.aplicar_filtro_estado).pack(side="left")
 
     def load(self):
         """Cargar productos desde el CACHÉ"""
@@ -923,53 +1472,49 @@ class ProductosFrame(ModernBaseFrame):
 
     def buscar_productos(self, query):
         """Buscar productos desde el CACHÉ con filtro de estado"""
-        
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-            
         try:
-            productos = self.app_root.cache_productos
-            filtro = self.filter_var.get()
-            
             if not query or query == "Buscar productos...":
                 query = "" 
             
-            query = query.lower()
-            
-            for idx, p in enumerate(productos):
-                if query:
-                    if not (query in p['nombre'].lower() or 
-                           query in p.get('codigo_barras', '').lower() or
-                           query in p.get('categoria', '').lower()):
-                        continue
-                
-                estado = "ACTIVO" if p.get('activo', True) else "INACTIVO"
-                if filtro == "ACTIVOS" and estado != "ACTIVO":
-                    continue
-                if filtro == "INACTIVOS" and estado != "INACTIVO":
-                    continue
-                
-                tags = ['even' if idx % 2 == 0 else 'odd']
-                if p['stock'] < 5:
-                    tags.append("warning")
-                if p['stock'] == 0:
-                    tags.append("danger")
-                if estado == "INACTIVO":
-                    tags.append("inactive")
-                
-                self.tree.insert("", tk.END, values=(
-                    p["id"],
-                    p["codigo_barras"],
-                    p["nombre"],
-                    f"${p['precio']:.2f}",
-                    p["stock"],
-                    p["categoria"],
-                    estado
-                ), tags=tuple(tags))
+            # Nombre, código y categoría se resuelven con el índice de búsqueda;
+            # la tabla virtual aplica el filtro de estado y el orden vigentes
+            productos = self.app_root.indice_productos.filtrar(query)
+            self.tabla.cargar(productos, conservar_posicion=(query == self._ultima_busqueda))
+            self._ultima_busqueda = query
                 
         except Exception as e:
             messagebox.showerror("Error", f"No se pudieron cargar los productos desde el caché:\n{str(e)}")
 
+    def aplicar_filtro_estado(self):
+        """Filtra por estado las filas ya cargadas (sin volver a buscar)"""
+        filtro = self.filter_var.get()
+        if filtro == "ACTIVOS":
+            self.tabla.filtrar(lambda p: p.get('activo', True))
+        elif filtro == "INACTIVOS":
+            self.tabla.filtrar(lambda p: not p.get('activo', True))
+        else:
+            self.tabla.filtrar(None)
+
+    @staticmethod
+    def _formatear_producto(p, idx):
+        estado = "ACTIVO" if p.get('activo', True) else "INACTIVO"
+        tags = ['even' if idx % 2 == 0 else 'odd']
+        if p['stock'] < 5:
+            tags.append("warning")
+        if p['stock'] == 0:
+            tags.append("danger")
+        if estado == "INACTIVO":
+            tags.append("inactive")
+        return (
+            p["id"],
+            p["codigo_barras"],
+            p["nombre"],
+            f"${p['precio']:.2f}",
+            p["stock"],
+            p["categoria"],
+            estado
+        ), tuple(tags)
+
     def toggle_estado(self):
         """Activar/Desactivar producto seleccionado"""
         seleccion = self.tree.selection()
@@ -988,7 +1533,7 @@ class ProductosFrame(ModernBaseFrame):
             if messagebox.askyesno("Confirmar", 
                                  f"¿Está seguro de {accion} el producto '{producto_nombre}'?"):
                 
-                producto = next((p for p in self.app_root.cache_productos if p['id'] == producto_id), None)
+                producto = self.app_root.indice_productos.buscar_id(producto_id)
                 
                 if producto:
                     ProductoRepo.actualizar_completo(
@@ -1000,7 +1545,7 @@ class ProductosFrame(ModernBaseFrame):
                         stock=producto.get('stock'),
                         activo=nuevo_estado 
                     )
-                    self.app_root.refresh_all_caches_and_tabs()
+                    self.app_root.refresh_incremental()
                     
                     estado_text = "activado" if nuevo_estado else "desactivado"
                     messagebox.showinfo("Éxito", f"Producto {estado_text} correctamente")
@@ -1019,7 +1564,7 @@ class ProductosFrame(ModernBaseFrame):
         # --- FIN CORRECCIÓN ---
         self.wait_window(dialog)
         if dialog.resultado:
-            self.app_root.refresh_all_caches_and_tabs()
+            self.app_root.refresh_incremental()
 
     def edit(self):
         """Editar producto seleccionado"""
@@ -1037,7 +1582,7 @@ class ProductosFrame(ModernBaseFrame):
             # --- FIN CORRECCIÓN ---
             self.wait_window(dialog)
             if dialog.resultado:
-                self.app_root.refresh_all_caches_and_tabs()
+                self.app_root.refresh_incremental()
         except Exception as e:
             messagebox.showerror("Error", f"No se pudo abrir el editor:\n{e}")
 
@@ -1066,7 +1611,7 @@ class ProductosFrame(ModernBaseFrame):
             
             if nuevo_precio is not None: 
                 ProductoRepo.actualizar_precio(producto_id, nuevo_precio)
-                self.app_root.refresh_all_caches_and_tabs()
+                self.app_root.refresh_incremental()
                 messagebox.showinfo("Éxito", "Precio actualizado correctamente")
         except Exception as e:
             messagebox.showerror("Error", f"No se pudo actualizar el precio:\n{str(e)}")
@@ -1496,7 +2041,7 @@ class CategoriasFrame(ModernBaseFrame):
         # --- FIN CORRECCIÓN ---
         self.wait_window(dialog)
         if dialog.resultado:
-            self.app_root.refresh_all_caches_and_tabs()
+            self.app_root.refresh_incremental(categorias=True)
 
     def editar_categoria(self):
         """Editar categoría seleccionada"""
@@ -1514,7 +2059,7 @@ class CategoriasFrame(ModernBaseFrame):
             # --- FIN CORRECCIÓN ---
             self.wait_window(dialog)
             if dialog.resultado:
-                self.app_root.refresh_all_caches_and_tabs()
+                self.app_root.refresh_incremental(categorias=True)
         except Exception as e:
             messagebox.showerror("Error", f"No se pudo abrir el editor:\n{e}")
 
@@ -1548,7 +2093,7 @@ class CategoriasFrame(ModernBaseFrame):
             ):
                 CategoriaRepo.eliminar(categoria_id)
                 messagebox.showinfo("Éxito", "✅ Categoría eliminada correctamente")
-                self.app_root.refresh_all_caches_and_tabs()
+                self.app_root.refresh_incremental(categorias=True)
                 
         except Exception as e:
             messagebox.showerror("Error", f"No se pudo eliminar la categoría:\n{str(e)}")
@@ -1569,25 +2114,25 @@ class HistorialVentasFrame(ModernBaseFrame):
             ("forma_pago", "Forma de Pago", 150, "center")
         ]
         
-        self.tree = self.create_modern_treeview(columns)
+        self.tabla = self.create_virtual_treeview(columns, self._formatear_venta)
+        self.tree = self.tabla.tree
     
     def load(self):
         """Carga el historial desde el caché"""
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-            
         try:
-            for idx, v in enumerate(self.app_root.cache_ventas):
-                tags = ['even' if idx % 2 == 0 else 'odd']
-                self.tree.insert("", tk.END, values=(
-                    v["id"],
-                    v["fecha"].strftime("%d/%m/%Y %H:%M"),
-                    f"${v['total']:.2f}",
-                    v["forma_pago"]
-                ), tags=tuple(tags))
+            self.tabla.cargar(self.app_root.cache_ventas)
         except Exception as e:
             messagebox.showerror("Error", f"No se pudo cargar el historial desde el caché:\n{e}")
     
+    @staticmethod
+    def _formatear_venta(v, idx):
+        return (
+            v["id"],
+            v["fecha"].strftime("%d/%m/%Y %H:%M"),
+            f"${v['total']:.2f}",
+            v["forma_pago"]
+        ), ('even' if idx % 2 == 0 else 'odd',)
+
     def generar_reporte(self):
         """Generar reporte (usa datos frescos)"""
         ReportesManager.generar_reporte_ventas_completo(self)
@@ -1673,7 +2218,7 @@ class PuntosVentaFrame(ModernBaseFrame):
                 return
             try:
                 PuntoVentaRepo.agregar(nombre, direccion, telefono)
-                self.app_root.refresh_all_caches_and_tabs()
+                self.app_root.refresh_incremental(puntos_venta=True)
             except Exception as e:
                 messagebox.showerror("Error", f"No se pudo agregar el punto de venta:\n{e}")
     